@@ -0,0 +1,561 @@
+"""In-process stand-ins for Google Sheets, Mastodon, BlueSky and OpenAI.
+
+FakeSheetsClient is a gspread-compatible client backed by in-memory lists,
+with per-call latency and per-minute read/write quotas that fail the way
+the real API does (APIError 429). FakeServices is one local HTTP server
+answering the Mastodon REST API, the atproto XRPC endpoints the BlueSky
+client uses, and OpenAI chat completions. Both count every API call.
+"""
+
+import base64
+import json
+import queue
+import re
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import gspread
+from gspread.utils import a1_range_to_grid_range, rowcol_to_a1
+
+
+class CallCounter:
+    """Thread-safe API call counts by endpoint name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Counter = Counter()
+
+    def add(self, name: str):
+        with self._lock:
+            self.counts[name] += 1
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(sorted(self.counts.items()))
+
+
+# --- Google Sheets ---
+
+class _QuotaResponse:
+    """Enough of a requests.Response for gspread.exceptions.APIError."""
+
+    status_code = 429
+    headers: dict = {}
+    text = "Quota exceeded"
+
+    def json(self):
+        return {"error": {"code": 429, "message": "Quota exceeded for quota metric 'Read requests'",
+                          "status": "RESOURCE_EXHAUSTED"}}
+
+
+class FakeSheetsClient:
+    """gspread.Client stand-in.
+
+    latency is added to every API call, plus cell_latency per cell
+    returned or written, so reading a wide sheet costs more than reading
+    one column. read_quota/write_quota cap calls per rolling minute
+    (0 = unlimited); Google's defaults are 300 per project, 60 per user.
+    """
+
+    def __init__(self, counter: CallCounter, latency: float = 0.0, cell_latency: float = 0.0,
+                 read_quota: int = 0, write_quota: int = 0):
+        self.counter = counter
+        self.latency = latency
+        self.cell_latency = cell_latency
+        self.read_quota = read_quota
+        self.write_quota = write_quota
+        self._calls = {"read": deque(), "write": deque()}
+        self._lock = threading.Lock()
+        self.spreadsheets: dict[str, FakeSpreadsheet] = {}
+
+    def _call(self, kind: str, name: str, cells: int = 0):
+        quota = self.read_quota if kind == "read" else self.write_quota
+        with self._lock:
+            now = time.monotonic()
+            window = self._calls[kind]
+            while window and now - window[0] > 60:
+                window.popleft()
+            if quota and len(window) >= quota:
+                self.counter.add(f"sheets.{kind}.throttled")
+                raise gspread.exceptions.APIError(_QuotaResponse())
+            window.append(now)
+        self.counter.add(f"sheets.{kind}")
+        self.counter.add(f"sheets.{name}")
+        delay = self.latency + cells * self.cell_latency
+        if delay:
+            time.sleep(delay)
+
+    def open_by_key(self, key: str) -> "FakeSpreadsheet":
+        self._call("read", "open_by_key")
+        if key not in self.spreadsheets:
+            self.spreadsheets[key] = FakeSpreadsheet(self, key)
+        return self.spreadsheets[key]
+
+
+class FakeSpreadsheet:
+    def __init__(self, client: FakeSheetsClient, key: str):
+        self.client = client
+        self.id = key
+        self._worksheets: dict[str, FakeWorksheet] = {}
+
+    def worksheet(self, title: str) -> "FakeWorksheet":
+        self.client._call("read", "worksheet")
+        if title not in self._worksheets:
+            raise gspread.WorksheetNotFound(title)
+        return self._worksheets[title]
+
+    def add_worksheet(self, title: str, rows: int = 1000, cols: int = 26, index=None) -> "FakeWorksheet":
+        self.client._call("write", "add_worksheet")
+        ws = FakeWorksheet(self.client, title, rows, cols)
+        ws.spreadsheet = self
+        self._worksheets[title] = ws
+        return ws
+
+    def worksheets(self) -> list["FakeWorksheet"]:
+        self.client._call("read", "worksheets")
+        return list(self._worksheets.values())
+
+    def seed(self, title: str, rows: list[list[str]]) -> "FakeWorksheet":
+        """Create or replace a tab's contents without counting API calls."""
+        ws = self._worksheets.get(title) or FakeWorksheet(self.client, title, 1000, 26)
+        ws.spreadsheet = self
+        ws.data = [list(r) for r in rows]
+        ws.row_count = max(ws.row_count, len(ws.data))
+        self._worksheets[title] = ws
+        return ws
+
+    def batch_update(self, body: dict) -> dict:
+        """Spreadsheet-level batchUpdate; only deleteDimension on rows is supported."""
+        self.client._call("write", "spreadsheet.batch_update", len(body.get("requests", [])))
+        by_id = {ws.id: ws for ws in self._worksheets.values()}
+        for request in body.get("requests", []):
+            target = request["deleteDimension"]["range"]
+            assert target["dimension"] == "ROWS", target
+            del by_id[target["sheetId"]].data[target["startIndex"]:target["endIndex"]]
+        return {"replies": [{} for _ in body.get("requests", [])]}
+
+
+def _trim(row: list[str]) -> list[str]:
+    # The Sheets API drops trailing empty cells
+    end = len(row)
+    while end and row[end - 1] == "":
+        end -= 1
+    return row[:end]
+
+
+class FakeWorksheet:
+    """gspread.Worksheet stand-in holding rows as lists of strings."""
+
+    def __init__(self, client: FakeSheetsClient, title: str, rows: int, cols: int):
+        self.client = client
+        self.title = title
+        self.id = abs(hash(title)) % 100000
+        self.row_count = rows
+        self.col_count = cols
+        self.data: list[list[str]] = []
+        self.spreadsheet: Optional[FakeSpreadsheet] = None
+
+    # reads
+
+    def _grid(self, range_name: str) -> tuple[int, int, int, int]:
+        """0-based [start_row, end_row) x [start_col, end_col) of an A1 range."""
+        if "!" in range_name:
+            range_name = range_name.split("!", 1)[1]
+        grid = a1_range_to_grid_range(range_name)
+        return (grid.get("startRowIndex", 0), grid.get("endRowIndex", max(len(self.data), 1)),
+                grid.get("startColumnIndex", 0), grid.get("endColumnIndex", self.col_count))
+
+    def _slice(self, range_name: str) -> list[list[str]]:
+        r0, r1, c0, c1 = self._grid(range_name)
+        rows = [_trim(row[c0:c1]) for row in self.data[r0:r1]]
+        while rows and not rows[-1]:
+            rows.pop()
+        return rows
+
+    def get_all_values(self, **kwargs) -> list[list[str]]:
+        width = max((len(r) for r in self.data), default=0)
+        rows = [list(r) + [""] * (width - len(r)) for r in self.data]
+        self.client._call("read", "get_all_values", sum(len(r) for r in rows))
+        return rows
+
+    get_values = get_all_values
+
+    def get_all_records(self, **kwargs) -> list[dict]:
+        rows = self.get_all_values()
+        return [dict(zip(rows[0], r)) for r in rows[1:]] if rows else []
+
+    def row_values(self, row: int, **kwargs) -> list[str]:
+        values = _trim(list(self.data[row - 1])) if 0 < row <= len(self.data) else []
+        self.client._call("read", "row_values", len(values))
+        return values
+
+    def col_values(self, col: int, **kwargs) -> list[str]:
+        values = [r[col - 1] if len(r) >= col else "" for r in self.data]
+        values = _trim(values)
+        self.client._call("read", "col_values", len(values))
+        return values
+
+    def get(self, range_name: str = "", **kwargs) -> list[list[str]]:
+        rows = self._slice(range_name) if range_name else [_trim(list(r)) for r in self.data]
+        self.client._call("read", "get", sum(len(r) for r in rows))
+        return rows
+
+    def batch_get(self, ranges: list[str], **kwargs) -> list[list[list[str]]]:
+        out = [self._slice(r) for r in ranges]
+        self.client._call("read", "batch_get", sum(len(r) for rows in out for r in rows))
+        return out
+
+    def cell(self, row: int, col: int, **kwargs):
+        self.client._call("read", "cell", 1)
+        value = self.data[row - 1][col - 1] if row <= len(self.data) and col <= len(self.data[row - 1]) else ""
+        return gspread.Cell(row, col, value)
+
+    # writes
+
+    def _put(self, row: int, col: int, value):
+        while len(self.data) < row:
+            self.data.append([])
+        target = self.data[row - 1]
+        while len(target) < col:
+            target.append("")
+        target[col - 1] = "" if value is None else str(value)
+
+    def _write_block(self, r0: int, c0: int, values: list[list]):
+        for i, row in enumerate(values):
+            for j, value in enumerate(row):
+                self._put(r0 + i + 1, c0 + j + 1, value)
+        self.row_count = max(self.row_count, len(self.data))
+
+    def append_row(self, values: list, **kwargs):
+        self.client._call("write", "append_row", len(values))
+        self.data.append(["" if v is None else str(v) for v in values])
+        self.row_count = max(self.row_count, len(self.data))
+        return self._appended(1, len(values))
+
+    def append_rows(self, values: list[list], **kwargs):
+        self.client._call("write", "append_rows", sum(len(r) for r in values))
+        for row in values:
+            self.data.append(["" if v is None else str(v) for v in row])
+        self.row_count = max(self.row_count, len(self.data))
+        return self._appended(len(values), max((len(r) for r in values), default=1))
+
+    def _appended(self, rows: int, cols: int) -> dict:
+        """The values.append response for rows just added at the bottom."""
+        first = len(self.data) - rows + 1
+        return {"updates": {"updatedRange": f"'{self.title}'!{rowcol_to_a1(first, 1)}:"
+                                            f"{rowcol_to_a1(len(self.data), max(cols, 1))}",
+                            "updatedRows": rows}}
+
+    def update_cell(self, row: int, col: int, value):
+        self.client._call("write", "update_cell", 1)
+        self._put(row, col, value)
+
+    def update(self, range_name=None, values=None, **kwargs):
+        # gspread 6 takes (values, range_name); accept either order
+        if isinstance(range_name, list):
+            range_name, values = values, range_name
+        range_name = range_name or "A1"
+        self.client._call("write", "update", sum(len(r) for r in values))
+        r0, _, c0, _ = self._grid(range_name)
+        self._write_block(r0, c0, values)
+
+    def batch_update(self, data: list[dict], **kwargs):
+        self.client._call("write", "batch_update", sum(len(r) for d in data for r in d["values"]))
+        for d in data:
+            r0, _, c0, _ = self._grid(d["range"])
+            self._write_block(r0, c0, d["values"])
+
+    def update_cells(self, cells: list, **kwargs):
+        self.client._call("write", "update_cells", len(cells))
+        for c in cells:
+            self._put(c.row, c.col, c.value)
+
+    def add_rows(self, rows: int):
+        self.client._call("write", "add_rows")
+        self.row_count += rows
+
+    def delete_rows(self, start_index: int, end_index: Optional[int] = None):
+        self.client._call("write", "delete_rows")
+        end_index = end_index or start_index
+        del self.data[start_index - 1:end_index]
+
+    def clear(self):
+        self.client._call("write", "clear")
+        self.data = []
+
+    def a1(self, row: int, col: int) -> str:
+        return rowcol_to_a1(row, col)
+
+
+# --- Mastodon, BlueSky (XRPC) and OpenAI over HTTP ---
+
+_STATUS_METRICS = {"favourites_count": 3, "reblogs_count": 1, "replies_count": 2}
+_FAKE_CID = "bafyreidfayvfuwqa7qlnopdjiqrxzs6blmoeu4rujcjtnci5beludirz2a"
+
+
+def _jwt(sub: str, lifetime: int = 7200) -> str:
+    """Unsigned JWT carrying the exp claim atproto checks before refreshing."""
+    def part(obj):
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).rstrip(b"=").decode()
+    return ".".join([part({"alg": "HS256", "typ": "JWT"}),
+                     part({"sub": sub, "scope": "com.atproto.access", "exp": int(time.time()) + lifetime}),
+                     "sig"])
+
+
+class FakeServices:
+    """Local Mastodon + XRPC + chat-completions server on a background thread.
+
+    latency is added to every request. Posts are kept in memory so metrics
+    and author-feed lookups see what was published.
+    """
+
+    handle = "bench.bsky.social"
+    did = "did:plc:benchbenchbenchbenchbenc"
+
+    def __init__(self, counter: CallCounter, latency: float = 0.0):
+        self.counter = counter
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self.statuses: dict[str, dict] = {}
+        self.bsky_posts: dict[str, dict] = {}
+        # One queue per open notification stream; None closes it
+        self._streams: list[queue.Queue] = []
+        self.completion = json.dumps({
+            "bluesky": "Benchmark draft for BlueSky #bench",
+            "mastodon": "Benchmark draft for Mastodon, a little longer than the BlueSky one #bench",
+        })
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeServices":
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, status: int, body: dict):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self) -> dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+            def do_GET(self):
+                services._dispatch(self, "GET")
+
+            def do_POST(self):
+                services._dispatch(self, "POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-services", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.drop_streams()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _new_id(self) -> str:
+        with self._lock:
+            n = self._next_id
+            self._next_id += 1
+        return str(n)
+
+    def notify(self, kind: str, status_id: str):
+        """Push a favourite, reblog or mention (a reply to status_id) to open streams."""
+        with self._lock:
+            status = self.statuses.setdefault(status_id, {"id": status_id, "url": "", **_STATUS_METRICS})
+            if kind == "favourite":
+                status["favourites_count"] += 1
+            elif kind == "reblog":
+                status["reblogs_count"] += 1
+            elif kind == "mention":
+                status["replies_count"] += 1
+            if kind == "mention":
+                note = {"type": kind, "status": {"id": self._next_id, "in_reply_to_id": status_id}}
+                self._next_id += 1
+            else:
+                note = {"type": kind, "status": dict(status)}
+            for stream in self._streams:
+                stream.put(json.dumps(note))
+
+    def seed_timelines(self, count: int, start: str = "2025-01-01T00:00:00"):
+        """Add count older posts to both accounts, one hour apart from start."""
+        base = datetime.fromisoformat(start).replace(tzinfo=timezone.utc)
+        with self._lock:
+            for i in range(count):
+                created = (base + timedelta(hours=i)).isoformat().replace("+00:00", "Z")
+                sid = str(self._next_id)
+                self._next_id += 1
+                self.statuses[sid] = {"id": sid, "url": f"https://mastodon.example/@bench/{sid}",
+                                      "content": f"Old post {i}", "in_reply_to_id": None,
+                                      "created_at": created, **_STATUS_METRICS}
+                uri = f"at://{self.did}/app.bsky.feed.post/3old{sid}"
+                self.bsky_posts[uri] = {"text": f"Old post {i}", "createdAt": created}
+
+    def drop_streams(self):
+        """Close every open notification stream, as a restarting server would."""
+        with self._lock:
+            for stream in self._streams:
+                stream.put(None)
+
+    def _stream(self, req):
+        self.counter.add("mastodon.stream")
+        events: queue.Queue = queue.Queue()
+        with self._lock:
+            self._streams.append(events)
+        req.send_response(200)
+        req.send_header("Content-Type", "text/event-stream")
+        req.send_header("Connection", "close")
+        req.end_headers()
+        req.close_connection = True
+        try:
+            while True:
+                try:
+                    data = events.get(timeout=1)
+                except queue.Empty:
+                    req.wfile.write(b":thump\n\n")
+                else:
+                    if data is None:
+                        break
+                    req.wfile.write(f"event: notification\ndata: {data}\n\n".encode())
+                req.wfile.flush()
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._streams.remove(events)
+
+    def _dispatch(self, req, method: str):
+        path, _, query = req.path.partition("?")
+        params = dict(p.split("=", 1) for p in query.split("&") if "=" in p)
+        if self.latency:
+            time.sleep(self.latency)
+        if path == "/api/v1/streaming/user/notification":
+            self._stream(req)
+            return
+        for prefix, handler in (("/api/v1/", self._mastodon), ("/xrpc/", self._xrpc),
+                                ("/v1/", self._openai)):
+            if path.startswith(prefix):
+                name = path[len(prefix):]
+                status, body = handler(method, name, params, req._body() if method == "POST" else {})
+                req._reply(status, body)
+                return
+        req._reply(404, {"error": "not found"})
+
+    # Mastodon
+
+    def _mastodon(self, method, name, params, body):
+        if method == "POST" and name == "statuses":
+            self.counter.add("mastodon.post_status")
+            sid = self._new_id()
+            status = {"id": sid, "url": f"https://mastodon.example/@bench/{sid}",
+                      "content": body.get("status", ""), "in_reply_to_id": body.get("in_reply_to_id"),
+                      "created_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+                      **_STATUS_METRICS}
+            self.statuses[sid] = status
+            return 200, status
+        m = re.fullmatch(r"statuses/(\w+)", name)
+        if method == "GET" and m:
+            self.counter.add("mastodon.get_status")
+            sid = m.group(1)
+            return 200, self.statuses.get(sid) or {"id": sid, "url": "", **_STATUS_METRICS}
+        if name == "instance":
+            return 200, {"uri": "mastodon.example", "urls": {"streaming_api": self.url.replace("http", "ws", 1)}}
+        if name == "accounts/verify_credentials":
+            self.counter.add("mastodon.verify_credentials")
+            return 200, {"id": "1", "username": "bench", "followers_count": 1200, "following_count": 300,
+                         "statuses_count": len(self.statuses)}
+        if method == "GET" and name == "accounts/1/statuses":
+            self.counter.add("mastodon.account_statuses")
+            limit = min(int(params.get("limit", 20)), 40)
+            max_id = int(params.get("max_id", 0)) or None
+            with self._lock:
+                ids = sorted((int(sid) for sid in self.statuses), reverse=True)
+                page = [self.statuses[str(sid)] for sid in ids if max_id is None or sid < max_id][:limit]
+            return 200, page
+        self.counter.add(f"mastodon.unhandled.{name}")
+        return 404, {"error": "Record not found"}
+
+    # atproto XRPC
+
+    def _profile(self) -> dict:
+        return {"did": self.did, "handle": self.handle, "displayName": "Bench"}
+
+    def _post_view(self, uri: str) -> dict:
+        post = self.bsky_posts.get(uri, {"text": "", "createdAt": "2026-01-01T00:00:00Z"})
+        return {
+            "uri": uri, "cid": _FAKE_CID, "author": self._profile(),
+            "record": {"$type": "app.bsky.feed.post", "text": post["text"], "createdAt": post["createdAt"]},
+            "indexedAt": post["createdAt"], "likeCount": 5, "repostCount": 2, "replyCount": 1,
+        }
+
+    def _xrpc(self, method, name, params, body):
+        self.counter.add(f"bluesky.{name}")
+        if name == "com.atproto.server.createSession":
+            return 200, {"accessJwt": _jwt(self.did), "refreshJwt": _jwt(self.did), "handle": self.handle,
+                         "did": self.did}
+        if name == "app.bsky.actor.getProfile":
+            return 200, {**self._profile(), "followersCount": 800, "followsCount": 150,
+                         "postsCount": len(self.bsky_posts)}
+        if name == "com.atproto.repo.createRecord":
+            rkey = f"3bench{self._new_id()}"
+            uri = f"at://{self.did}/app.bsky.feed.post/{rkey}"
+            record = body.get("record", {})
+            self.bsky_posts[uri] = {"text": record.get("text", ""), "createdAt": record.get("createdAt", "")}
+            return 200, {"uri": uri, "cid": _FAKE_CID}
+        if name == "app.bsky.feed.getPostThread":
+            uri = params.get("uri", "").replace("%3A", ":").replace("%2F", "/")
+            return 200, {"thread": {"$type": "app.bsky.feed.defs#threadViewPost", "post": self._post_view(uri)}}
+        if name == "app.bsky.feed.getAuthorFeed":
+            # Newest first; the cursor is the offset of the next page
+            offset = int(params.get("cursor", 0))
+            limit = min(int(params.get("limit", 50)), 100)
+            uris = list(reversed(self.bsky_posts))[offset:offset + limit]
+            more = offset + limit < len(self.bsky_posts)
+            return 200, {"feed": [{"post": self._post_view(u)} for u in uris],
+                         **({"cursor": str(offset + limit)} if more else {})}
+        return 501, {"error": "MethodNotImplemented", "message": name}
+
+    # OpenAI
+
+    def _choice(self, i: int) -> str:
+        # Further choices of an n > 1 request differ in their hashtag
+        return self.completion if i == 0 else self.completion.replace("#bench", f"#bench{i}")
+
+    def _openai(self, method, name, params, body):
+        self.counter.add(f"openai.{name.replace('/', '.')}")
+        if name != "chat/completions":
+            return 404, {"error": {"message": "not found"}}
+        n = int(body.get("n") or 1)
+        return 200, {
+            "id": f"chatcmpl-{self._new_id()}", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model", ""),
+            "choices": [{"index": i, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": self._choice(i)}} for i in range(n)],
+            "usage": {"prompt_tokens": 200, "completion_tokens": 60, "total_tokens": 260},
+        }
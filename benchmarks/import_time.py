@@ -0,0 +1,76 @@
+"""Cold-start check for the MCP server.
+
+Imports server.py in fresh interpreters and times the import plus a first
+sm_get_platform_status call, which needs none of the heavy SDKs. Fails if
+the best of several runs is over budget, or if any SDK that should load on
+first use (openai, gspread, google-auth, atproto, numpy) was imported at startup.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --budget 0.8 --runs 10
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Must not be imported until a tool needs them
+LAZY_MODULES = ("openai", "gspread", "google.oauth2", "google.auth", "atproto", "atproto_client",
+                "platforms.bluesky", "platforms.mastodon", "numpy")
+
+_PROBE = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+import server
+imported = time.perf_counter()
+asyncio.run(server.sm_get_platform_status())
+done = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - start,
+    "first_call_s": done - imported,
+    "loaded": [m for m in LAZY if m in sys.modules],
+}))
+"""
+
+
+def probe() -> dict:
+    with tempfile.TemporaryDirectory(prefix="sm-import-") as data_dir:
+        env = {**os.environ, "SM_DATA_DIR": data_dir, "SM_WARMUP": "0", "PYTHONDONTWRITEBYTECODE": "1"}
+        out = subprocess.run(
+            [sys.executable, "-c", f"LAZY = {LAZY_MODULES!r}\n{_PROBE}"],
+            cwd=ROOT / "src", env=env, capture_output=True, text=True, check=True,
+        )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=float(os.getenv("BENCH_IMPORT_BUDGET", "1.0")),
+                        help="Seconds allowed for import + first call (best of --runs)")
+    args = parser.parse_args()
+
+    results = [probe() for _ in range(args.runs)]
+    best = min(results, key=lambda r: r["import_s"] + r["first_call_s"])
+    total = best["import_s"] + best["first_call_s"]
+    print(f"import server: {1000 * best['import_s']:.0f}ms  first call: {1000 * best['first_call_s']:.0f}ms  "
+          f"total: {1000 * total:.0f}ms (budget {1000 * args.budget:.0f}ms, best of {args.runs})")
+
+    failed = False
+    loaded = sorted({m for r in results for m in r["loaded"]})
+    if loaded:
+        print(f"REGRESSION loaded at startup: {', '.join(loaded)}")
+        failed = True
+    if total > args.budget:
+        print(f"REGRESSION cold start {1000 * total:.0f}ms over budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,699 @@
+"""Offline benchmarks for the MCP tools.
+
+Drives the real tool functions in server.py against the in-process fakes in
+fakes.py, so no accounts or network access are needed. For each scenario
+it reports p50/p99 tool latency, API calls by endpoint and peak Python
+memory (tracemalloc, measured in a separate pass so it doesn't skew the
+timings).
+
+    python benchmarks/run.py                  # run and compare to baseline.json
+    python benchmarks/run.py --save           # record a new baseline
+    python benchmarks/run.py -s list_queue_10k --sheets-latency-ms 50
+
+Exits 1 if any scenario regresses against the baseline: more API calls
+than recorded, or latency/memory beyond the tolerance.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fakes import CallCounter, FakeServices, FakeSheetsClient  # noqa: E402
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+SHEET_ID = "bench-sheet"
+
+
+class Bench:
+    """Fakes shared by every scenario, plus the imported server modules."""
+
+    def __init__(self, args):
+        self.args = args
+        self.counter = CallCounter()
+        self.services = FakeServices(self.counter, latency=args.http_latency_ms / 1000).start()
+        self.data_dir = tempfile.mkdtemp(prefix="sm-bench-")
+        brand_voice = Path(self.data_dir) / "brand_voice.json"
+        shutil.copy(ROOT / "brand_voice.json", brand_voice)
+
+        # config reads the environment at import time
+        os.environ.update({
+            "SM_DATA_DIR": self.data_dir,
+            "BRAND_VOICE_PATH": str(brand_voice),
+            "ORGS_CONFIG_PATH": "",
+            "SM_DEFAULT_ORG": "bench",
+            "CONTENT_QUEUE_SHEET_ID": SHEET_ID,
+            "MASTODON_INSTANCE": self.services.url,
+            "MASTODON_ACCESS_TOKEN": "bench-token",
+            "BLUESKY_HANDLE": FakeServices.handle,
+            "BLUESKY_APP_PASSWORD": "bench-pass",
+            "BLUESKY_SERVICE_URL": self.services.url,
+            "OPENAI_API_KEY": "sk-bench",
+            "OPENAI_BASE_URL": f"{self.services.url}/v1",
+            "JOB_WAIT_SECONDS": "600",
+            "SM_PROMETHEUS_PORT": "0",
+            # Consumers only run when a scenario starts them
+            "SM_MASTODON_STREAMING": "1",
+            "SM_STREAM_FLUSH_SECONDS": "0.05",
+        })
+        import server
+        import sheets
+        import audience
+        import hashtags
+        import similarity
+        from models import AnalyticsRecord, QueueItem
+        self.server = server
+        self.sheets_module = sheets
+        self.similarity_module = similarity
+        self.audience_module = audience
+        self.hashtags_module = hashtags
+        self.queue_header = QueueItem.header_row()
+        self.analytics_header = AnalyticsRecord.header_row()
+        self.sheets = None
+        self.passes = 0
+        # The server's lifespan warms up the SDKs before the first tool call;
+        # do the same so first-call latency doesn't include their imports
+        server._warm_up()
+        # httpx logs every platform request at INFO
+        logging.disable(logging.INFO)
+
+    def reset_sheets(self) -> "FakeSheetsClient":
+        """Fresh fake spreadsheet with empty Queue and Analytics tabs."""
+        self.passes += 1
+        self.sheets = FakeSheetsClient(
+            self.counter,
+            latency=self.args.sheets_latency_ms / 1000,
+            cell_latency=self.args.sheets_cell_latency_us / 1e6,
+            read_quota=self.args.read_quota,
+            write_quota=self.args.write_quota,
+        )
+        self.sheets_module._clients.clear()
+        self.sheets_module._worksheets.clear()
+        self.sheets_module._missing_tabs.clear()
+        self.sheets_module._queue_indexes.clear()
+        self.sheets_module._headers.clear()
+        self.similarity_module._indexes.clear()
+        self.audience_module._series.clear()
+        self.hashtags_module._indexes.clear()
+        self.sheets_module._clients[""] = self.sheets
+        spreadsheet = self.sheets.open_by_key(SHEET_ID)
+        spreadsheet.seed("Queue", [self.queue_header])
+        spreadsheet.seed("Analytics", [self.analytics_header])
+        return self.sheets
+
+    def seed(self, tab: str, rows: list[list[str]]):
+        ws = self.sheets.spreadsheets[SHEET_ID]._worksheets[tab]
+        ws.data.extend(rows)
+        ws.row_count = max(ws.row_count, len(ws.data))
+
+    def queue_row(self, content_id: str, status: str, post_ids: str = "", **drafts) -> list[str]:
+        row = dict.fromkeys(self.queue_header, "")
+        # Unique per pass so the publish ledger never dedupes a rerun
+        row.update(content_id=f"{content_id}-p{self.passes}", topic=f"Topic {content_id}", org="bench", tone="",
+                   status=status, created_at="2026-01-01T00:00:00", post_ids=post_ids, **drafts)
+        return [row[h] for h in self.queue_header]
+
+    def close(self):
+        self.services.stop()
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+
+async def _timed(coro) -> tuple[float, dict]:
+    start = time.perf_counter()
+    result = json.loads(await coro)
+    elapsed = time.perf_counter() - start
+    if not result.get("success"):
+        raise RuntimeError(f"Tool call failed: {result}")
+    return elapsed, result
+
+
+# --- Scenarios ---
+# Each has setup(bench, iterations) -> state and run(bench, state) -> latencies.
+
+class PostTwoPlatforms:
+    """sm_post_now(wait=True) for one queue item to BlueSky and Mastodon."""
+
+    iterations = 20
+
+    def setup(self, bench, iterations):
+        bench.seed("Queue", [
+            bench.queue_row(f"post-{i}", "Approved", bluesky_draft=f"BlueSky post {i} #bench",
+                            mastodon_draft=f"Mastodon post {i} #bench")
+            for i in range(iterations)
+        ])
+        return list(range(2, iterations + 2))
+
+    async def run(self, bench, rows):
+        latencies = []
+        for row in rows:
+            elapsed, _ = await _timed(bench.server.sm_post_now(row, "bluesky,mastodon", wait=True))
+            latencies.append(elapsed)
+        return latencies
+
+
+class CreateContent:
+    """sm_create_content for two platforms (LLM call + queue append)."""
+
+    iterations = 20
+
+    def setup(self, bench, iterations):
+        return iterations
+
+    async def run(self, bench, iterations):
+        latencies = []
+        for i in range(iterations):
+            elapsed, _ = await _timed(bench.server.sm_create_content(f"Benchmark topic {i}", "bluesky,mastodon"))
+            latencies.append(elapsed)
+        return latencies
+
+
+class CreateContentVariants:
+    """sm_create_content(n_variants=4) for two platforms, ranked against 2,000 posted items."""
+
+    iterations = 20
+    posted = 2000
+
+    def setup(self, bench, iterations):
+        rows, analytics = [], []
+        for i in range(self.posted):
+            tag = f"#bench{i % 4}".replace("#bench0", "#bench")
+            post_ids = {"bluesky": f"at://bench/{i}", "mastodon": str(500000 + i)}
+            rows.append(bench.queue_row(f"tagged-{i}", "Posted", json.dumps(post_ids),
+                                        bluesky_draft=f"Earlier post {i} {tag}", mastodon_draft=f"Earlier post {i} {tag}"))
+            # #bench2 posts do three times as well
+            likes = 30 if tag == "#bench2" else 10
+            for plat, pid in post_ids.items():
+                analytics.append([pid, plat, rows[-1][0], "2025-06-01T10:00:00", str(likes), "2", "1", "0",
+                                  "2025-06-02T10:00:00"])
+        bench.seed("Queue", rows)
+        bench.seed("Analytics", analytics)
+        return iterations
+
+    async def run(self, bench, iterations):
+        latencies = []
+        for i in range(iterations):
+            elapsed, result = await _timed(bench.server.sm_create_content(
+                f"Benchmark topic {i}", "bluesky,mastodon", n_variants=4))
+            assert [len(v) for v in result["variants"].values()] == [4, 4], result
+            assert result["drafts"]["bluesky"].endswith("#bench2"), result["variants"]["bluesky"]
+            latencies.append(elapsed)
+        return latencies
+
+
+class RefreshPosts:
+    """sm_refresh_analytics(post_id, wait=True) for 500 posts at once."""
+
+    iterations = 1
+    posts = 500
+
+    def setup(self, bench, iterations):
+        queue, analytics, targets = [], [], []
+        for i in range(self.posts):
+            if i % 2:
+                plat, pid = "mastodon", str(100000 + i)
+            else:
+                plat, pid = "bluesky", f"at://{FakeServices.did}/app.bsky.feed.post/3seed{i}"
+            queue.append(bench.queue_row(f"refresh-{i}", "Posted", json.dumps({plat: pid})))
+            analytics.append([pid, plat, f"refresh-{i}", "2026-01-01T00:00:00", "0", "0", "0", "0", ""])
+            targets.append(pid)
+        bench.seed("Queue", queue)
+        bench.seed("Analytics", analytics)
+        return targets
+
+    async def run(self, bench, targets):
+        timed = await asyncio.gather(*(
+            _timed(bench.server.sm_refresh_analytics(pid, wait=True)) for pid in targets
+        ))
+        return [elapsed for elapsed, _ in timed]
+
+
+class ListQueue10k:
+    """Page through approved items of a 10,000-row queue with sm_list_queue."""
+
+    iterations = 20
+    rows = 10_000
+
+    def setup(self, bench, iterations):
+        statuses = ["Posted"] * 8 + ["Draft", "Approved"]
+        bench.seed("Queue", [
+            bench.queue_row(f"item-{i}", statuses[i % len(statuses)], bluesky_draft=f"Draft {i} " * 10,
+                            mastodon_draft=f"Longer draft {i} " * 15)
+            for i in range(self.rows)
+        ])
+        return iterations
+
+    async def run(self, bench, iterations):
+        latencies = []
+        cursor = ""
+        for _ in range(iterations):
+            elapsed, result = await _timed(bench.server.sm_list_queue("Approved", limit=20, cursor=cursor))
+            assert result["count"] == 20, result["count"]
+            cursor = result["next_cursor"]
+            latencies.append(elapsed)
+        return latencies
+
+
+class Analytics20k:
+    """sm_get_analytics (newest 100 records of the last 7 days) on a 20,000-row analytics tab.
+
+    Posts go out every 10 minutes up to now, so about 1,000 fall in the window.
+    """
+
+    iterations = 20
+    rows = 20_000
+
+    def setup(self, bench, iterations):
+        now = datetime.now()
+        rows = []
+        for i in range(self.rows):
+            posted = now - timedelta(minutes=10 * (self.rows - i))
+            rows.append([str(600000 + i), ("bluesky", "mastodon")[i % 2], f"item-{i}", posted.isoformat(),
+                         str(i % 10), "1", "0", "0", (posted + timedelta(days=1)).isoformat()])
+        bench.seed("Analytics", rows)
+        return iterations
+
+    async def run(self, bench, iterations):
+        latencies = []
+        newest = str(600000 + self.rows - 1)
+        for i in range(iterations):
+            elapsed, result = await _timed(bench.server.sm_get_analytics(("", "mastodon")[i % 2]))
+            assert result["count"] == 100, result["count"]
+            assert result["analytics"][0]["post_id"] == newest, result["analytics"][0]
+            latencies.append(elapsed)
+        return latencies
+
+
+class BulkSchedule:
+    """sm_bulk_approve then sm_bulk_schedule (auto-spaced) for 20 drafts."""
+
+    iterations = 10
+    batch = 20
+
+    def setup(self, bench, iterations):
+        bench.seed("Queue", [
+            bench.queue_row(f"bulk-{i}", "Draft", bluesky_draft=f"Bulk post {i}")
+            for i in range(iterations * self.batch)
+        ])
+        return [list(range(2 + i * self.batch, 2 + (i + 1) * self.batch)) for i in range(iterations)]
+
+    async def run(self, bench, batches):
+        latencies = []
+        for rows in batches:
+            approve, _ = await _timed(bench.server.sm_bulk_approve(rows))
+            schedule, _ = await _timed(bench.server.sm_bulk_schedule(
+                rows, start="2026-02-01T09:00:00", interval_minutes=45,
+            ))
+            latencies.append(approve + schedule)
+        return latencies
+
+
+class ArchiveQueue10k:
+    """sm_archive_queue moving 9,000 old posts of a 10,000-row queue, with their analytics."""
+
+    iterations = 1
+    rows = 10_000
+
+    def setup(self, bench, iterations):
+        queue, analytics = [], []
+        for i in range(self.rows):
+            if i % 10:
+                queue.append(bench.queue_row(f"old-{i}", "Posted", json.dumps({"mastodon": str(200000 + i)}),
+                                             posted_at="2025-01-01T00:00:00"))
+                analytics.append([str(200000 + i), "mastodon", f"old-{i}", "", "1", "0", "0", "0",
+                                  "2025-01-02T00:00:00"])
+            else:
+                queue.append(bench.queue_row(f"draft-{i}", "Draft", bluesky_draft=f"Draft {i}"))
+        bench.seed("Queue", queue)
+        bench.seed("Analytics", analytics)
+        return iterations
+
+    async def run(self, bench, iterations):
+        latencies = []
+        for _ in range(iterations):
+            elapsed, result = await _timed(bench.server.sm_archive_queue(older_than_days=30))
+            assert result["queue_items"] == self.rows * 9 // 10, result
+            latencies.append(elapsed)
+        return latencies
+
+
+class StreamEngagement:
+    """1,000 favourites on 100 posts through the Mastodon stream, until all are in the analytics tab."""
+
+    iterations = 1
+    posts = 100
+    events = 1000
+
+    def setup(self, bench, iterations):
+        bench.seed("Queue", [
+            bench.queue_row(f"stream-{i}", "Posted", json.dumps({"mastodon": str(300000 + i)}))
+            for i in range(self.posts)
+        ])
+        return iterations
+
+    async def run(self, bench, iterations):
+        import streaming
+        analytics = bench.sheets.open_by_key(SHEET_ID)._worksheets["Analytics"]
+        latencies = []
+        streaming.start()
+        try:
+            while bench.counter.snapshot().get("mastodon.stream", 0) < 1 or not analytics.data[1:]:
+                await asyncio.sleep(0.01)
+            for _ in range(iterations):
+                start = time.perf_counter()
+                for i in range(self.events):
+                    bench.services.notify("favourite", str(300000 + i % self.posts))
+                expected = 3 + self.events // self.posts
+                while not all(row[4] == str(expected) for row in analytics.data[1:]):
+                    await asyncio.sleep(0.01)
+                latencies.append(time.perf_counter() - start)
+        finally:
+            await streaming.stop()
+        return latencies
+
+
+class SuggestPostTimes:
+    """sm_suggest_post_times over 5,000 posts of history (the first call builds the matrices)."""
+
+    iterations = 20
+    posts = 5000
+
+    def setup(self, bench, iterations):
+        import timing
+        timing._histories.clear()
+        analytics = []
+        for i in range(self.posts):
+            posted = f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:00"
+            analytics.append([f"hist-{i}", ("bluesky", "mastodon")[i % 2], "", posted,
+                              str(i % 17), str(i % 5), str(i % 3), "0", posted])
+        bench.seed("Analytics", analytics)
+        return iterations
+
+    async def run(self, bench, iterations):
+        latencies = []
+        for _ in range(iterations):
+            elapsed, result = await _timed(bench.server.sm_suggest_post_times(top=10))
+            assert result["posts"] == self.posts, result["posts"]
+            latencies.append(elapsed)
+        return latencies
+
+
+class NearDuplicates20k:
+    """sm_approve for drafts close to one of 20,000 posted items (the first call builds the index)."""
+
+    iterations = 50
+    posted = 20000
+    common = ("the", "and", "to", "of", "a", "in", "for", "is", "on", "with", "at", "our")
+
+    def text(self, rng, vocab, n: int) -> str:
+        return " ".join(rng.choice(self.common) if rng.random() < 0.4 else rng.choice(vocab)
+                        for _ in range(n)) + " #organize"
+
+    def setup(self, bench, iterations):
+        import random
+        rng = random.Random(41)
+        syllables = [c + v for c in "bdfklmnprstv" for v in "aeiou"]
+        vocab = ["".join(rng.choices(syllables, k=rng.randint(1, 4))) for _ in range(3000)]
+        posted = [self.text(rng, vocab, 30) for _ in range(self.posted)]
+        rows = [bench.queue_row(f"old-{i}", "Posted", bluesky_draft=text, mastodon_draft=text + " more at our site")
+                for i, text in enumerate(posted)]
+        # Every other draft repeats an old post with a word swapped
+        for i in range(iterations):
+            if i % 2:
+                text = self.text(rng, vocab, 30)
+            else:
+                words = posted[i * 37].split()
+                words[5] = "neighbours"
+                text = " ".join(words)
+            rows.append(bench.queue_row(f"new-{i}", "Draft", bluesky_draft=text))
+        bench.seed("Queue", rows)
+        return [row[0] for row in rows[self.posted:]]
+
+    async def run(self, bench, content_ids):
+        latencies = []
+        for i, content_id in enumerate(content_ids):
+            elapsed, result = await _timed(bench.server.sm_approve(content_id=content_id))
+            flagged = [m["content_id"] for m in result["near_duplicates"]]
+            assert flagged == ([f"old-{i * 37}-p{bench.passes}"] if i % 2 == 0 else []), (i, flagged)
+            latencies.append(elapsed)
+        return latencies
+
+
+class TimelineBackfill:
+    """sm_sync_timeline(full=True) over 2,000 posts on each of BlueSky and Mastodon."""
+
+    iterations = 1
+    posts = 2000
+
+    def setup(self, bench, iterations):
+        bench.services.statuses.clear()
+        bench.services.bsky_posts.clear()
+        bench.services.seed_timelines(self.posts)
+        return iterations
+
+    async def run(self, bench, iterations):
+        latencies = []
+        for _ in range(iterations):
+            elapsed, result = await _timed(bench.server.sm_sync_timeline(full=True, wait=True))
+            assert [s.get("posts") for s in result["synced"]] == [self.posts, self.posts], result
+            latencies.append(elapsed)
+        return latencies
+
+
+class HashtagPerformance20k:
+    """sm_hashtag_performance over 20,000 posted items on two platforms (the first call builds the index)."""
+
+    iterations = 50
+    posted = 20000
+    tags = 300
+
+    def setup(self, bench, iterations):
+        import random
+        rng = random.Random(44)
+        syllables = [c + v for c in "bdfklmnprstv" for v in "aeiou"]
+        vocab = ["".join(rng.choices(syllables, k=rng.randint(2, 4))) for _ in range(2000)]
+        rows, analytics = [], []
+        for i in range(self.posted):
+            tags = {f"#tag{min(int(rng.paretovariate(1.2)), self.tags)}" for _ in range(rng.randint(1, 3))}
+            text = " ".join(rng.choices(vocab, k=25)) + " " + " ".join(sorted(tags))
+            post_ids = {"bluesky": f"at://bench/{i}", "mastodon": str(500000 + i)}
+            rows.append(bench.queue_row(f"tagged-{i}", "Posted", json.dumps(post_ids),
+                                        bluesky_draft=text, mastodon_draft=text))
+            # #tag7 posts do three times as well
+            boost = 3 if "#tag7" in tags else 1
+            for plat, pid in post_ids.items():
+                analytics.append([pid, plat, rows[-1][0], "2025-06-01T10:00:00",
+                                  str(boost * rng.randint(0, 10)), str(boost * rng.randint(0, 4)),
+                                  str(rng.randint(0, 3)), "0", "2025-06-02T10:00:00"])
+        bench.seed("Queue", rows)
+        bench.seed("Analytics", analytics)
+        return iterations
+
+    async def run(self, bench, iterations):
+        latencies = []
+        for i in range(iterations):
+            kind = ("hashtags", "terms", "all")[i % 3]
+            elapsed, result = await _timed(bench.server.sm_hashtag_performance(kind=kind, min_posts=20))
+            assert result["posts"] == 2 * self.posted, result["posts"]
+            if kind == "hashtags":
+                assert result["tags"][0]["tag"] == "#tag7", result["tags"][:3]
+            latencies.append(elapsed)
+        return latencies
+
+
+class AudienceGrowth:
+    """sm_get_audience_growth over two years of daily snapshots, after one sample of both accounts."""
+
+    iterations = 50
+    days = 730
+
+    def setup(self, bench, iterations):
+        from datetime import date
+        from models import AudienceSnapshot
+        start = date.today() - timedelta(days=self.days)
+        rows = [AudienceSnapshot.header_row()]
+        for i in range(self.days):
+            day = (start + timedelta(days=i)).isoformat()
+            rows.append([day, "bluesky", str(100 + i), "150", str(i), f"{day}T09:00:00"])
+            rows.append([day, "mastodon", str(500 + i), "300", str(2 * i), f"{day}T09:00:00"])
+        bench.sheets.open_by_key(SHEET_ID).seed("Audience", rows)
+        return iterations
+
+    async def run(self, bench, iterations):
+        await bench.audience_module.sample()
+        latencies = []
+        for i in range(iterations):
+            days = (7, 30, 365)[i % 3]
+            elapsed, result = await _timed(bench.server.sm_get_audience_growth(days=days))
+            assert [(g["platform"], g["followers"], g["days"]) for g in result["growth"]] == [
+                ("bluesky", 800, days), ("mastodon", 1200, days)], result
+            latencies.append(elapsed)
+        return latencies
+
+
+SCENARIOS = {
+    "post_two_platforms": PostTwoPlatforms(),
+    "create_content": CreateContent(),
+    "create_content_variants": CreateContentVariants(),
+    "refresh_500_posts": RefreshPosts(),
+    "list_queue_10k": ListQueue10k(),
+    "analytics_20k": Analytics20k(),
+    "bulk_schedule_20": BulkSchedule(),
+    "archive_queue_10k": ArchiveQueue10k(),
+    "stream_1000_events": StreamEngagement(),
+    "suggest_times_5k": SuggestPostTimes(),
+    "near_duplicates_20k": NearDuplicates20k(),
+    "timeline_backfill_2k": TimelineBackfill(),
+    "audience_growth_2y": AudienceGrowth(),
+    "hashtag_performance_20k": HashtagPerformance20k(),
+}
+
+
+# --- Runner ---
+
+def _percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_scenario(bench: Bench, name: str, iterations: int) -> dict:
+    from platforms import close_all
+    scenario = SCENARIOS[name]
+
+    # Every scenario starts with cold platform clients, so its call counts
+    # don't depend on which scenarios ran before it
+    await close_all()
+    bench.reset_sheets()
+    state = scenario.setup(bench, iterations)
+    # Collect what earlier scenarios left behind and keep the survivors out
+    # of later collections, or a full collection over their heap lands in
+    # this scenario's p99
+    gc.collect()
+    gc.freeze()
+    bench.counter.reset()
+    start = time.perf_counter()
+    try:
+        latencies = await scenario.run(bench, state)
+    finally:
+        gc.unfreeze()
+    wall = time.perf_counter() - start
+    calls = bench.counter.snapshot()
+
+    # Memory pass: same work again under tracemalloc
+    await close_all()
+    bench.reset_sheets()
+    state = scenario.setup(bench, iterations)
+    tracemalloc.start()
+    await scenario.run(bench, state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "samples": len(latencies),
+        "p50_ms": round(1000 * _percentile(latencies, 0.5), 2),
+        "p99_ms": round(1000 * _percentile(latencies, 0.99), 2),
+        "mean_ms": round(1000 * statistics.fmean(latencies), 2),
+        "wall_s": round(wall, 3),
+        "peak_kb": round(peak / 1024),
+        "calls": calls,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float, p99_tolerance: float,
+            slack_ms: float) -> list[str]:
+    """Regressions against the baseline, as human-readable lines."""
+    problems = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or base["samples"] != result["samples"]:
+            # Not comparable (new scenario or --iterations override)
+            continue
+        for endpoint, n in result["calls"].items():
+            if n > base["calls"].get(endpoint, 0):
+                problems.append(f"{name}: {endpoint} calls {base['calls'].get(endpoint, 0)} -> {n}")
+        # p99 of a few dozen samples is close to the max, so it gets more room
+        for metric, ratio in (("p50_ms", tolerance), ("p99_ms", p99_tolerance)):
+            limit = base[metric] * ratio + slack_ms
+            if result[metric] > limit:
+                problems.append(f"{name}: {metric} {base[metric]} -> {result[metric]} (limit {limit:.1f})")
+        limit = base["peak_kb"] * tolerance
+        if result["peak_kb"] > limit:
+            problems.append(f"{name}: peak_kb {base['peak_kb']} -> {result['peak_kb']} (limit {limit:.0f})")
+    return problems
+
+
+def _print(name: str, r: dict):
+    calls = ", ".join(f"{k}={v}" for k, v in r["calls"].items()) or "none"
+    print(f"{name:<20} n={r['samples']:<4} p50={r['p50_ms']:>9.2f}ms  p99={r['p99_ms']:>9.2f}ms  "
+          f"wall={r['wall_s']:>7.2f}s  peak={r['peak_kb']:>7}KiB")
+    print(f"{'':<20} calls: {calls}")
+
+
+async def main_async(args) -> dict:
+    bench = Bench(args)
+    results = {}
+    try:
+        bench.server.jobs.start_workers()
+        for name in args.scenario or SCENARIOS:
+            iterations = args.iterations or SCENARIOS[name].iterations
+            results[name] = await run_scenario(bench, name, iterations)
+            _print(name, results[name])
+        await bench.server.jobs.stop_workers(timeout=10)
+        from platforms import close_all
+        await close_all()
+    finally:
+        bench.close()
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run (repeatable; default all)")
+    parser.add_argument("-n", "--iterations", type=int, default=0, help="Override iterations per scenario")
+    parser.add_argument("--sheets-latency-ms", type=float, default=1.0, help="Added to every Sheets call")
+    parser.add_argument("--sheets-cell-latency-us", type=float, default=0.2,
+                        help="Added per cell read or written")
+    parser.add_argument("--http-latency-ms", type=float, default=1.0, help="Added to every platform/LLM request")
+    parser.add_argument("--read-quota", type=int, default=0, help="Sheets reads per minute (0 = unlimited)")
+    parser.add_argument("--write-quota", type=int, default=0, help="Sheets writes per minute (0 = unlimited)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="Write results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=float(os.getenv("BENCH_TOLERANCE", "1.5")),
+                        help="Allowed p50 latency/memory ratio over baseline")
+    parser.add_argument("--p99-tolerance", type=float, default=3.0, help="Allowed p99 latency ratio over baseline")
+    parser.add_argument("--slack-ms", type=float, default=5.0, help="Absolute latency slack over baseline")
+    parser.add_argument("--json", type=Path, help="Also write results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2) + "\n")
+    if args.save:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        return 0
+    problems = compare(results, json.loads(args.baseline.read_text()), args.tolerance, args.p99_tolerance,
+                       args.slack_ms)
+    for line in problems:
+        print(f"REGRESSION {line}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+"""Daily audience counts (followers, following, posts) per account.
+
+While the server runs, each org's live platforms are sampled every
+AUDIENCE_SAMPLE_HOURS into the audience tab: one row per day and platform,
+which later samples that day overwrite. Growth is computed from an
+in-memory copy of that series, loaded from the tab and kept current by the
+samples taken here, so sm_get_audience_growth makes no platform calls.
+"""
+
+import asyncio
+import bisect
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import config
+import jobs
+import sheets
+import telemetry
+from models import LIVE_PLATFORMS, AudienceSnapshot, Tenant
+from platforms import get_platform
+
+
+class _Series:
+    """One org's daily snapshots, per platform in date order."""
+
+    def __init__(self, snapshots: list[AudienceSnapshot]):
+        self.dates: dict[str, list[str]] = {}
+        self.points: dict[str, list[AudienceSnapshot]] = {}
+        self.loaded_at = time.monotonic()
+        for snapshot in snapshots:
+            self.put(snapshot)
+
+    def put(self, snapshot: AudienceSnapshot):
+        dates = self.dates.setdefault(snapshot.platform, [])
+        points = self.points.setdefault(snapshot.platform, [])
+        i = bisect.bisect_left(dates, snapshot.date)
+        if i < len(dates) and dates[i] == snapshot.date:
+            points[i] = snapshot
+        else:
+            dates.insert(i, snapshot.date)
+            points.insert(i, snapshot)
+
+    def since(self, plat: str, start: str) -> list[AudienceSnapshot]:
+        """Snapshots from the last one on or before start onwards (all of them if none is)."""
+        i = bisect.bisect_right(self.dates.get(plat, []), start)
+        return self.points.get(plat, [])[max(i - 1, 0):]
+
+
+_series: dict[str, _Series] = {}
+# Held while a series is read or changed; growth is read from worker threads
+_lock = threading.Lock()
+
+# Seconds after startup before the first check, so sampling stays out of
+# the way of the first requests
+_FIRST_CHECK_DELAY = 60.0
+
+
+def _get_series(org: str) -> _Series:
+    # Reloaded as often as samples are due, to take in other processes' samples
+    ttl = (config.AUDIENCE_SAMPLE_HOURS or 1) * 3600
+    series = _series.get(org)
+    if series is None or time.monotonic() - series.loaded_at > ttl:
+        series = _series[org] = _Series(sheets.get_audience(org=org))
+    return series
+
+
+def _platforms(tenant: Tenant) -> list[str]:
+    return [plat for plat in sorted(p.value for p in LIVE_PLATFORMS)
+            if config.is_platform_configured(plat, tenant) and get_platform(plat, tenant).supports_account_stats]
+
+
+async def sample(org: str = "", platforms: Optional[list[str]] = None) -> dict[str, dict]:
+    """Record the current audience counts of the org's live platforms (or just these).
+
+    Returns platform -> {"followers", "following", "posts"}, or {"error"}
+    for platforms that could not be read.
+    """
+    tenant = config.get_tenant(org)
+    now = datetime.now()
+    results, snapshots = {}, []
+    for plat in platforms or _platforms(tenant):
+        circuit = jobs.breaker(f"{tenant.org}:{plat}")
+        if not circuit.allow():
+            results[plat] = {"error": f"{plat} circuit open"}
+            continue
+        try:
+            with telemetry.timed(f"{plat}.account_stats"):
+                stats = await get_platform(plat, tenant).get_account_stats()
+        except Exception as exc:
+            if jobs.is_transient(exc):
+                circuit.record_failure()
+            results[plat] = {"error": str(exc)}
+            continue
+        circuit.record_success()
+        results[plat] = stats
+        snapshots.append(AudienceSnapshot(date=now.date().isoformat(), platform=plat,
+                                          sampled_at=now.isoformat(timespec="seconds"), **stats))
+    if snapshots:
+        await asyncio.to_thread(sheets.upsert_audience, snapshots, org=tenant.org)
+        series = _series.get(tenant.org)
+        if series is not None:
+            with _lock:
+                for snapshot in snapshots:
+                    series.put(snapshot)
+    return results
+
+
+def _pct(change: float, base: int) -> Optional[float]:
+    return round(change / base * 100, 2) if base else None
+
+
+def growth(org: str = "", platform: str = "", days: int = 30, series: bool = False) -> list[dict]:
+    """Audience change per platform over the last `days` days, from the recorded series.
+
+    Changes run from the last snapshot on or before the window start (or
+    the first one after it) to the latest. Growth rates are percentages of
+    the starting count; the weekly rate is the change per 7 days.
+    """
+    tenant = config.get_tenant(org)
+    data = _get_series(tenant.org)
+    start = (date.today() - timedelta(days=days)).isoformat()
+    with _lock:
+        windows = [(plat, data.since(plat, start))
+                   for plat in ([platform] if platform else sorted(data.points))]
+    results = []
+    for plat, window in windows:
+        if not window:
+            continue
+        first, last = window[0], window[-1]
+        span = (date.fromisoformat(last.date) - date.fromisoformat(first.date)).days
+        change = last.followers - first.followers
+        entry = {
+            "platform": plat,
+            "from": first.date,
+            "to": last.date,
+            "days": span,
+            "followers": last.followers,
+            "following": last.following,
+            "posts": last.posts,
+            "followers_change": change,
+            "following_change": last.following - first.following,
+            "posts_change": last.posts - first.posts,
+            "follower_growth_pct": _pct(change, first.followers),
+            "weekly_follower_growth_pct": _pct(change * 7 / span, first.followers) if span else None,
+            "new_followers_per_day": round(change / span, 2) if span else None,
+            "samples": len(window),
+        }
+        if series:
+            entry["series"] = [{"date": s.date, "followers": s.followers, "following": s.following,
+                                "posts": s.posts} for s in window]
+        results.append(entry)
+    return results
+
+
+class _Sampler:
+    """Sampling loop for one org."""
+
+    def __init__(self, tenant: Tenant):
+        self.tenant = tenant
+        self.state = "starting"
+        self.samples = 0
+        self.last_sampled_at = ""
+        self.last_error = ""
+        self.task: Optional[asyncio.Task] = None
+
+    def _due(self) -> tuple[list[str], float]:
+        """Platforms whose latest sample is AUDIENCE_SAMPLE_HOURS old, and seconds until the next one is."""
+        data = _get_series(self.tenant.org)
+        interval = config.AUDIENCE_SAMPLE_HOURS * 3600
+        due, wait = [], interval
+        for plat in _platforms(self.tenant):
+            points = data.points.get(plat)
+            age = interval
+            if points and points[-1].sampled_at:
+                age = (datetime.now() - datetime.fromisoformat(points[-1].sampled_at)).total_seconds()
+            if age >= interval:
+                due.append(plat)
+            else:
+                wait = min(wait, interval - age)
+        return due, wait
+
+    async def run(self):
+        await asyncio.sleep(_FIRST_CHECK_DELAY)
+        attempt = 0
+        while True:
+            delay = config.AUDIENCE_SAMPLE_HOURS * 3600
+            try:
+                # Reading the series and building the platform clients block
+                due, delay = await asyncio.to_thread(self._due)
+                if due:
+                    self.state = "sampling"
+                    results = await sample(self.tenant.org, due)
+                    self.samples += 1
+                    self.last_sampled_at = datetime.now().isoformat(timespec="seconds")
+                    errors = [f"{plat}: {r['error']}" for plat, r in results.items() if "error" in r]
+                    if errors:
+                        raise RuntimeError("; ".join(errors))
+                attempt = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self.last_error = str(exc)
+                attempt += 1
+                delay = min(delay, jobs.backoff_delay(attempt, jobs.retry_after(exc)))
+            self.state = "waiting"
+            await asyncio.sleep(delay)
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "samples": self.samples,
+            "last_sampled_at": self.last_sampled_at,
+            "last_error": self.last_error,
+        }
+
+
+_samplers: dict[str, _Sampler] = {}
+
+
+def start():
+    """Start sampling every org with a platform that reports audience counts (idempotent)."""
+    if config.AUDIENCE_SAMPLE_HOURS <= 0:
+        return
+    loop = asyncio.get_running_loop()
+    for tenant in config.get_tenants().values():
+        if tenant.org in _samplers or not any(config.is_platform_configured(p.value, tenant)
+                                              for p in LIVE_PLATFORMS):
+            continue
+        sampler = _Sampler(tenant)
+        sampler.task = loop.create_task(sampler.run())
+        _samplers[tenant.org] = sampler
+
+
+async def stop():
+    """Stop the sampling loops."""
+    for sampler in _samplers.values():
+        sampler.task.cancel()
+    await asyncio.gather(*(s.task for s in _samplers.values()), return_exceptions=True)
+    _samplers.clear()
+
+
+def status() -> dict[str, dict]:
+    """State of each org's sampler."""
+    return {org: sampler.status() for org, sampler in _samplers.items()}
@@ -1,13 +1,21 @@
 """Configuration management for social media MCP server."""
 
+import hashlib
 import json
+import logging
 import os
+import tempfile
 from pathlib import Path
+from typing import Optional
+
+from models import BrandVoice, Tenant
 
 
 # Platform credentials from environment
 BLUESKY_HANDLE = os.getenv("BLUESKY_HANDLE", "")
 BLUESKY_APP_PASSWORD = os.getenv("BLUESKY_APP_PASSWORD", "")
+# PDS to log in to (empty = bsky.social)
+BLUESKY_SERVICE_URL = os.getenv("BLUESKY_SERVICE_URL", "")
 
 MASTODON_INSTANCE = os.getenv("MASTODON_INSTANCE", "https://mastodon.social")
 MASTODON_ACCESS_TOKEN = os.getenv("MASTODON_ACCESS_TOKEN", "")
@@ -24,6 +32,8 @@ LINKEDIN_ORG_ID = os.getenv("LINKEDIN_ORG_ID", "")
 # OpenAI for content generation
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
+# OpenAI-compatible endpoint (empty = api.openai.com)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "")
 
 # Google Sheets
 CONTENT_QUEUE_SHEET_ID = os.getenv(
@@ -32,6 +42,13 @@ CONTENT_QUEUE_SHEET_ID = os.getenv(
 )
 QUEUE_TAB = os.getenv("QUEUE_TAB", "Queue")
 ANALYTICS_TAB = os.getenv("ANALYTICS_TAB", "Analytics")
+# Where sm_archive_queue moves old Posted/Failed items and their analytics
+QUEUE_ARCHIVE_TAB = os.getenv("QUEUE_ARCHIVE_TAB", "Queue Archive")
+ANALYTICS_ARCHIVE_TAB = os.getenv("ANALYTICS_ARCHIVE_TAB", "Analytics Archive")
+# Daily follower/following/post counts per platform, for sm_get_audience_growth
+AUDIENCE_TAB = os.getenv("AUDIENCE_TAB", "Audience")
+# Default retention for sm_archive_queue, in days
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
 
 # Brand voice config file
 BRAND_VOICE_PATH = os.getenv(
@@ -39,37 +56,293 @@ BRAND_VOICE_PATH = os.getenv(
     str(Path(__file__).parent.parent / "brand_voice.json")
 )
 
+# Google service account (shared by orgs that don't set their own)
+GOOGLE_CREDENTIALS_PATH = os.getenv("GOOGLE_CREDENTIALS_PATH", "")
+
+# Multi-org config file; without it the env vars above define a single org
+ORGS_CONFIG_PATH = os.getenv("ORGS_CONFIG_PATH", "")
+DEFAULT_ORG = os.getenv("SM_DEFAULT_ORG", "")
+
+# Local state directory (publish ledger, etc.)
+DATA_DIR = os.getenv("SM_DATA_DIR", str(Path(__file__).parent.parent / "data"))
+PUBLISH_LEDGER_PATH = os.getenv(
+    "PUBLISH_LEDGER_PATH",
+    str(Path(DATA_DIR) / "publish_ledger.jsonl")
+)
+
+# Where sm_sync_timeline keeps each org's position in its account timelines
+TIMELINE_STATE_PATH = os.getenv("SM_TIMELINE_STATE_PATH", str(Path(DATA_DIR) / "timeline_sync.json"))
+
+# Background job queue (publishes, metrics refreshes)
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", str(Path(DATA_DIR) / "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "6"))
+JOB_BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", "2"))
+JOB_BACKOFF_CAP = float(os.getenv("JOB_BACKOFF_CAP", "300"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "30"))
+JOB_WAIT_SECONDS = float(os.getenv("JOB_WAIT_SECONDS", "60"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "60"))
+
+# Seconds before the in-memory queue index is rebuilt from the sheet, so
+# edits made outside this server show up in listings
+QUEUE_INDEX_TTL = float(os.getenv("QUEUE_INDEX_TTL", "60"))
+
+# Rows per request when reads that need only the first or last rows of a
+# tab fetch it a range at a time
+SHEETS_READ_CHUNK_ROWS = int(os.getenv("SM_SHEETS_READ_CHUNK_ROWS", "1000"))
+
+# Follow Mastodon favourites, boosts and replies live through the streaming
+# API instead of polling each post. Counts are written to the analytics tab
+# every STREAM_FLUSH_SECONDS and checked against a poll of the most recent
+# STREAM_TRACK_POSTS posts every STREAM_RECONCILE_SECONDS.
+MASTODON_STREAMING = os.getenv("SM_MASTODON_STREAMING", "0").lower() in ("1", "true", "yes")
+STREAM_FLUSH_SECONDS = float(os.getenv("SM_STREAM_FLUSH_SECONDS", "30"))
+STREAM_RECONCILE_SECONDS = float(os.getenv("SM_STREAM_RECONCILE_SECONDS", "900"))
+STREAM_TRACK_POSTS = int(os.getenv("SM_STREAM_TRACK_POSTS", "100"))
+
+# Hours before sm_suggest_post_times rebuilds its engagement history from
+# the sheets; in between it is kept up to date by this server's own
+# publishes and metrics refreshes
+TIMING_REBUILD_HOURS = float(os.getenv("SM_TIMING_REBUILD_HOURS", "24"))
+
+# Hours before sm_hashtag_performance rebuilds its index of posted drafts
+# and their metrics from the sheets; in between it is kept up to date by
+# this server's own publishes and metrics refreshes
+HASHTAG_REBUILD_HOURS = float(os.getenv("SM_HASHTAG_REBUILD_HOURS", "24"))
+
+# Timeline syncs re-read posts younger than this many days, which are still
+# gathering engagement, as well as everything new since the last sync
+TIMELINE_LOOKBACK_DAYS = float(os.getenv("SM_TIMELINE_LOOKBACK_DAYS", "7"))
+
+# Hours between samples of each account's follower, following and post
+# counts into the audience tab (0 = off). Unset, the HTTP daemon samples
+# every DAEMON_AUDIENCE_SAMPLE_HOURS and stdio processes (one per client)
+# not at all. Shortly after startup a sample is taken if the last one is
+# older than this; several a day just update that day's row.
+DAEMON_AUDIENCE_SAMPLE_HOURS = 6.0
+AUDIENCE_SAMPLE_HOURS = float(os.getenv("SM_AUDIENCE_SAMPLE_HOURS") or (
+    DAEMON_AUDIENCE_SAMPLE_HOURS if os.getenv("SM_TRANSPORT", "stdio").lower() == "http" else 0))
+
+# Drafts at least this similar (0-1, estimated Jaccard similarity of their
+# character shingles) to another queue item's are flagged as near-duplicates
+# by sm_create_content, sm_approve and sm_post_now. The index behind it is
+# rebuilt from the sheets every SIMILARITY_REBUILD_HOURS.
+DUPLICATE_THRESHOLD = float(os.getenv("SM_DUPLICATE_THRESHOLD", "0.7"))
+SIMILARITY_REBUILD_HOURS = float(os.getenv("SM_SIMILARITY_REBUILD_HOURS", "24"))
+
+# Transport: "stdio" (one client per process) or "http" (long-running daemon
+# serving many clients at http://HOST:PORT/mcp)
+TRANSPORT = os.getenv("SM_TRANSPORT", "stdio").lower()
+HTTP_HOST = os.getenv("SM_HTTP_HOST", "127.0.0.1")
+HTTP_PORT = int(os.getenv("SM_HTTP_PORT", "8765"))
+# Concurrent requests allowed per HTTP client session
+HTTP_CLIENT_CONCURRENCY = int(os.getenv("SM_CLIENT_CONCURRENCY", "4"))
+# Seconds to let open requests and in-flight jobs finish on shutdown
+DRAIN_SECONDS = float(os.getenv("SM_DRAIN_SECONDS", "30"))
+
+# Import the SDKs configured orgs need on a background thread at startup,
+# so the first tool call doesn't pay for them
+WARMUP = os.getenv("SM_WARMUP", "1").lower() in ("1", "true", "yes")
+
+# Instrumentation: Prometheus /metrics endpoint (0 = off) and OpenTelemetry spans
+PROMETHEUS_PORT = int(os.getenv("SM_PROMETHEUS_PORT", "0"))
+PROMETHEUS_HOST = os.getenv("SM_PROMETHEUS_HOST", "127.0.0.1")
+OTEL_ENABLED = os.getenv("SM_OTEL_ENABLED", "").lower() in ("1", "true", "yes")
+
+
+# Parsed brand voice per file path: (mtime_ns, size) -> (BrandVoice, version)
+_brand_cache: dict[str, tuple[tuple[int, int], BrandVoice, str]] = {}
+
+
+def _voice_version(voice: BrandVoice) -> str:
+    canonical = json.dumps(voice.to_dict(), sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:12]
+
+
+def load_brand_voice(path: str = "") -> BrandVoice:
+    """Load the brand voice, re-parsing only when the file's mtime or size changes.
+
+    A missing file gives the default voice. If the file can't be parsed,
+    the last valid voice loaded from it is kept (and the error logged);
+    with none, ValueError is raised rather than posting in the default voice.
+    """
+    path = path or BRAND_VOICE_PATH
+    try:
+        st = os.stat(path)
+        signature = (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        signature = (0, -1)
+
+    cached = _brand_cache.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
 
-def get_brand_voice() -> dict:
-    """Load brand voice from JSON file."""
     try:
-        with open(BRAND_VOICE_PATH, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {
-            "org_name": "Coalition",
-            "tone": "Professional but approachable",
-            "values": ["transparency", "community", "ethics"],
-            "avoid": ["corporate jargon", "fear-based messaging"],
-            "audience": "Community members, advocates, and allies",
-            "hashtags": {}
-        }
-
-
-def save_brand_voice(voice: dict):
-    """Save brand voice to JSON file."""
-    with open(BRAND_VOICE_PATH, "w") as f:
-        json.dump(voice, f, indent=2)
-
-
-def is_platform_configured(platform: str) -> bool:
+        with open(path, "r") as f:
+            voice = BrandVoice.from_dict(json.load(f))
+    except FileNotFoundError:
+        voice = BrandVoice()
+    except ValueError as e:  # includes json.JSONDecodeError
+        if not cached:
+            raise ValueError(f"Invalid brand voice file {path}: {e}") from e
+        logging.getLogger(__name__).error("Invalid brand voice file %s, keeping the last valid one: %s", path, e)
+        _brand_cache[path] = (signature, cached[1], cached[2])
+        return cached[1]
+    _brand_cache[path] = (signature, voice, _voice_version(voice))
+    return voice
+
+
+def brand_voice_version(path: str = "") -> str:
+    """Short content hash of the current brand voice, for keying downstream caches."""
+    path = path or BRAND_VOICE_PATH
+    load_brand_voice(path)
+    return _brand_cache[path][2]
+
+
+def get_brand_voice(path: str = "") -> dict:
+    """Load brand voice as a plain dict."""
+    return load_brand_voice(path).to_dict()
+
+
+def save_brand_voice(voice: dict, path: str = ""):
+    """Validate and atomically save brand voice to the JSON file."""
+    parsed = BrandVoice.from_dict(voice)
+    key = path or BRAND_VOICE_PATH
+    path = Path(key)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(parsed.to_dict(), f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates 0600; keep the existing file's permissions
+        mode = os.stat(path).st_mode & 0o777 if path.exists() else 0o644
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    _brand_cache.pop(key, None)
+
+
+# --- Tenancy ---
+
+_tenants: Optional[dict[str, Tenant]] = None
+_default_org = ""
+
+
+def _slug(name: str) -> str:
+    return "-".join(name.lower().split())
+
+
+def _env_tenant() -> Tenant:
+    """The single org defined by the environment variables.
+
+    Its ID keys the publish ledger, sync state and jobs, so it is fixed
+    (SM_DEFAULT_ORG or "default") rather than taken from the editable brand
+    name, which is only used for display and lookup.
+    """
+    org = DEFAULT_ORG or "default"
+    return Tenant(
+        org=org,
+        brand_voice_path=BRAND_VOICE_PATH,
+        sheet_id=CONTENT_QUEUE_SHEET_ID,
+        queue_tab=QUEUE_TAB,
+        analytics_tab=ANALYTICS_TAB,
+        queue_archive_tab=QUEUE_ARCHIVE_TAB,
+        analytics_archive_tab=ANALYTICS_ARCHIVE_TAB,
+        audience_tab=AUDIENCE_TAB,
+        google_credentials_path=GOOGLE_CREDENTIALS_PATH,
+        bluesky_handle=BLUESKY_HANDLE,
+        bluesky_app_password=BLUESKY_APP_PASSWORD,
+        bluesky_service_url=BLUESKY_SERVICE_URL,
+        mastodon_instance=MASTODON_INSTANCE,
+        mastodon_access_token=MASTODON_ACCESS_TOKEN,
+        facebook_access_token=FACEBOOK_ACCESS_TOKEN,
+        facebook_page_id=FACEBOOK_PAGE_ID,
+        instagram_access_token=INSTAGRAM_ACCESS_TOKEN,
+        instagram_account_id=INSTAGRAM_ACCOUNT_ID,
+        linkedin_access_token=LINKEDIN_ACCESS_TOKEN,
+        linkedin_org_id=LINKEDIN_ORG_ID,
+        openai_api_key=OPENAI_API_KEY,
+        openai_model=OPENAI_MODEL,
+        openai_base_url=OPENAI_BASE_URL,
+    )
+
+
+def _load_orgs_file(path: str) -> tuple[dict[str, Tenant], str]:
+    """Parse the orgs file. String values may reference env vars as ${NAME}."""
+    with open(path, "r") as f:
+        data = json.load(f)
+    base = Path(path).parent
+    fields = set(Tenant.__dataclass_fields__) - {"org"}
+    tenants = {}
+    for org, spec in data.get("orgs", {}).items():
+        unknown = set(spec) - fields
+        if unknown:
+            raise ValueError(f"Unknown settings for org '{org}': {sorted(unknown)}")
+        spec = {k: os.path.expandvars(v) if isinstance(v, str) else v for k, v in spec.items()}
+        # Operator-level settings are shared unless an org overrides them
+        spec.setdefault("openai_api_key", OPENAI_API_KEY)
+        spec.setdefault("openai_model", OPENAI_MODEL)
+        spec.setdefault("openai_base_url", OPENAI_BASE_URL)
+        spec.setdefault("google_credentials_path", GOOGLE_CREDENTIALS_PATH)
+        spec.setdefault("sheet_id", CONTENT_QUEUE_SHEET_ID)
+        spec.setdefault("brand_voice_path", str(base / f"brand_voice.{org}.json"))
+        spec["brand_voice_path"] = str(base / spec["brand_voice_path"])
+        tenants[org] = Tenant(org=org, **spec)
+    if not tenants:
+        raise ValueError(f"No orgs defined in {path}")
+    default = data.get("default", "") or DEFAULT_ORG or next(iter(tenants))
+    if default not in tenants:
+        raise ValueError(f"Default org '{default}' is not defined in {path}")
+    return tenants, default
+
+
+def get_tenants() -> dict[str, Tenant]:
+    """All configured orgs, keyed by org ID."""
+    global _tenants, _default_org
+    if _tenants is None:
+        if ORGS_CONFIG_PATH:
+            _tenants, _default_org = _load_orgs_file(ORGS_CONFIG_PATH)
+        else:
+            tenant = _env_tenant()
+            _tenants, _default_org = {tenant.org: tenant}, tenant.org
+    return _tenants
+
+
+def get_tenant(org: str = "") -> Tenant:
+    """Resolve an org argument (ID or brand name, case-insensitive) to its tenant.
+
+    Empty selects the default org. Raises ValueError for unknown orgs.
+    """
+    tenants = get_tenants()
+    if not org:
+        return tenants[_default_org]
+    wanted = _slug(org)
+    for tenant in tenants.values():
+        if _slug(tenant.org) == wanted:
+            return tenant
+    for tenant in tenants.values():
+        try:
+            name = load_brand_voice(tenant.brand_voice_path).org_name
+        except ValueError:
+            continue
+        if _slug(name) == wanted:
+            return tenant
+    raise ValueError(f"Unknown org: {org}. Available: {sorted(tenants)}")
+
+
+def is_platform_configured(platform: str, tenant: Optional[Tenant] = None) -> bool:
     """Check if a platform has credentials configured."""
+    t = tenant or get_tenant()
     checks = {
-        "bluesky": bool(BLUESKY_HANDLE and BLUESKY_APP_PASSWORD),
-        "mastodon": bool(MASTODON_ACCESS_TOKEN),
-        "facebook": bool(FACEBOOK_ACCESS_TOKEN and FACEBOOK_PAGE_ID),
-        "instagram": bool(INSTAGRAM_ACCESS_TOKEN and INSTAGRAM_ACCOUNT_ID),
-        "linkedin": bool(LINKEDIN_ACCESS_TOKEN),
+        "bluesky": bool(t.bluesky_handle and t.bluesky_app_password),
+        "mastodon": bool(t.mastodon_access_token),
+        "facebook": bool(t.facebook_access_token and t.facebook_page_id),
+        "instagram": bool(t.instagram_access_token and t.instagram_account_id),
+        "linkedin": bool(t.linkedin_access_token),
         "twitter": False,  # Stub only
     }
     return checks.get(platform, False)
@@ -1,10 +1,57 @@
-"""AI content generation using OpenAI."""
+"""AI content generation using OpenAI.
+
+The openai SDK is imported on first use; it is the slowest import in the
+server and most tool calls never need it.
+"""
 
 import json
-from openai import AsyncOpenAI
+from typing import TYPE_CHECKING, Optional
 
 import config
-from models import Platform, PLATFORM_LIMITS
+import telemetry
+from models import Platform, PLATFORM_LIMITS, Tenant
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+
+# One client (and connection pool) per org
+_clients: dict[str, "AsyncOpenAI"] = {}
+
+
+def _get_client(tenant: Tenant) -> "AsyncOpenAI":
+    if tenant.org not in _clients:
+        from openai import AsyncOpenAI
+        _clients[tenant.org] = AsyncOpenAI(api_key=tenant.openai_api_key,
+                                           base_url=tenant.openai_base_url or None)
+    return _clients[tenant.org]
+
+
+def _parse(content: str) -> dict:
+    content = content.strip()
+    # Strip markdown code fences if present
+    if content.startswith("```"):
+        lines = content.split("\n")
+        content = "\n".join(lines[1:-1] if lines[-1].strip() == "```" else lines[1:])
+    return json.loads(content)
+
+
+def _drafts(content: Optional[str]) -> dict[str, list[str]]:
+    """A choice's drafts as platform -> texts.
+
+    Raises ValueError unless the choice is a JSON object whose values are
+    draft text (or lists of drafts).
+    """
+    data = _parse(content or "")
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object of drafts, got {type(data).__name__}")
+    drafts = {}
+    for plat, value in data.items():
+        texts = [value] if isinstance(value, str) else value
+        if not isinstance(texts, list) or not texts or not all(isinstance(t, str) for t in texts):
+            raise ValueError(f"Draft for {plat} is not text")
+        drafts[plat] = texts
+    return drafts
 
 
 async def generate_content(
@@ -12,17 +59,42 @@ async def generate_content(
     platforms: list[str],
     tone: str = "",
     org: str = "",
+    top_hashtags: Optional[dict[str, list[str]]] = None,
 ) -> dict[str, str]:
-    """Generate platform-specific content drafts.
+    """Generate platform-specific content drafts in an org's brand voice.
+
+    top_hashtags (platform -> hashtags) are offered to the model as ones
+    that have earned above-average engagement, to use where relevant.
 
     Returns: {"bluesky": "draft text", "mastodon": "draft text", ...}
     """
-    brand = config.get_brand_voice()
-    org_name = org or brand.get("org_name", "our organization")
-    voice_tone = tone or brand.get("tone", "professional but approachable")
-    values = ", ".join(brand.get("values", []))
-    avoid = ", ".join(brand.get("avoid", []))
-    audience = brand.get("audience", "general public")
+    variants = await generate_variants(topic, platforms, tone, org, top_hashtags)
+    return {plat: texts[0] for plat, texts in variants.items()}
+
+
+async def generate_variants(
+    topic: str,
+    platforms: list[str],
+    tone: str = "",
+    org: str = "",
+    top_hashtags: Optional[dict[str, list[str]]] = None,
+    n: int = 1,
+) -> dict[str, list[str]]:
+    """Generate up to n alternative drafts per platform in one completion request.
+
+    The n candidates are the request's n choices. Choices that aren't a
+    JSON object of drafts are dropped (ValueError is raised only if none
+    is), as are repeated drafts.
+
+    Returns: {"bluesky": ["draft text", ...], "mastodon": [...], ...}
+    """
+    tenant = config.get_tenant(org)
+    brand = config.load_brand_voice(tenant.brand_voice_path)
+    org_name = brand.org_name or "our organization"
+    voice_tone = tone or brand.tone or "professional but approachable"
+    values = ", ".join(brand.values)
+    avoid = ", ".join(brand.avoid)
+    audience = brand.audience or "general public"
 
     platform_specs = []
     for p in platforms:
@@ -56,22 +128,37 @@ No markdown, no code fences, just the JSON object."""
 Platforms: {', '.join(platforms)}
 Platform limits:
 {chr(10).join(platform_specs)}"""
+    proven = [f"- {p}: {' '.join(tags)}" for p, tags in (top_hashtags or {}).items() if tags]
+    if proven:
+        user_prompt += f"""
+Hashtags that have earned above-average engagement for us (use only where they fit the topic):
+{chr(10).join(proven)}"""
 
-    client = AsyncOpenAI(api_key=config.OPENAI_API_KEY)
-    response = await client.chat.completions.create(
-        model=config.OPENAI_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.7,
-    )
+    client = _get_client(tenant)
+    with telemetry.timed("llm.generate"):
+        response = await client.chat.completions.create(
+            model=tenant.openai_model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            # Alternatives need more spread than a single draft
+            temperature=0.7 if n == 1 else 0.9,
+            n=n,
+        )
 
-    content = response.choices[0].message.content.strip()
-
-    # Strip markdown code fences if present
-    if content.startswith("```"):
-        lines = content.split("\n")
-        content = "\n".join(lines[1:-1] if lines[-1].strip() == "```" else lines[1:])
-
-    return json.loads(content)
+    variants: dict[str, list[str]] = {}
+    parsed = 0
+    for i, choice in enumerate(response.choices):
+        try:
+            drafts = _drafts(choice.message.content)
+        except ValueError:
+            if i == len(response.choices) - 1 and not parsed:
+                raise
+            continue
+        parsed += 1
+        for plat, texts in drafts.items():
+            for text in texts:
+                if text not in variants.setdefault(plat, []):
+                    variants[plat].append(text)
+    return variants
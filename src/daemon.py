@@ -0,0 +1,84 @@
+"""Long-running streamable-HTTP mode.
+
+Over stdio each MCP client spawns its own server process. In daemon mode a
+single process serves every client over streamable HTTP, so they share one
+set of logged-in platform clients, Sheets handles, caches and job workers.
+Process-wide resources are started once for the HTTP app rather than per
+MCP session, and each client is limited to a fixed number of concurrent
+requests so one busy session can't starve the others.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncContextManager, Callable
+
+import config
+
+
+class ClientConcurrencyLimit:
+    """ASGI middleware capping in-flight MCP requests per client.
+
+    Clients are told apart by their Mcp-Session-Id header, falling back to
+    the peer address before a session exists. Requests over the cap wait
+    for a slot. Only POSTs (JSON-RPC calls) count; a client's long-lived GET
+    event stream does not.
+    """
+
+    def __init__(self, app, limit: int):
+        self.app = app
+        self.limit = limit
+        # client -> [semaphore, requests holding or waiting for it]
+        self._slots: dict[str, list] = {}
+
+    def _client(self, scope) -> str:
+        for name, value in scope.get("headers", []):
+            if name == b"mcp-session-id":
+                return value.decode("latin-1")
+        client = scope.get("client")
+        return client[0] if client else ""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        key = self._client(scope)
+        slot = self._slots.setdefault(key, [asyncio.Semaphore(self.limit), 0])
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                await self.app(scope, receive, send)
+        finally:
+            slot[1] -= 1
+            if not slot[1]:
+                del self._slots[key]
+
+
+def serve(mcp, resources: Callable[[], AsyncContextManager]):
+    """Serve mcp's tools over streamable HTTP until interrupted.
+
+    resources() is entered once around the whole app. On SIGINT/SIGTERM new
+    connections are refused, open requests get SM_DRAIN_SECONDS to finish,
+    then the MCP sessions close and resources() exits, which lets in-flight
+    publish jobs finish.
+    """
+    import uvicorn
+
+    app = mcp.streamable_http_app()
+    sessions = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app):
+        async with resources():
+            async with sessions(app):
+                yield
+
+    app.router.lifespan_context = lifespan
+    app.add_middleware(ClientConcurrencyLimit, limit=config.HTTP_CLIENT_CONCURRENCY)
+
+    uvicorn.run(
+        app,
+        host=mcp.settings.host,
+        port=mcp.settings.port,
+        log_level="warning",
+        timeout_graceful_shutdown=config.DRAIN_SECONDS,
+    )
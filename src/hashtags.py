@@ -0,0 +1,309 @@
+"""Engagement per hashtag and term, from an inverted index of published posts.
+
+Each post published from the queue is split into its hashtags and terms
+(other words, less stopwords). The index maps every one of them to the
+posts using it and keeps, per platform, running sums of those posts'
+latest metrics. The sums are updated in place as posts are published and
+their metrics refreshed, so per-tag counts and means never rescan the
+sheets. The index is built from the queue and analytics tabs, live and
+archived, on first use and rebuilt after HASHTAG_REBUILD_HOURS to pick up
+metrics collected outside this server. Tools call in from worker threads,
+so the index is only read or changed under _lock; building it from the
+sheets happens outside it.
+
+Posts harvested only from the account timelines are not indexed, as
+their text is not kept.
+"""
+
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import TYPE_CHECKING, Optional
+
+import config
+import sheets
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+METRICS = ("likes", "reposts", "replies", "impressions")
+
+# Each tag is blended with this many imaginary posts at the platform
+# average, so one lucky post doesn't put a tag at the top
+PRIOR_POSTS = 3.0
+
+_LINK = re.compile(r"https?://\S+")
+_TOKEN = re.compile(r"[#@]?[^\W\d_][\w'’-]*")
+_STOPWORDS = frozenset("""
+    about after again all also and any are because been before being but can could did does doing
+    for from further had has have having her here hers him his how into its just more most not now
+    off once only other our ours out over own same she should some such than that the their theirs
+    them then there these they this those through too under until very was were what when where which
+    while who whom why will with would you your yours
+""".split())
+
+
+def terms_of(text: str) -> tuple[str, ...]:
+    """Distinct hashtags (as "#tag") and terms of a post, lowercased.
+
+    Mentions, links, numbers, stopwords and words under three letters are left out.
+    """
+    found = {}
+    for token in _TOKEN.findall(_LINK.sub(" ", text.lower())):
+        token = token.strip("'’-")
+        if token.startswith("#"):
+            if len(token) > 1:
+                found[token] = None
+        elif not token.startswith("@") and len(token) >= 3 and token not in _STOPWORDS:
+            found[token] = None
+    return tuple(found)
+
+
+def _values(metrics: dict) -> tuple[float, ...]:
+    values = []
+    for name in METRICS:
+        try:
+            values.append(float(metrics.get(name) or 0))
+        except (TypeError, ValueError):
+            values.append(0.0)
+    return tuple(values)
+
+
+class _Index:
+    """Posts by term, and per term and platform the post count and metric sums of measured posts.
+
+    Sums are rows of one array (term x platform x [posts, likes, reposts,
+    replies, impressions]), so a query ranks every term in a few steps.
+    """
+
+    def __init__(self):
+        import numpy as np
+        self.terms: dict[str, int] = {}
+        self.names: list[str] = []
+        self.platforms: dict[str, int] = {}
+        self.sums = np.zeros((256, 2, 1 + len(METRICS)))
+        # The same per platform, over every measured post
+        self.totals = np.zeros((2, 1 + len(METRICS)))
+        self.is_hashtag = np.zeros(256, dtype=bool)
+        # post_id -> (platform, content_id, term rows, metric values); values are None until measured
+        self.posts: dict[str, tuple[str, str, tuple[int, ...], Optional[tuple[float, ...]]]] = {}
+        # term row -> post IDs using it
+        self.postings: defaultdict[int, list[str]] = defaultdict(list)
+        self.built_at = time.monotonic()
+
+    def _rows(self, terms: tuple[str, ...]) -> tuple[int, ...]:
+        import numpy as np
+        for term in terms:
+            if term not in self.terms:
+                if len(self.names) == len(self.sums):
+                    self.sums = np.concatenate([self.sums, np.zeros_like(self.sums)])
+                    self.is_hashtag = np.concatenate([self.is_hashtag, np.zeros_like(self.is_hashtag)])
+                self.terms[term] = len(self.names)
+                self.is_hashtag[len(self.names)] = term.startswith("#")
+                self.names.append(term)
+        return tuple(self.terms[term] for term in terms)
+
+    def _column(self, plat: str) -> int:
+        import numpy as np
+        if plat not in self.platforms:
+            if len(self.platforms) == self.sums.shape[1]:
+                self.sums = np.concatenate([self.sums, np.zeros_like(self.sums)], axis=1)
+                self.totals = np.concatenate([self.totals, np.zeros_like(self.totals)])
+            self.platforms[plat] = len(self.platforms)
+        return self.platforms[plat]
+
+    def load(self, posts: list[tuple[str, str, str, str, Optional[tuple[float, ...]]]]):
+        """Index (post_id, platform, content_id, text, metric values or None) posts in bulk."""
+        import numpy as np
+
+        parsed: dict[str, tuple[int, ...]] = {}
+        flat_rows, flat_posts, values, columns = [], [], [], []
+        for post_id, plat, content_id, text, metrics in posts:
+            if post_id in self.posts:
+                continue
+            rows = parsed.get(text)
+            if rows is None:
+                rows = parsed[text] = self._rows(terms_of(text))
+            column = self._column(plat)
+            self.posts[post_id] = (plat, content_id, rows, metrics)
+            for row in rows:
+                self.postings[row].append(post_id)
+            if metrics is not None:
+                flat_rows.extend(rows)
+                flat_posts.extend([len(values)] * len(rows))
+                values.append((1.0, *metrics))
+                columns.append(column)
+        if not values:
+            return
+        values = np.array(values)
+        columns = np.array(columns)
+        posts_of = np.array(flat_posts, dtype=np.int64)
+        np.add.at(self.sums, (np.array(flat_rows, dtype=np.int64), columns[posts_of]), values[posts_of])
+        np.add.at(self.totals, columns, values)
+
+    def measured(self, post_id: str, metrics: dict):
+        if post_id not in self.posts:
+            return
+        plat, content_id, rows, old = self.posts[post_id]
+        values = _values(metrics)
+        change = [0.0 if old is not None else 1.0] + [v - (old[i] if old is not None else 0.0)
+                                                      for i, v in enumerate(values)]
+        column = self._column(plat)
+        self.sums[list(rows), column] += change
+        self.totals[column] += change
+        self.posts[post_id] = (plat, content_id, rows, values)
+
+    def columns(self, platform: str = "") -> list[int]:
+        """Columns of one platform (none if it has no posts), or of every platform."""
+        if platform:
+            return [self.platforms[platform]] if platform in self.platforms else []
+        return list(self.platforms.values())
+
+    def lift(self, rows: "np.ndarray", columns: list[int]) -> tuple["np.ndarray", "np.ndarray"]:
+        """Sums of the given term rows (-1 = unknown term) over columns, and each term's lift.
+
+        lift is the engagement of the term's posts relative to an average
+        post on the same platform, blended with PRIOR_POSTS average posts.
+        """
+        import numpy as np
+
+        totals = self.totals[columns]
+        # Average engagement (likes + reposts + replies) per post on each platform
+        means = totals[:, 1:4].sum(axis=1) / np.maximum(totals[:, 0], 1)
+        means[means == 0] = 1.0
+        sums = self.sums[np.maximum(rows, 0)][:, columns]
+        sums[rows < 0] = 0
+        relative = (sums[:, :, 1:4].sum(axis=2) / means).sum(axis=1)
+        return sums, (relative + PRIOR_POSTS) / (sums[:, :, 0].sum(axis=1) + PRIOR_POSTS)
+
+    def best_post(self, row: int, plat: str) -> Optional[dict]:
+        best = None
+        for post_id in self.postings.get(row, ()):
+            post_plat, content_id, _, values = self.posts[post_id]
+            if values is None or (plat and post_plat != plat):
+                continue
+            engagement = values[0] + values[1] + values[2]
+            if best is None or engagement > best["engagement"]:
+                best = {"post_id": post_id, "platform": post_plat, "content_id": content_id,
+                        "engagement": engagement}
+        return best
+
+
+_indexes: dict[str, _Index] = {}
+_lock = threading.Lock()
+
+
+def _build(org: str) -> _Index:
+    index = _Index()
+    index.load([
+        (post["post_id"], post["platform"], post["content_id"], post["text"],
+         _values(post) if any(name in post for name in METRICS) else None)
+        for post in sheets.get_posted_texts(org=org)
+    ])
+    return index
+
+
+def _index(org: str) -> _Index:
+    tenant = config.get_tenant(org)
+    index = _indexes.get(tenant.org)
+    if index is None or time.monotonic() - index.built_at > config.HASHTAG_REBUILD_HOURS * 3600:
+        index = _indexes[tenant.org] = _build(tenant.org)
+    return index
+
+
+def record_posted(org: str, plat: str, post_id: str, text: str, content_id: str = ""):
+    """Index a newly published post, counted once its metrics arrive."""
+    index = _indexes.get(config.get_tenant(org).org)
+    if index is not None:
+        with _lock:
+            index.load([(post_id, plat, content_id, text, None)])
+
+
+def record_metrics(org: str, post_id: str, metrics: dict):
+    """Update an indexed post's contribution after its metrics were refreshed."""
+    index = _indexes.get(config.get_tenant(org).org)
+    if index is not None:
+        with _lock:
+            index.measured(post_id, metrics)
+
+
+def performance(org: str = "", platform: str = "", kind: str = "hashtags", tags: tuple[str, ...] = (),
+                min_posts: int = 1, top: int = 20) -> dict:
+    """Reach and engagement per hashtag or term, best first.
+
+    kind is "hashtags", "terms" or "all"; tags, when given, selects those
+    entries instead (hashtags with their "#"). Means are per measured post.
+    lift compares a tag's posts with the average post on the same platform
+    (1.0 = average), blended with PRIOR_POSTS average posts.
+    Returns {"posts": measured posts considered, "tags": [...]}.
+    """
+    import numpy as np
+
+    if kind not in ("hashtags", "terms", "all"):
+        raise ValueError(f"Unknown kind: {kind}. Use hashtags, terms or all")
+    index = _index(org)
+    with _lock:
+        columns = index.columns(platform)
+
+        if tags:
+            wanted = [t.strip().lower() for t in tags if t.strip()]
+            rows = np.array([index.terms.get(t, -1) for t in wanted], dtype=np.int64)
+        else:
+            rows = np.arange(len(index.names))
+            if kind != "all":
+                rows = rows[index.is_hashtag[rows] == (kind == "hashtags")]
+        sums, lift = index.lift(rows, columns)
+        count = sums[:, :, 0].sum(axis=1)
+        metrics = sums[:, :, 1:].sum(axis=1)
+        engagement = metrics[:, :3].sum(axis=1)
+
+        if tags:
+            order = np.arange(len(rows))
+        else:
+            keep = np.flatnonzero(count >= max(min_posts, 1))
+            order = keep[np.lexsort((-count[keep], -lift[keep]))][:top]
+        names = [index.names[r] for r in rows[order]] if not tags else wanted
+        results = []
+        for name, i in zip(names, order.tolist()):
+            n = count[i]
+            row = int(rows[i])
+            best = [b for b in (index.best_post(row, plat) for plat in ([platform] if platform else [""]))
+                    if b] if row >= 0 else []
+            results.append({
+                "tag": name,
+                "posts": int(round(n)),
+                **{f"mean_{m}": round(float(metrics[i, j] / n), 2) if n else None
+                   for j, m in enumerate(METRICS)},
+                "mean_engagement": round(float(engagement[i] / n), 2) if n else None,
+                "engagement_rate": round(float(engagement[i] / metrics[i, 3]), 4) if metrics[i, 3] else None,
+                "lift": round(float(lift[i]), 3),
+                "best_post": best[0] if best else None,
+            })
+        return {"posts": int(round(index.totals[columns, 0].sum())), "tags": results}
+
+
+def expected_lift(org: str, plat: str, texts: list[str]) -> list[float]:
+    """For each text, the mean lift on plat of its hashtags and terms seen on measured posts (1.0 if none)."""
+    import numpy as np
+
+    index = _index(org)
+    with _lock:
+        columns = index.columns(plat)
+        results = []
+        for text in texts:
+            rows = np.array([index.terms[t] for t in terms_of(text) if t in index.terms], dtype=np.int64)
+            if not len(rows) or not columns:
+                results.append(1.0)
+                continue
+            sums, lift = index.lift(rows, columns)
+            seen = sums[:, :, 0].sum(axis=1) > 0
+            results.append(float(lift[seen].mean()) if seen.any() else 1.0)
+    return results
+
+
+def top_hashtags(org: str, plat: str, count: int, min_posts: int = 2) -> list[str]:
+    """Up to count hashtags whose posts on plat beat the platform average, best first."""
+    ranked = performance(org, plat, "hashtags", min_posts=min_posts, top=count)["tags"]
+    return [t["tag"] for t in ranked if t["lift"] > 1.0]
@@ -0,0 +1,419 @@
+"""Durable local job queue for platform publishes and metrics refreshes.
+
+Jobs live in a SQLite file so they survive restarts. Worker coroutines pick
+up due jobs, retry transient failures with exponential backoff and jitter
+(honouring Retry-After), and move jobs that run out of attempts to the
+dead-letter state. A per-platform circuit breaker stops hammering a
+platform that keeps failing.
+"""
+
+import asyncio
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+import config
+import telemetry
+
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+DEAD = "dead"
+
+TERMINAL_STATES = {SUCCEEDED, DEAD}
+
+
+class RetryLater(Exception):
+    """Raised by a handler to ask for the job to be retried after a delay."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# handler(payload, final_attempt) -> result dict
+Handler = Callable[[dict, bool], Awaitable[dict]]
+_handlers: dict[str, Handler] = {}
+
+
+def register(kind: str):
+    """Decorator registering the handler for a job kind."""
+    def decorator(fn: Handler) -> Handler:
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+# --- Error classification ---
+
+def is_transient(exc: Exception) -> bool:
+    """True for rate limits, server errors and transport failures."""
+    if isinstance(exc, RetryLater):
+        return True
+    if isinstance(exc, (httpx.TransportError, TimeoutError, ConnectionError)):
+        return True
+    if not hasattr(exc, "response"):
+        return False
+    response = exc.response
+    if response is None:
+        # atproto transport errors carry no response
+        return True
+    status = getattr(response, "status_code", None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def retry_after(exc: Exception) -> Optional[float]:
+    """Seconds the platform asked us to wait, from Retry-After or ratelimit-reset."""
+    if isinstance(exc, RetryLater):
+        return exc.retry_after
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    headers = {str(k).lower(): v for k, v in dict(headers).items()}
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+    reset = headers.get("ratelimit-reset")
+    if reset:
+        try:
+            return max(0.0, float(reset) - time.time())
+        except ValueError:
+            return None
+    return None
+
+
+def backoff_delay(attempt: int, hint: Optional[float] = None) -> float:
+    """Exponential backoff with full jitter, never shorter than the server's hint."""
+    ceiling = min(config.JOB_BACKOFF_CAP, config.JOB_BACKOFF_BASE * (2 ** (attempt - 1)))
+    delay = random.uniform(0, ceiling)
+    if hint:
+        delay = max(delay, hint)
+    return delay
+
+
+# --- Circuit breaker ---
+
+class CircuitBreaker:
+    """Opens after consecutive transient failures; half-opens after a cooldown."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        return self.state != "open"
+
+    def remaining(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def breaker(platform: str) -> CircuitBreaker:
+    """Get the circuit breaker for a platform."""
+    if platform not in _breakers:
+        _breakers[platform] = CircuitBreaker(
+            config.CIRCUIT_FAILURE_THRESHOLD, config.CIRCUIT_RESET_SECONDS,
+        )
+    return _breakers[platform]
+
+
+def circuit_states() -> dict[str, str]:
+    """Current breaker state per platform."""
+    return {name: b.state for name, b in _breakers.items()}
+
+
+# --- Storage ---
+
+_db_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+
+
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        path = Path(config.JOBS_DB_PATH)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        _conn.row_factory = sqlite3.Row
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=FULL")
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                org TEXT NOT NULL DEFAULT '',
+                dedupe_key TEXT NOT NULL DEFAULT '',
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                next_run_at REAL NOT NULL,
+                last_error TEXT NOT NULL DEFAULT '',
+                result TEXT NOT NULL DEFAULT '',
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        columns = {r["name"] for r in _conn.execute("PRAGMA table_info(jobs)")}
+        if "org" not in columns:
+            _conn.execute("ALTER TABLE jobs ADD COLUMN org TEXT NOT NULL DEFAULT ''")
+        if "dedupe_key" not in columns:
+            _conn.execute("ALTER TABLE jobs ADD COLUMN dedupe_key TEXT NOT NULL DEFAULT ''")
+        _conn.execute("CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, next_run_at)")
+        # Jobs left running by a previous process are picked up again
+        _conn.execute("UPDATE jobs SET status = ? WHERE status = ?", (QUEUED, RUNNING))
+    return _conn
+
+
+def _to_dict(row: sqlite3.Row) -> dict:
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def enqueue(kind: str, payload: dict, max_attempts: Optional[int] = None, dedupe_key: str = "") -> str:
+    """Persist a new job and wake the workers. Returns the job ID.
+
+    With dedupe_key, a queued or running job of the same kind and key is
+    returned instead of adding another, so a retried request can't run the
+    same work twice at once.
+    """
+    job_id = uuid.uuid4().hex[:12]
+    now = datetime.now().isoformat()
+    trace = telemetry.trace_context()
+    if trace:
+        # Lets the job's span link back to the tool call that queued it
+        payload = {**payload, "_trace": trace}
+    with _db_lock:
+        conn = _db()
+        if dedupe_key:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE kind = ? AND dedupe_key = ? AND status IN (?, ?) LIMIT 1",
+                (kind, dedupe_key, QUEUED, RUNNING),
+            ).fetchone()
+            if row is not None:
+                return row["id"]
+        conn.execute(
+            "INSERT INTO jobs (id, kind, org, dedupe_key, payload, status, max_attempts, next_run_at,"
+            " created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, payload.get("org", ""), dedupe_key, json.dumps(payload), QUEUED,
+             max_attempts or config.JOB_MAX_ATTEMPTS, time.time(), now, now),
+        )
+    if _wakeup is not None:
+        _set(_wakeup)
+    return job_id
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    """Return a job by ID, or None."""
+    with _db_lock:
+        row = _db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _to_dict(row) if row else None
+
+
+def list_jobs(status: str = "", limit: int = 20, org: str = "") -> list[dict]:
+    """Most recent jobs, optionally filtered by status and org."""
+    query = "SELECT * FROM jobs WHERE 1 = 1"
+    params: tuple = ()
+    if status:
+        query += " AND status = ?"
+        params += (status,)
+    if org:
+        query += " AND org = ?"
+        params += (org,)
+    query += " ORDER BY created_at DESC LIMIT ?"
+    with _db_lock:
+        rows = _db().execute(query, params + (limit,)).fetchall()
+    return [_to_dict(r) for r in rows]
+
+
+def counts(org: str = "") -> dict[str, int]:
+    """Number of jobs in each state, optionally for one org."""
+    query = "SELECT status, COUNT(*) FROM jobs"
+    params: tuple = ()
+    if org:
+        query += " WHERE org = ?"
+        params = (org,)
+    with _db_lock:
+        rows = _db().execute(query + " GROUP BY status", params).fetchall()
+    return {status: n for status, n in rows}
+
+
+def _claim_next() -> Optional[dict]:
+    with _db_lock:
+        conn = _db()
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE status = ? AND next_run_at <= ? ORDER BY next_run_at LIMIT 1",
+            (QUEUED, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+            (RUNNING, datetime.now().isoformat(), row["id"]),
+        )
+    job = _to_dict(row)
+    job["attempts"] += 1
+    return job
+
+
+def _next_due_in() -> float:
+    with _db_lock:
+        row = _db().execute(
+            "SELECT MIN(next_run_at) FROM jobs WHERE status = ?", (QUEUED,),
+        ).fetchone()
+    if row[0] is None:
+        return config.JOB_POLL_SECONDS
+    return min(config.JOB_POLL_SECONDS, max(0.0, row[0] - time.time()))
+
+
+def _finish(job_id: str, status: str, next_run_at: Optional[float] = None,
+            error: str = "", result: Optional[dict] = None):
+    with _db_lock:
+        _db().execute(
+            "UPDATE jobs SET status = ?, next_run_at = COALESCE(?, next_run_at), last_error = ?,"
+            " result = ?, updated_at = ? WHERE id = ?",
+            (status, next_run_at, error, json.dumps(result) if result is not None else "",
+             datetime.now().isoformat(), job_id),
+        )
+    if status in TERMINAL_STATES and job_id in _done:
+        _set(_done.pop(job_id))
+
+
+# --- Workers ---
+
+# The workers run on one event loop; the database calls they and the tools
+# make run on worker threads, off that loop
+_workers: list[asyncio.Task] = []
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_wakeup: Optional[asyncio.Event] = None
+_done: dict[str, asyncio.Event] = {}
+_stopping = False
+
+
+def _set(event: asyncio.Event):
+    """Set an event of the workers' loop, from that loop or from a worker thread."""
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if _loop is None or running is _loop or _loop.is_closed():
+        event.set()
+    else:
+        _loop.call_soon_threadsafe(event.set)
+
+
+async def _run(job: dict):
+    handler = _handlers.get(job["kind"])
+    if handler is None:
+        await asyncio.to_thread(_finish, job["id"], DEAD, error=f"No handler for job kind {job['kind']}")
+        return
+    final_attempt = job["attempts"] >= job["max_attempts"]
+    payload = dict(job["payload"])
+    link = payload.pop("_trace", None)
+    try:
+        with telemetry.timed(job["kind"], kind=telemetry.JOB, link=link):
+            result = await handler(payload, final_attempt)
+    except Exception as exc:
+        if is_transient(exc) and not final_attempt:
+            delay = backoff_delay(job["attempts"], retry_after(exc))
+            await asyncio.to_thread(_finish, job["id"], QUEUED, next_run_at=time.time() + delay,
+                                    error=str(exc))
+        else:
+            await asyncio.to_thread(_finish, job["id"], DEAD, error=str(exc))
+        return
+    await asyncio.to_thread(_finish, job["id"], SUCCEEDED, result=result)
+
+
+async def _worker_loop():
+    while not _stopping:
+        _wakeup.clear()
+        job = await asyncio.to_thread(_claim_next)
+        if job is None:
+            delay = await asyncio.to_thread(_next_due_in)
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await _run(job)
+
+
+def start_workers(count: Optional[int] = None):
+    """Start worker coroutines on the running event loop (idempotent)."""
+    global _loop, _wakeup, _stopping
+    if any(not t.done() for t in _workers):
+        return
+    _stopping = False
+    _loop = asyncio.get_running_loop()
+    _wakeup = asyncio.Event()
+    _workers.clear()
+    for _ in range(count or config.JOB_WORKERS):
+        _workers.append(asyncio.get_running_loop().create_task(_worker_loop()))
+
+
+async def stop_workers(timeout: float = 30.0):
+    """Let in-flight jobs finish (up to timeout), then stop the workers."""
+    global _stopping
+    _stopping = True
+    if _wakeup is not None:
+        _wakeup.set()
+    if _workers:
+        _, pending = await asyncio.wait(_workers, timeout=timeout)
+        for task in pending:
+            task.cancel()
+    _workers.clear()
+
+
+async def wait_for(job_id: str, timeout: float) -> Optional[dict]:
+    """Wait until a job reaches a terminal state (or timeout); return the job."""
+    # Registered before the check, so a job finishing in between still wakes us
+    event = _done.setdefault(job_id, asyncio.Event())
+    job = await asyncio.to_thread(get_job, job_id)
+    if job is None or job["status"] in TERMINAL_STATES:
+        _done.pop(job_id, None)
+        return job
+    try:
+        await asyncio.wait_for(event.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        pass
+    return await asyncio.to_thread(get_job, job_id)
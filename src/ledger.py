@@ -0,0 +1,129 @@
+"""Local publish ledger for idempotent posting.
+
+Each platform call made while publishing a queue item is bracketed by two
+fsync'd JSONL entries: an intent written before the call and a result
+written after it. Entries are keyed by (content_id, platform, draft hash),
+so a retry of the same draft can skip platforms that already went out even
+if the queue sheet never received the post IDs.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import config
+
+
+# Entry states
+INTENT = "intent"
+PUBLISHED = "published"
+FAILED = "failed"
+
+_lock = threading.Lock()
+_entries: Optional[dict[str, dict]] = None
+
+
+def draft_hash(text: str) -> str:
+    """Stable short hash of a draft's text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def make_key(content_id: str, platform: str, text: str, part: Optional[int] = None) -> str:
+    """Ledger key for one draft (or one post of a thread) on one platform."""
+    key = f"{content_id}:{platform}:{draft_hash(text)}"
+    return key if part is None else f"{key}:{part}"
+
+
+def idempotency_key(key: str) -> str:
+    """Deterministic idempotency key to send with a platform request."""
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _load() -> dict[str, dict]:
+    global _entries
+    if _entries is None:
+        _entries = {}
+        path = Path(config.PUBLISH_LEDGER_PATH)
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final line from a crash mid-write
+                        continue
+                    _entries[entry["key"]] = entry
+    return _entries
+
+
+def _append(entry: dict):
+    path = Path(config.PUBLISH_LEDGER_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    _load()[entry["key"]] = entry
+
+
+def lookup(key: str) -> Optional[dict]:
+    """Return the latest ledger entry for a key, if any."""
+    with _lock:
+        return _load().get(key)
+
+
+def record_intent(key: str, content_id: str, platform: str):
+    """Record that a platform call is about to be made."""
+    with _lock:
+        _append({
+            "key": key,
+            "content_id": content_id,
+            "platform": platform,
+            "state": INTENT,
+            "at": datetime.now().isoformat(),
+        })
+
+
+def record_result(
+    key: str,
+    content_id: str,
+    platform: str,
+    post_id: str = "",
+    url: str = "",
+    error: str = "",
+    cid: str = "",
+):
+    """Record the outcome of a platform call.
+
+    cid is the content hash BlueSky needs to reply to the post.
+    """
+    with _lock:
+        _append({
+            "key": key,
+            "content_id": content_id,
+            "platform": platform,
+            "state": FAILED if error else PUBLISHED,
+            "post_id": post_id,
+            "url": url,
+            "cid": cid,
+            "error": error,
+            "at": datetime.now().isoformat(),
+        })
+
+
+def is_definite_failure(exc: Exception) -> bool:
+    """True if the platform provably rejected the request.
+
+    Only client errors count. Timeouts, dropped connections, rate limits
+    and server errors (which may come after the post was created) leave the
+    intent standing for the next retry to reconcile.
+    """
+    if isinstance(exc, (NotImplementedError, ValueError)):
+        return True
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    return status is not None and 400 <= status < 500 and status not in (408, 429)
@@ -14,6 +14,15 @@ class PostStatus(str, Enum):
     POSTED = "Posted"
     FAILED = "Failed"
 
+    @classmethod
+    def _missing_(cls, value):
+        # Accept any capitalization ("approved", "PENDING REVIEW")
+        if isinstance(value, str):
+            for status in cls:
+                if status.value.lower() == value.strip().lower():
+                    return status
+        return None
+
 
 class Platform(str, Enum):
     BLUESKY = "bluesky"
@@ -40,6 +49,32 @@ LIVE_PLATFORMS = {Platform.BLUESKY, Platform.MASTODON}
 # Stub-only platforms
 STUB_PLATFORMS = {Platform.FACEBOOK, Platform.INSTAGRAM, Platform.LINKEDIN, Platform.TWITTER}
 
+# Status changes the queue tools allow. Re-setting the current status (e.g.
+# rescheduling a Scheduled item) is always allowed; Posted is final.
+ALLOWED_TRANSITIONS = {
+    PostStatus.DRAFT: {PostStatus.PENDING_REVIEW, PostStatus.APPROVED},
+    PostStatus.PENDING_REVIEW: {PostStatus.DRAFT, PostStatus.APPROVED},
+    PostStatus.APPROVED: {PostStatus.DRAFT, PostStatus.SCHEDULED, PostStatus.POSTED, PostStatus.FAILED},
+    PostStatus.SCHEDULED: {PostStatus.DRAFT, PostStatus.APPROVED, PostStatus.POSTED, PostStatus.FAILED},
+    PostStatus.POSTED: set(),
+    PostStatus.FAILED: {PostStatus.DRAFT, PostStatus.APPROVED},
+}
+
+
+def can_transition(current: PostStatus, new: PostStatus) -> bool:
+    return new == current or new in ALLOWED_TRANSITIONS[current]
+
+
+def transition_error(current: str, new: PostStatus) -> str:
+    """Why an item whose sheet status is current can't move to new; "" if it can."""
+    try:
+        status = PostStatus(current) if current else PostStatus.DRAFT
+    except ValueError:
+        return "Unrecognized current status"
+    if not can_transition(status, new):
+        return f"Cannot move from {status.value} to {new.value}"
+    return ""
+
 
 @dataclass
 class QueueItem:
@@ -57,6 +92,8 @@ class QueueItem:
     scheduled_for: str = ""
     posted_at: str = ""
     post_ids: str = ""
+    # JSON: platform -> ranked candidate drafts, when several were generated
+    variants: str = ""
 
     def get_draft(self, platform: Platform) -> str:
         return getattr(self, f"{platform.value}_draft", "")
@@ -70,13 +107,13 @@ class QueueItem:
             self.bluesky_draft, self.mastodon_draft, self.linkedin_draft,
             self.facebook_draft, self.instagram_draft,
             self.status.value, self.created_at, self.scheduled_for,
-            self.posted_at, self.post_ids,
+            self.posted_at, self.post_ids, self.variants,
         ]
 
     @classmethod
     def from_row(cls, row: list[str]) -> "QueueItem":
         # Pad row to expected length
-        while len(row) < 14:
+        while len(row) < 15:
             row.append("")
         return cls(
             content_id=row[0], topic=row[1], org=row[2], tone=row[3],
@@ -84,7 +121,7 @@ class QueueItem:
             facebook_draft=row[7], instagram_draft=row[8],
             status=PostStatus(row[9]) if row[9] else PostStatus.DRAFT,
             created_at=row[10], scheduled_for=row[11],
-            posted_at=row[12], post_ids=row[13],
+            posted_at=row[12], post_ids=row[13], variants=row[14],
         )
 
     @classmethod
@@ -93,7 +130,7 @@ class QueueItem:
             "content_id", "topic", "org", "tone",
             "bluesky_draft", "mastodon_draft", "linkedin_draft",
             "facebook_draft", "instagram_draft",
-            "status", "created_at", "scheduled_for", "posted_at", "post_ids",
+            "status", "created_at", "scheduled_for", "posted_at", "post_ids", "variants",
         ]
 
 
@@ -124,6 +161,27 @@ class AnalyticsRecord:
         ]
 
 
+@dataclass
+class AudienceSnapshot:
+    """An account's audience counts on one day; later samples that day replace it."""
+    date: str
+    platform: str
+    followers: int = 0
+    following: int = 0
+    posts: int = 0
+    sampled_at: str = ""
+
+    def to_row(self) -> list[str]:
+        return [
+            self.date, self.platform, str(self.followers), str(self.following),
+            str(self.posts), self.sampled_at,
+        ]
+
+    @classmethod
+    def header_row(cls) -> list[str]:
+        return ["date", "platform", "followers", "following", "posts", "sampled_at"]
+
+
 @dataclass
 class PostResult:
     success: bool
@@ -141,3 +199,73 @@ class BrandVoice:
     avoid: list[str] = field(default_factory=lambda: ["corporate jargon", "fear-based messaging"])
     audience: str = "Community members, advocates, and allies"
     hashtags: dict[str, list[str]] = field(default_factory=dict)
+    # Keys we don't model (vocabulary, example_posts, ...) survive a round trip
+    extras: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BrandVoice":
+        """Build from parsed JSON, raising ValueError on malformed fields."""
+        if not isinstance(data, dict):
+            raise ValueError("Brand voice must be a JSON object")
+        voice = cls()
+        for key in ("org_name", "tone", "audience"):
+            if key in data:
+                if not isinstance(data[key], str):
+                    raise ValueError(f"Brand voice '{key}' must be a string")
+                setattr(voice, key, data[key])
+        for key in ("values", "avoid"):
+            if key in data:
+                if not isinstance(data[key], list) or not all(isinstance(v, str) for v in data[key]):
+                    raise ValueError(f"Brand voice '{key}' must be a list of strings")
+                setattr(voice, key, list(data[key]))
+        if "hashtags" in data:
+            tags = data["hashtags"]
+            if not isinstance(tags, dict) or not all(
+                isinstance(v, list) and all(isinstance(t, str) for t in v) for v in tags.values()
+            ):
+                raise ValueError("Brand voice 'hashtags' must map platform names to lists of strings")
+            voice.hashtags = {k: list(v) for k, v in tags.items()}
+        known = {"org_name", "tone", "values", "avoid", "audience", "hashtags"}
+        voice.extras = {k: v for k, v in data.items() if k not in known}
+        return voice
+
+    def to_dict(self) -> dict:
+        return {
+            "org_name": self.org_name,
+            "tone": self.tone,
+            "values": list(self.values),
+            "avoid": list(self.avoid),
+            "audience": self.audience,
+            "hashtags": {k: list(v) for k, v in self.hashtags.items()},
+            **self.extras,
+        }
+
+
+@dataclass
+class Tenant:
+    """One organization served by this process: credentials, storage and budget."""
+    org: str
+    brand_voice_path: str
+    sheet_id: str
+    queue_tab: str = "Queue"
+    analytics_tab: str = "Analytics"
+    queue_archive_tab: str = "Queue Archive"
+    analytics_archive_tab: str = "Analytics Archive"
+    audience_tab: str = "Audience"
+    google_credentials_path: str = ""
+    bluesky_handle: str = ""
+    bluesky_app_password: str = ""
+    bluesky_service_url: str = ""
+    mastodon_instance: str = "https://mastodon.social"
+    mastodon_access_token: str = ""
+    facebook_access_token: str = ""
+    facebook_page_id: str = ""
+    instagram_access_token: str = ""
+    instagram_account_id: str = ""
+    linkedin_access_token: str = ""
+    linkedin_org_id: str = ""
+    openai_api_key: str = ""
+    openai_model: str = "gpt-4o"
+    openai_base_url: str = ""
+    # Maximum concurrent platform API calls for this org
+    max_concurrency: int = 4
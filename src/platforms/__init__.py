@@ -1,25 +1,44 @@
 """Platform clients for social media posting."""
 
+import importlib
+from typing import Optional
+
+import config
+
+from models import Tenant
 from platforms.base import BasePlatform
-from platforms.bluesky import BlueSkyPlatform
-from platforms.mastodon import MastodonPlatform
-from platforms.facebook import FacebookPlatform
-from platforms.instagram import InstagramPlatform
-from platforms.linkedin import LinkedInPlatform
-from platforms.twitter import TwitterPlatform
-
-
-def get_platform(name: str) -> BasePlatform:
-    """Get platform client by name."""
-    platforms = {
-        "bluesky": BlueSkyPlatform,
-        "mastodon": MastodonPlatform,
-        "facebook": FacebookPlatform,
-        "instagram": InstagramPlatform,
-        "linkedin": LinkedInPlatform,
-        "twitter": TwitterPlatform,
-    }
-    cls = platforms.get(name.lower())
-    if not cls:
-        raise ValueError(f"Unknown platform: {name}. Available: {list(platforms.keys())}")
-    return cls()
+
+
+# Client class per platform as (module, class); modules are imported on
+# first use so a server that only talks to Mastodon never loads atproto
+_registry = {
+    "bluesky": ("platforms.bluesky", "BlueSkyPlatform"),
+    "mastodon": ("platforms.mastodon", "MastodonPlatform"),
+    "facebook": ("platforms.facebook", "FacebookPlatform"),
+    "instagram": ("platforms.instagram", "InstagramPlatform"),
+    "linkedin": ("platforms.linkedin", "LinkedInPlatform"),
+    "twitter": ("platforms.twitter", "TwitterPlatform"),
+}
+
+# Pooled clients, one per (org, platform), so logins and connections are reused
+_pool: dict[tuple[str, str], BasePlatform] = {}
+
+
+def get_platform(name: str, tenant: Optional[Tenant] = None) -> BasePlatform:
+    """Get the pooled platform client for an org (default org if omitted)."""
+    entry = _registry.get(name.lower())
+    if not entry:
+        raise ValueError(f"Unknown platform: {name}. Available: {list(_registry.keys())}")
+    tenant = tenant or config.get_tenant()
+    key = (tenant.org, name.lower())
+    if key not in _pool:
+        module, cls = entry
+        _pool[key] = getattr(importlib.import_module(module), cls)(tenant)
+    return _pool[key]
+
+
+async def close_all():
+    """Close every pooled client."""
+    for client in list(_pool.values()):
+        await client.close()
+    _pool.clear()
@@ -1,20 +1,43 @@
 """Abstract base class for platform clients."""
 
+import re
 from abc import ABC, abstractmethod
 from typing import Optional
 
 
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
 class BasePlatform(ABC):
     """Base class all platform clients inherit from."""
 
     name: str = "base"
     max_length: int = 500
     is_stub: bool = False
+    # Whether the platform dedupes requests carrying the same idempotency key
+    supports_idempotency_key: bool = False
+    # Whether post() accepts reply_to for building reply chains
+    supports_threads: bool = False
+    # Whether get_timeline() pages through the account's own posts
+    supports_timeline: bool = False
+    # Whether get_account_stats() reports the account's audience counts
+    supports_account_stats: bool = False
 
     @abstractmethod
-    async def post(self, text: str, media_urls: Optional[list[str]] = None) -> dict:
+    async def post(
+        self,
+        text: str,
+        media_urls: Optional[list[str]] = None,
+        idempotency_key: Optional[str] = None,
+        reply_to: Optional[dict] = None,
+    ) -> dict:
         """Post content to the platform.
 
+        idempotency_key is sent where the platform supports it, so a retried
+        request with the same key does not create a second post.
+        reply_to is {"root": result, "parent": result} using earlier results
+        of this method, for platforms that support threads.
+
         Returns: {"post_id": str, "url": str}
         Raises: Exception on failure
         """
@@ -25,6 +48,7 @@ class BasePlatform(ABC):
         """Fetch engagement metrics for a post.
 
         Returns: {"likes": int, "reposts": int, "replies": int, "impressions": int}
+        Raises: Exception on failure, so stale counts are never overwritten with zeros
         """
         ...
 
@@ -33,8 +57,87 @@ class BasePlatform(ABC):
         """Test that credentials are valid and can connect."""
         ...
 
+    async def close(self):
+        """Release pooled connections."""
+
+    async def find_existing_post(self, text: str) -> Optional[dict]:
+        """Look for a recent post of ours with exactly this text.
+
+        Used to reconcile a publish attempt whose outcome is unknown.
+        Returns: {"post_id": str, "url": str} or None
+        """
+        return None
+
+    async def get_timeline(self, cursor: str = "") -> tuple[list[dict], str]:
+        """One page of the account's own posts with their metrics, newest first.
+
+        cursor is "" for the first page, then the cursor returned with the
+        previous page.
+        Returns: ([{"post_id", "posted_at", "url", "likes", "reposts",
+            "replies", "impressions"}], next page cursor or "" after the last page)
+        """
+        return [], ""
+
+    async def get_account_stats(self) -> dict:
+        """Current audience counts of the account we post as.
+
+        Returns: {"followers": int, "following": int, "posts": int}, or {}
+            where the platform doesn't expose them
+        Raises: Exception on failure
+        """
+        return {}
+
+    def weighted_length(self, text: str) -> int:
+        """Length of text as the platform counts it against max_length."""
+        return len(text)
+
     def truncate(self, text: str) -> str:
         """Truncate text to platform's max length."""
-        if len(text) <= self.max_length:
+        if self.weighted_length(text) <= self.max_length:
             return text
         return text[: self.max_length - 3] + "..."
+
+    def split_thread(self, text: str) -> list[str]:
+        """Split text at sentence boundaries into numbered chunks that each fit.
+
+        Sentences too long for one post fall back to word boundaries, and
+        words too long for one post are hard-cut.
+        """
+        if self.weighted_length(text) <= self.max_length:
+            return [text]
+
+        # Reserve room for the " n/N" suffix; repack if N gains a digit
+        total = 9
+        while True:
+            budget = self.max_length - len(f" {total}/{total}")
+            chunks = self._pack(text, budget)
+            if len(str(len(chunks))) <= len(str(total)):
+                break
+            total = 10 ** len(str(total)) * 10 - 1
+        n = len(chunks)
+        return [f"{chunk} {i}/{n}" for i, chunk in enumerate(chunks, start=1)]
+
+    def _pack(self, text: str, budget: int) -> list[str]:
+        pieces = []
+        for sentence in _SENTENCE_END.split(text.strip()):
+            if self.weighted_length(sentence) <= budget:
+                pieces.append(sentence)
+                continue
+            for word in sentence.split():
+                while self.weighted_length(word) > budget:
+                    pieces.append(word[:budget])
+                    word = word[budget:]
+                pieces.append(word)
+
+        chunks: list[str] = []
+        current = ""
+        for piece in pieces:
+            candidate = f"{current} {piece}" if current else piece
+            if self.weighted_length(candidate) <= budget:
+                current = candidate
+            else:
+                chunks.append(current)
+                current = piece
+        if current:
+            chunks.append(current)
+        return chunks
@@ -1,27 +1,88 @@
 """BlueSky (AT Protocol) platform client."""
 
+import asyncio
+import unicodedata
 from typing import Optional
 
+from models import Tenant
 from platforms.base import BasePlatform
-import config
+
+
+# Largest page app.bsky.feed.getAuthorFeed serves
+_TIMELINE_PAGE = 100
+
+_ZWJ = "\u200d"
+
+
+def _extends(ch: str) -> bool:
+    """Whether ch attaches to the grapheme before it rather than starting one."""
+    return (
+        unicodedata.category(ch) in ("Mn", "Me", "Mc")
+        or ch == _ZWJ
+        or "\ufe00" <= ch <= "\ufe0f"                # variation selectors
+        or "\U0001f3fb" <= ch <= "\U0001f3ff"        # skin tone modifiers
+        or "\U000e0020" <= ch <= "\U000e007f"        # tags (subdivision flags)
+    )
+
+
+def _is_regional_indicator(ch: str) -> bool:
+    return "\U0001f1e6" <= ch <= "\U0001f1ff"
+
+
+def _grapheme_count(text: str) -> int:
+    """Number of user-perceived characters in text.
+
+    A close reading of Unicode's extended grapheme clusters without a
+    Unicode database: combining marks, variation selectors, skin tones and
+    tags attach to the character before them, a zero-width joiner also
+    pulls in the character after it (family and profession emoji), pairs
+    of regional indicators make one flag and CRLF counts once.
+    """
+    count = 0
+    prev = ""
+    flag_open = False
+    for ch in text:
+        if prev and (_extends(ch) or prev == _ZWJ or (prev == "\r" and ch == "\n")):
+            pass
+        elif _is_regional_indicator(ch) and flag_open:
+            flag_open = False
+        else:
+            count += 1
+            flag_open = _is_regional_indicator(ch)
+        prev = ch
+    return count
 
 
 class BlueSkyPlatform(BasePlatform):
     name = "bluesky"
     max_length = 300
     is_stub = False
+    supports_threads = True
+    supports_timeline = True
+    supports_account_stats = True
 
-    def __init__(self):
+    def __init__(self, tenant: Tenant):
+        self.tenant = tenant
         self._client = None
+        self._login_lock = asyncio.Lock()
 
     async def _get_client(self):
-        if self._client is None:
-            from atproto import AsyncClient
-            self._client = AsyncClient()
-            await self._client.login(config.BLUESKY_HANDLE, config.BLUESKY_APP_PASSWORD)
+        # Logged in once per org and reused; atproto refreshes the session
+        async with self._login_lock:
+            if self._client is None:
+                from atproto import AsyncClient
+                client = AsyncClient(self.tenant.bluesky_service_url or None)
+                await client.login(self.tenant.bluesky_handle, self.tenant.bluesky_app_password)
+                self._client = client
         return self._client
 
-    async def post(self, text: str, media_urls: Optional[list[str]] = None) -> dict:
+    async def post(
+        self,
+        text: str,
+        media_urls: Optional[list[str]] = None,
+        idempotency_key: Optional[str] = None,
+        reply_to: Optional[dict] = None,
+    ) -> dict:
         client = await self._get_client()
         text = self.truncate(text)
 
@@ -40,42 +101,99 @@ class BlueSkyPlatform(BasePlatform):
                 atmodels.AppBskyEmbedImages.Image(alt=img["alt"], image=img["image"])
                 for img in images
             ])
-            response = await client.send_post(text=text, embed=embed)
         else:
-            response = await client.send_post(text=text)
+            embed = None
+
+        reply_ref = None
+        if reply_to:
+            from atproto import models as atmodels
+            reply_ref = atmodels.AppBskyFeedPost.ReplyRef(
+                root=atmodels.ComAtprotoRepoStrongRef.Main(
+                    uri=reply_to["root"]["post_id"], cid=reply_to["root"]["cid"]),
+                parent=atmodels.ComAtprotoRepoStrongRef.Main(
+                    uri=reply_to["parent"]["post_id"], cid=reply_to["parent"]["cid"]),
+            )
+        response = await client.send_post(text=text, embed=embed, reply_to=reply_ref)
 
         # Extract post URI and construct URL
         post_uri = response.uri
         # URI format: at://did:plc:xxx/app.bsky.feed.post/rkey
         parts = post_uri.split("/")
         rkey = parts[-1]
-        handle = config.BLUESKY_HANDLE
+        handle = self.tenant.bluesky_handle
 
         return {
             "post_id": post_uri,
+            "cid": response.cid,
             "url": f"https://bsky.app/profile/{handle}/post/{rkey}",
         }
 
+    def weighted_length(self, text: str) -> int:
+        # BlueSky limits graphemes, so an emoji sequence counts once
+        return _grapheme_count(text)
+
+    async def find_existing_post(self, text: str) -> Optional[dict]:
+        client = await self._get_client()
+        text = self.truncate(text)
+        feed = await client.get_author_feed(actor=self.tenant.bluesky_handle, limit=25)
+        for item in feed.feed:
+            post = item.post
+            if post.author.handle == self.tenant.bluesky_handle and getattr(post.record, "text", None) == text:
+                rkey = post.uri.split("/")[-1]
+                return {
+                    "post_id": post.uri,
+                    "cid": post.cid,
+                    "url": f"https://bsky.app/profile/{self.tenant.bluesky_handle}/post/{rkey}",
+                }
+        return None
+
     async def get_metrics(self, post_id: str) -> dict:
         client = await self._get_client()
-        try:
-            from atproto import models as atmodels
-            # Get thread to access metrics
-            response = await client.get_post_thread(uri=post_id)
-            post = response.thread.post
-            return {
+        # Get thread to access metrics
+        response = await client.get_post_thread(uri=post_id)
+        post = response.thread.post
+        return {
+            "likes": post.like_count or 0,
+            "reposts": post.repost_count or 0,
+            "replies": post.reply_count or 0,
+            "impressions": 0,  # BlueSky doesn't expose impressions
+        }
+
+    async def get_timeline(self, cursor: str = "") -> tuple[list[dict], str]:
+        client = await self._get_client()
+        feed = await client.get_author_feed(actor=self.tenant.bluesky_handle, cursor=cursor or None,
+                                            filter="posts_with_replies", limit=_TIMELINE_PAGE)
+        posts = []
+        for item in feed.feed:
+            post = item.post
+            # Skip reposts of other accounts' posts
+            if item.reason is not None or post.author.handle != self.tenant.bluesky_handle:
+                continue
+            rkey = post.uri.split("/")[-1]
+            posts.append({
+                "post_id": post.uri,
+                "posted_at": getattr(post.record, "created_at", "") or post.indexed_at,
+                "url": f"https://bsky.app/profile/{self.tenant.bluesky_handle}/post/{rkey}",
                 "likes": post.like_count or 0,
                 "reposts": post.repost_count or 0,
                 "replies": post.reply_count or 0,
-                "impressions": 0,  # BlueSky doesn't expose impressions
-            }
-        except Exception:
-            return {"likes": 0, "reposts": 0, "replies": 0, "impressions": 0}
+                "impressions": 0,
+            })
+        return posts, feed.cursor or ""
+
+    async def get_account_stats(self) -> dict:
+        client = await self._get_client()
+        profile = await client.get_profile(self.tenant.bluesky_handle)
+        return {
+            "followers": profile.followers_count or 0,
+            "following": profile.follows_count or 0,
+            "posts": profile.posts_count or 0,
+        }
 
     async def verify_credentials(self) -> bool:
         try:
             client = await self._get_client()
-            profile = await client.get_profile(config.BLUESKY_HANDLE)
+            profile = await client.get_profile(self.tenant.bluesky_handle)
             return bool(profile.did)
         except Exception:
             return False
@@ -1,6 +1,8 @@
 """Facebook platform client (stub)."""
 
 from typing import Optional
+
+from models import Tenant
 from platforms.base import BasePlatform
 
 
@@ -9,7 +11,16 @@ class FacebookPlatform(BasePlatform):
     max_length = 63206
     is_stub = True
 
-    async def post(self, text: str, media_urls: Optional[list[str]] = None) -> dict:
+    def __init__(self, tenant: Tenant):
+        self.tenant = tenant
+
+    async def post(
+        self,
+        text: str,
+        media_urls: Optional[list[str]] = None,
+        idempotency_key: Optional[str] = None,
+        reply_to: Optional[dict] = None,
+    ) -> dict:
         raise NotImplementedError("Facebook integration not yet configured. Requires Meta Graph API OAuth app approval.")
 
     async def get_metrics(self, post_id: str) -> dict:
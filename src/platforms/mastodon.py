@@ -1,53 +1,124 @@
 """Mastodon platform client."""
 
-from typing import Optional
+import json
+import re
+from typing import AsyncIterator, Callable, Optional
 
 import httpx
 
+from models import Tenant
 from platforms.base import BasePlatform
-import config
+
+
+# Mastodon counts every URL as 23 characters and mentions by username only
+_URL = re.compile(r"https?://\S+")
+_MENTION_DOMAIN = re.compile(r"(@\w+)@[\w.-]+\w")
+_URL_WEIGHT = 23
+_WORD = re.compile(r"\S+")
+
+# The streaming server sends a heartbeat comment every 15s or so; a stream
+# silent for longer than this is treated as dead
+_STREAM_READ_TIMEOUT = 60
+
+# Largest page /accounts/:id/statuses serves
+_TIMELINE_PAGE = 40
 
 
 class MastodonPlatform(BasePlatform):
     name = "mastodon"
     max_length = 500
     is_stub = False
+    supports_idempotency_key = True
+    supports_threads = True
+    supports_timeline = True
+    supports_account_stats = True
+
+    def __init__(self, tenant: Tenant):
+        self.tenant = tenant
+        self._http: Optional[httpx.AsyncClient] = None
+        self._streaming_base: Optional[str] = None
+        self._account_id: Optional[str] = None
+
+    def _get_http(self) -> httpx.AsyncClient:
+        # One pooled connection per org, reused across calls
+        if self._http is None:
+            self._http = httpx.AsyncClient()
+        return self._http
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
 
     def _headers(self) -> dict:
-        return {"Authorization": f"Bearer {config.MASTODON_ACCESS_TOKEN}"}
+        return {"Authorization": f"Bearer {self.tenant.mastodon_access_token}"}
 
     def _url(self, path: str) -> str:
-        return f"{config.MASTODON_INSTANCE.rstrip('/')}/api/v1{path}"
+        return f"{self.tenant.mastodon_instance.rstrip('/')}/api/v1{path}"
+
+    def weighted_length(self, text: str) -> int:
+        text = _MENTION_DOMAIN.sub(r"\1", text)
+        return len(_URL.sub("x" * _URL_WEIGHT, text))
+
+    def truncate(self, text: str) -> str:
+        """Truncate text to max_length as Mastodon counts it, at a word boundary.
+
+        URLs and mentions are kept whole or left out, never cut; only a
+        first word too long for a post on its own is hard-cut.
+        """
+        if self.weighted_length(text) <= self.max_length:
+            return text
+        text = text.strip()
+        budget = self.max_length - 3
+        end = 0
+        for word in _WORD.finditer(text):
+            if self.weighted_length(text[:word.end()]) > budget:
+                break
+            end = word.end()
+        if not end:
+            end = budget
+        return text[:end] + "..."
 
-    async def post(self, text: str, media_urls: Optional[list[str]] = None) -> dict:
+    async def post(
+        self,
+        text: str,
+        media_urls: Optional[list[str]] = None,
+        idempotency_key: Optional[str] = None,
+        reply_to: Optional[dict] = None,
+    ) -> dict:
         text = self.truncate(text)
         media_ids = []
+        http = self._get_http()
 
-        async with httpx.AsyncClient() as http:
-            # Upload media if provided
-            if media_urls:
-                for url in media_urls[:4]:
-                    img_resp = await http.get(url)
-                    upload_resp = await http.post(
-                        self._url("/media"),
-                        headers=self._headers(),
-                        files={"file": ("image.jpg", img_resp.content, "image/jpeg")},
-                    )
-                    upload_resp.raise_for_status()
-                    media_ids.append(upload_resp.json()["id"])
-
-            # Create status
-            payload = {"status": text}
-            if media_ids:
-                payload["media_ids"] = media_ids
-
-            resp = await http.post(
-                self._url("/statuses"),
-                headers=self._headers(),
-                json=payload,
-            )
-            resp.raise_for_status()
-            data = resp.json()
+        # Upload media if provided
+        if media_urls:
+            for url in media_urls[:4]:
+                img_resp = await http.get(url)
+                upload_resp = await http.post(
+                    self._url("/media"),
+                    headers=self._headers(),
+                    files={"file": ("image.jpg", img_resp.content, "image/jpeg")},
+                )
+                upload_resp.raise_for_status()
+                media_ids.append(upload_resp.json()["id"])
+
+        # Create status
+        payload = {"status": text}
+        if media_ids:
+            payload["media_ids"] = media_ids
+        if reply_to:
+            payload["in_reply_to_id"] = reply_to["parent"]["post_id"]
+
+        headers = self._headers()
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        resp = await http.post(
+            self._url("/statuses"),
+            headers=headers,
+            json=payload,
+        )
+        resp.raise_for_status()
+        data = resp.json()
 
         return {
             "post_id": data["id"],
@@ -55,31 +126,107 @@ class MastodonPlatform(BasePlatform):
         }
 
     async def get_metrics(self, post_id: str) -> dict:
-        async with httpx.AsyncClient() as http:
-            try:
-                resp = await http.get(
-                    self._url(f"/statuses/{post_id}"),
-                    headers=self._headers(),
-                )
-                resp.raise_for_status()
-                data = resp.json()
-                return {
-                    "likes": data.get("favourites_count", 0),
-                    "reposts": data.get("reblogs_count", 0),
-                    "replies": data.get("replies_count", 0),
-                    "impressions": 0,  # Mastodon doesn't expose this
-                }
-            except Exception:
-                return {"likes": 0, "reposts": 0, "replies": 0, "impressions": 0}
+        resp = await self._get_http().get(
+            self._url(f"/statuses/{post_id}"),
+            headers=self._headers(),
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        return {
+            "likes": data.get("favourites_count", 0),
+            "reposts": data.get("reblogs_count", 0),
+            "replies": data.get("replies_count", 0),
+            "impressions": 0,  # Mastodon doesn't expose this
+        }
+
+    async def _own_account(self) -> dict:
+        resp = await self._get_http().get(
+            self._url("/accounts/verify_credentials"),
+            headers=self._headers(),
+        )
+        resp.raise_for_status()
+        account = resp.json()
+        self._account_id = str(account["id"])
+        return account
+
+    async def _own_account_id(self) -> str:
+        if self._account_id is None:
+            await self._own_account()
+        return self._account_id
+
+    async def get_account_stats(self) -> dict:
+        account = await self._own_account()
+        return {
+            "followers": account.get("followers_count", 0),
+            "following": account.get("following_count", 0),
+            "posts": account.get("statuses_count", 0),
+        }
+
+    async def get_timeline(self, cursor: str = "") -> tuple[list[dict], str]:
+        params = {"limit": _TIMELINE_PAGE, "exclude_reblogs": "true"}
+        if cursor:
+            params["max_id"] = cursor
+        resp = await self._get_http().get(
+            self._url(f"/accounts/{await self._own_account_id()}/statuses"),
+            headers=self._headers(),
+            params=params,
+        )
+        resp.raise_for_status()
+        posts = [
+            {
+                "post_id": str(data["id"]),
+                "posted_at": data.get("created_at", ""),
+                "url": data.get("url", ""),
+                "likes": data.get("favourites_count", 0),
+                "reposts": data.get("reblogs_count", 0),
+                "replies": data.get("replies_count", 0),
+                "impressions": 0,
+            }
+            for data in resp.json()
+        ]
+        # Older pages are addressed by the last ID seen; an empty page ends it
+        return posts, posts[-1]["post_id"] if posts else ""
+
+    async def _streaming_url(self, path: str) -> str:
+        # Some instances serve the streaming API from a separate host
+        if self._streaming_base is None:
+            resp = await self._get_http().get(self._url("/instance"))
+            resp.raise_for_status()
+            base = (resp.json().get("urls") or {}).get("streaming_api") or self.tenant.mastodon_instance
+            self._streaming_base = base.replace("wss://", "https://", 1).replace("ws://", "http://", 1).rstrip("/")
+        return f"{self._streaming_base}/api/v1/streaming{path}"
+
+    async def stream_notifications(self, on_open: Optional[Callable[[], None]] = None) -> AsyncIterator[dict]:
+        """Yield the account's notifications from the streaming API as they arrive.
+
+        on_open is called once the stream is established. Ends when the
+        server closes the stream; raises on connection errors or if the
+        stream goes silent.
+        """
+        url = await self._streaming_url("/user/notification")
+        timeout = httpx.Timeout(10, read=_STREAM_READ_TIMEOUT)
+        async with self._get_http().stream("GET", url, headers=self._headers(), timeout=timeout) as resp:
+            resp.raise_for_status()
+            if on_open:
+                on_open()
+            event, data = "", []
+            async for line in resp.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:].strip())
+                elif not line:
+                    if event == "notification" and data:
+                        yield json.loads("\n".join(data))
+                    event, data = "", []
 
     async def verify_credentials(self) -> bool:
         try:
-            async with httpx.AsyncClient() as http:
-                resp = await http.get(
-                    self._url("/accounts/verify_credentials"),
-                    headers=self._headers(),
-                )
-                resp.raise_for_status()
-                return True
+            resp = await self._get_http().get(
+                self._url("/accounts/verify_credentials"),
+                headers=self._headers(),
+            )
+            resp.raise_for_status()
+            return True
         except Exception:
             return False
@@ -0,0 +1,382 @@
+"""Publishing and metrics collection for queue items and account timelines.
+
+These are the units of work run by the job queue. Each is safe to retry:
+publishes go through the ledger, and transient platform failures raise
+jobs.RetryLater until the job's last attempt.
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from models import PostStatus, Tenant, transition_error
+from platforms import get_platform
+import config
+import hashtags
+import jobs
+import ledger
+import sheets
+import telemetry
+import timing
+
+
+DRAFT_PLATFORMS = ["bluesky", "mastodon", "linkedin", "facebook", "instagram"]
+
+# Per-org cap on concurrent platform API calls
+_limits: dict[str, asyncio.Semaphore] = {}
+
+
+def _org_limit(tenant: Tenant) -> asyncio.Semaphore:
+    if tenant.org not in _limits:
+        _limits[tenant.org] = asyncio.Semaphore(tenant.max_concurrency)
+    return _limits[tenant.org]
+
+
+async def publish_draft(content_id: str, plat: str, draft_text: str, thread: bool = False,
+                        org: str = "") -> dict:
+    """Post one draft through the publish ledger so retries never double-post.
+
+    With thread=True, drafts over the platform limit are split into a reply
+    chain instead of being truncated. Each post is sent as soon as its
+    parent's ID is known; a retry resumes the chain where it stopped.
+    """
+    tenant = config.get_tenant(org)
+    try:
+        client = get_platform(plat, tenant)
+    except ValueError as pe:
+        return {"posted": False, "error": str(pe)}
+    # Content IDs are only unique within an org's queue
+    content_id = f"{tenant.org}/{content_id}"
+
+    if not (thread and client.supports_threads):
+        return await _publish_part(client, content_id, plat, draft_text)
+
+    chunks = client.split_thread(draft_text)
+    if len(chunks) == 1:
+        return await _publish_part(client, content_id, plat, chunks[0])
+
+    chain: list[dict] = []
+    for i, chunk in enumerate(chunks):
+        reply_to = {"root": chain[0], "parent": chain[-1]} if chain else None
+        result = await _publish_part(client, content_id, plat, chunk, part=i, reply_to=reply_to)
+        if not result.get("posted"):
+            result["thread"] = [c["post_id"] for c in chain]
+            return result
+        chain.append(result)
+    return {
+        "posted": True,
+        "post_id": chain[0]["post_id"],
+        "url": chain[0].get("url", ""),
+        "thread": [c["post_id"] for c in chain],
+    }
+
+
+async def _publish_part(client, content_id: str, plat: str, text: str,
+                        part: Optional[int] = None, reply_to: Optional[dict] = None) -> dict:
+    key = ledger.make_key(content_id, plat, text, part)
+    # The ledger fsyncs and the sheets are remote: both run off the event loop
+    entry = await asyncio.to_thread(ledger.lookup, key)
+    if entry and entry["state"] == ledger.PUBLISHED:
+        return {"posted": True, "post_id": entry["post_id"], "url": entry["url"],
+                "cid": entry.get("cid", ""), "deduplicated": True}
+
+    circuit = jobs.breaker(f"{client.tenant.org}:{plat}")
+    if not circuit.allow():
+        return {"posted": False, "error": f"{plat} circuit open", "transient": True,
+                "retry_after": circuit.remaining()}
+
+    if entry and entry["state"] == ledger.INTENT and not client.supports_idempotency_key:
+        # A previous attempt may or may not have reached the platform
+        try:
+            with telemetry.timed(f"{plat}.lookup"):
+                existing = await client.find_existing_post(text)
+        except Exception as pe:
+            return {"posted": False, "error": f"Previous attempt unresolved, not retrying: {pe}",
+                    "transient": jobs.is_transient(pe), "retry_after": jobs.retry_after(pe)}
+        if existing:
+            await asyncio.to_thread(ledger.record_result, key, content_id, plat, existing["post_id"],
+                                    existing.get("url", ""), cid=existing.get("cid", ""))
+            return {"posted": True, **existing, "deduplicated": True}
+
+    await asyncio.to_thread(ledger.record_intent, key, content_id, plat)
+    try:
+        async with _org_limit(client.tenant):
+            with telemetry.timed(f"{plat}.post"):
+                result = await client.post(text, idempotency_key=ledger.idempotency_key(key), reply_to=reply_to)
+    except Exception as pe:
+        if ledger.is_definite_failure(pe):
+            await asyncio.to_thread(ledger.record_result, key, content_id, plat, error=str(pe))
+        transient = jobs.is_transient(pe)
+        if transient:
+            circuit.record_failure()
+        return {"posted": False, "error": str(pe), "transient": transient,
+                "retry_after": jobs.retry_after(pe)}
+    circuit.record_success()
+    await asyncio.to_thread(ledger.record_result, key, content_id, plat, result.get("post_id", ""),
+                            result.get("url", ""), cid=result.get("cid", ""))
+    return {"posted": True, **result}
+
+
+async def publish_queue_item(queue_row: int = 0, platforms: Optional[list[str]] = None,
+                             final_attempt: bool = True, thread: bool = False,
+                             org: str = "", content_id: str = "") -> dict:
+    """Post a queue item to its platforms and record the outcome in the sheet.
+
+    Platforms are posted to concurrently. Threads are recorded in post_ids
+    as the list of post IDs in the chain, root first.
+
+    Raises jobs.RetryLater if a platform failed transiently and this is not
+    the final attempt; the sheet is only written once the outcome is final.
+    The item is found by content_id when given, else by queue_row, and
+    must have a status that can move to Posted. The final status goes
+    through the same transition check as the tools; if the item was moved
+    meanwhile (e.g. back to Draft) only its post IDs are recorded.
+    """
+    item = await asyncio.to_thread(sheets.get_queue_item, queue_row, org=org, content_id=content_id)
+    if not item:
+        raise ValueError(f"No item with content_id {content_id}" if content_id else f"No item at row {queue_row}")
+    queue_row = item["row"]
+    error = transition_error(item.get("status", ""), PostStatus.POSTED)
+    if error:
+        raise ValueError(f"Row {queue_row}: {error}")
+
+    draft_fields = {p: item.get(f"{p}_draft", "") for p in DRAFT_PLATFORMS}
+    target_platforms = platforms or [p for p, text in draft_fields.items() if text.strip()]
+
+    content_id = item.get("content_id", "") or f"row-{queue_row}"
+
+    async def publish(plat: str) -> dict:
+        draft_text = draft_fields.get(plat, "")
+        if not draft_text.strip():
+            return {"posted": False, "error": "No draft text"}
+        return await publish_draft(content_id, plat, draft_text, thread, org)
+
+    outcomes = await asyncio.gather(*(publish(p) for p in target_platforms))
+    results = dict(zip(target_platforms, outcomes))
+    post_ids = {
+        plat: r.get("thread") or r["post_id"]
+        for plat, r in results.items() if r.get("posted")
+    }
+
+    retry = [p for p, r in results.items() if r.get("transient")]
+    if retry and not final_attempt:
+        hints = [results[p].get("retry_after") or 0 for p in retry]
+        raise jobs.RetryLater(f"Transient failure on {', '.join(retry)}", retry_after=max(hints))
+
+    any_posted = any(r.get("posted") for r in results.values())
+    new_status = PostStatus.POSTED if any_posted else PostStatus.FAILED
+    posted_at = datetime.now().isoformat()
+    recorded = {"posted_at": posted_at, "post_ids": json.dumps(post_ids)}
+    # By content_id where there is one, in case rows moved while posting
+    target = ([], [item["content_id"]]) if item.get("content_id") else ([queue_row], [])
+    _, rejected = await asyncio.to_thread(sheets.change_queue_status, *target, new_status, [recorded], org=org)
+    if rejected and "status" in rejected[0]:
+        await asyncio.to_thread(sheets.update_queue_row, rejected[0]["row"], recorded, org=org)
+    for plat, pid in post_ids.items():
+        root = pid[0] if isinstance(pid, list) else pid
+        timing.record_posted(org, plat, root, posted_at)
+        hashtags.record_posted(org, plat, root, draft_fields[plat], content_id)
+    return {
+        "row": queue_row,
+        "status": rejected[0].get("status", "") if rejected else new_status.value,
+        **({"error": rejected[0]["error"]} if rejected else {}),
+        "results": results,
+        "post_ids": post_ids,
+    }
+
+
+async def refresh_post_metrics(post_id: str, plat: str = "", thread: Optional[list[str]] = None,
+                               org: str = "") -> dict:
+    """Fetch metrics for one post and write them to the analytics sheet.
+
+    For a thread, metrics are summed over every post in the chain and
+    recorded against the root post; the chain's own replies are not counted.
+    """
+    if not plat:
+        record = await asyncio.to_thread(sheets.get_analytics_for_post, post_id, org=org)
+        if not record:
+            raise ValueError(f"No record for post {post_id}")
+        plat = record.get("platform", "")
+
+    tenant = config.get_tenant(org)
+    client = get_platform(plat, tenant)
+    circuit = jobs.breaker(f"{tenant.org}:{plat}")
+    if not circuit.allow():
+        raise jobs.RetryLater(f"{plat} circuit open", retry_after=circuit.remaining())
+    try:
+        async with _org_limit(tenant):
+            with telemetry.timed(f"{plat}.metrics"):
+                if thread and len(thread) > 1:
+                    parts = await asyncio.gather(*(client.get_metrics(pid) for pid in thread))
+                    metrics = {k: sum(m.get(k, 0) for m in parts) for k in ("likes", "reposts", "replies", "impressions")}
+                    metrics["replies"] = max(0, metrics["replies"] - (len(thread) - 1))
+                else:
+                    metrics = await client.get_metrics(post_id)
+    except Exception as exc:
+        if jobs.is_transient(exc):
+            circuit.record_failure()
+        raise
+    circuit.record_success()
+    await asyncio.to_thread(sheets.update_analytics, post_id, {**metrics, "platform": plat}, org=org)
+    timing.record_metrics(org, plat, post_id, metrics)
+    hashtags.record_metrics(org, post_id, metrics)
+    return {"post_id": post_id, "platform": plat, "metrics": metrics}
+
+
+# --- Account timeline sync ---
+
+# Harvested metrics are written, and the position saved, every this many pages
+_SYNC_FLUSH_PAGES = 25
+_METRICS = ("likes", "reposts", "replies", "impressions")
+
+
+def _local_time(timestamp: str) -> str:
+    """A platform's ISO timestamp in local time, like the sheets' own timestamps; "" if unparseable."""
+    try:
+        when = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return ""
+    if when.tzinfo is not None:
+        when = when.astimezone().replace(tzinfo=None)
+    return when.isoformat(timespec="seconds")
+
+
+def _load_sync_state() -> dict:
+    try:
+        with open(config.TIMELINE_STATE_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_sync_state(key: str, value: dict):
+    """Atomically record one org and platform's timeline position."""
+    state = _load_sync_state()
+    state[key] = value
+    path = Path(config.TIMELINE_STATE_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _timeline_metrics(post_ids: list[str], posts: dict[str, dict], links: dict[str, tuple[str, list[str]]],
+                      plat: str) -> dict[str, dict]:
+    """Analytics updates for harvested posts, with queued threads summed onto their root."""
+    metrics = {}
+    for post_id in post_ids:
+        content_id, thread = links.get(post_id, ("", []))
+        if thread and post_id != thread[0]:
+            continue
+        parts = [posts.get(pid) for pid in thread] if thread else [posts[post_id]]
+        if None in parts:
+            # Part of the chain wasn't harvested; left to refresh_post_metrics
+            continue
+        totals = {k: sum(p[k] for p in parts) for k in _METRICS}
+        # Replies within our own thread aren't engagement
+        totals["replies"] = max(0, totals["replies"] - (len(parts) - 1))
+        metrics[post_id] = {**totals, "platform": plat, "posted_at": posts[post_id]["posted_at"]}
+        if content_id:
+            metrics[post_id]["content_id"] = content_id
+    return metrics
+
+
+async def sync_timeline(plat: str, full: bool = False, org: str = "") -> dict:
+    """Harvest metrics for the account's own posts from its timeline into analytics.
+
+    Pages through the timeline newest first and upserts every post in
+    bulk, including posts that never went through the queue. Queued
+    threads are summed onto their root, as refresh_post_metrics does.
+
+    The first sync, or one with full=True, walks the whole timeline. Later
+    syncs stop once past both the newest post of the previous sync and
+    TIMELINE_LOOKBACK_DAYS. Progress is saved every _SYNC_FLUSH_PAGES
+    pages, so an interrupted walk resumes where it stopped.
+    """
+    tenant = config.get_tenant(org)
+    client = get_platform(plat, tenant)
+    if not client.supports_timeline:
+        raise ValueError(f"{plat} has no account timeline to sync")
+    key = f"{tenant.org}:{plat}"
+    state = {} if full else _load_sync_state().get(key, {})
+    walk = state.get("walk") or {}
+    stop_before = ""
+    if state.get("newest"):
+        cutoff = (datetime.now() - timedelta(days=config.TIMELINE_LOOKBACK_DAYS)).isoformat(timespec="seconds")
+        stop_before = min(state["newest"], cutoff)
+    links = await asyncio.to_thread(sheets.get_post_links, org=org)
+    circuit = jobs.breaker(f"{tenant.org}:{plat}")
+
+    posts: dict[str, dict] = {}
+    pending: list[str] = []
+    cursor, newest = walk.get("page", ""), walk.get("newest", "")
+    pages = written = 0
+
+    async def flush() -> int:
+        metrics = _timeline_metrics(pending, posts, links, plat)
+        await asyncio.to_thread(sheets.update_analytics_many, metrics, org=org)
+        for post_id, values in metrics.items():
+            timing.record_posted(org, plat, post_id, values["posted_at"])
+            timing.record_metrics(org, plat, post_id, values)
+            hashtags.record_metrics(org, post_id, values)
+        pending.clear()
+        return len(metrics)
+
+    while True:
+        if not circuit.allow():
+            raise jobs.RetryLater(f"{plat} circuit open", retry_after=circuit.remaining())
+        try:
+            async with _org_limit(tenant):
+                with telemetry.timed(f"{plat}.timeline"):
+                    page, cursor = await client.get_timeline(cursor)
+        except Exception as exc:
+            if jobs.is_transient(exc):
+                circuit.record_failure()
+            raise
+        circuit.record_success()
+        pages += 1
+        for post in page:
+            post["posted_at"] = _local_time(post["posted_at"])
+            posts[post["post_id"]] = post
+            pending.append(post["post_id"])
+            newest = max(newest, post["posted_at"])
+        if not cursor or (stop_before and page and page[-1]["posted_at"] < stop_before):
+            break
+        if pages % _SYNC_FLUSH_PAGES == 0:
+            written += await flush()
+            _save_sync_state(key, {**state, "walk": {"page": cursor, "newest": newest}})
+    written += await flush()
+    _save_sync_state(key, {"newest": newest or state.get("newest", ""), "synced_at": datetime.now().isoformat()})
+    return {"platform": plat, "pages": pages, "posts": written, "newest": newest}
+
+
+@jobs.register("publish")
+async def _publish_job(payload: dict, final_attempt: bool) -> dict:
+    return await publish_queue_item(
+        payload.get("queue_row", 0), payload.get("platforms") or None, final_attempt,
+        payload.get("thread", False), payload.get("org", ""), payload.get("content_id", ""),
+    )
+
+
+@jobs.register("metrics")
+async def _metrics_job(payload: dict, final_attempt: bool) -> dict:
+    return await refresh_post_metrics(
+        payload["post_id"], payload.get("platform", ""), payload.get("thread"),
+        payload.get("org", ""),
+    )
+
+
+@jobs.register("timeline")
+async def _timeline_job(payload: dict, final_attempt: bool) -> dict:
+    return await sync_timeline(payload["platform"], payload.get("full", False), payload.get("org", ""))
@@ -1,47 +1,163 @@
 """Social Media Management MCP Server - FastMCP entry point."""
 
+import asyncio
+import base64
+import hashlib
+import importlib
 import json
 import os
 import sys
-from datetime import datetime
+import threading
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Optional
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from mcp.server import FastMCP
 
-from models import QueueItem, PostStatus, Platform, LIVE_PLATFORMS, STUB_PLATFORMS, PLATFORM_LIMITS
-from platforms import get_platform
+from models import (
+    QueueItem, PostStatus, Platform, LIVE_PLATFORMS, STUB_PLATFORMS, PLATFORM_LIMITS, transition_error,
+)
+from platforms import close_all, get_platform
+import audience
 import config
 import content
+import hashtags
+import jobs
+import publisher  # noqa: F401  (registers job handlers)
 import sheets
+import similarity
+import streaming
+import telemetry
+import timing
+import variants
 
-mcp = FastMCP("social-media")
+
+def _warm_up():
+    """Import the heavy SDKs the configured orgs will use, off the request path."""
+    tenants = config.get_tenants().values()
+    modules = ["gspread", "google.oauth2.service_account"]
+    if any(t.openai_api_key for t in tenants):
+        modules.append("openai")
+    if any(t.bluesky_handle for t in tenants):
+        modules.append("atproto")
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            # The tool that needs it will report the error
+            pass
+
+
+@asynccontextmanager
+async def _process_resources():
+    # Resume jobs left over from a previous run, drain in-flight ones on exit
+    jobs.start_workers()
+    streaming.start()
+    audience.start()
+    telemetry.start_prometheus_endpoint()
+    if config.WARMUP:
+        threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
+    try:
+        yield
+    finally:
+        await jobs.stop_workers(timeout=config.DRAIN_SECONDS)
+        await streaming.stop()
+        await audience.stop()
+        await close_all()
+
+
+# True when serving many sessions over HTTP; the daemon then owns the
+# process resources and per-session lifespans leave them alone
+_daemon = False
+
+
+@asynccontextmanager
+async def _lifespan(server: FastMCP):
+    if _daemon:
+        yield {}
+        return
+    async with _process_resources():
+        yield {}
+
+
+mcp = FastMCP("social-media", lifespan=_lifespan, host=config.HTTP_HOST, port=config.HTTP_PORT)
+
+
+def _error(e: Exception) -> str:
+    telemetry.note_tool_error(e)
+    return json.dumps({"success": False, "error": str(e)})
+
+
+async def _near_duplicates(org: str, content_id: str, row: int = 0,
+                           drafts: Optional[dict[str, str]] = None) -> list[dict]:
+    """Other queue items nearly the same as an item, or as drafts about to become content_id.
+
+    Only advisory: if the lookup fails (e.g. Sheets is unreachable while
+    building the index) this returns [] rather than failing the tool.
+    """
+    try:
+        if drafts is not None:
+            return await asyncio.to_thread(similarity.find_similar, org, drafts, exclude=content_id)
+        return await asyncio.to_thread(similarity.duplicates_of, org, content_id, row=row)
+    except Exception:
+        return []
 
 
 @mcp.tool()
-async def sm_create_content(topic: str, platforms: str = "bluesky,mastodon", tone: str = "", org: str = "") -> str:
+@telemetry.instrument_tool
+async def sm_create_content(topic: str, platforms: str = "bluesky,mastodon", tone: str = "", org: str = "",
+                            top_hashtags: int = 0, n_variants: int = 1) -> str:
     """Generate AI content drafts for the given topic and save to the content queue sheet.
 
+    near_duplicates lists existing queue items (including posted and
+    archived ones) with a draft nearly the same as the new ones.
+
+    With n_variants above 1, that many candidates per platform come from
+    one LLM request and are ranked locally (length fit, brand voice avoid
+    terms, similarity to existing items, hashtag/term engagement history).
+    The best becomes the draft; all are kept on the item for sm_pick_variant.
+
     Args:
         topic: The content topic or idea to generate posts about
         platforms: Comma-separated platform names (bluesky, mastodon, linkedin, facebook, instagram)
         tone: Optional tone override (defaults to brand voice)
-        org: Optional organization name override (defaults to brand voice)
+        org: Organization to write for, selecting its brand voice and queue (empty = default org)
+        top_hashtags: Suggest up to this many of each platform's best-performing hashtags to the model (0 = none)
+        n_variants: Candidates to generate and rank per platform (1 to variants.MAX_VARIANTS)
     """
     try:
+        if not 1 <= n_variants <= variants.MAX_VARIANTS:
+            raise ValueError(f"n_variants must be between 1 and {variants.MAX_VARIANTS}")
         platform_list = [p.strip() for p in platforms.split(",") if p.strip()]
-        drafts = await content.generate_content(
-            topic=topic,
-            platforms=platform_list,
-            tone=tone,
-            org=org,
-        )
-        content_id = f"SM-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        proven = None
+        if top_hashtags > 0:
+            proven = {p: await asyncio.to_thread(hashtags.top_hashtags, org, p, top_hashtags) for p in platform_list}
+        tenant = config.get_tenant(org)
+        ranked = {}
+        if n_variants > 1:
+            candidates = await content.generate_variants(topic, platform_list, tone, org, proven, n=n_variants)
+            ranked = {p: await asyncio.to_thread(variants.rank, tenant.org, p, texts)
+                      for p, texts in candidates.items() if texts}
+            drafts = {p: options[0]["text"] for p, options in ranked.items()}
+        else:
+            drafts = await content.generate_content(
+                topic=topic,
+                platforms=platform_list,
+                tone=tone,
+                org=org,
+                top_hashtags=proven,
+            )
+        brand = config.load_brand_voice(tenant.brand_voice_path)
+        # The random suffix keeps items created in the same second apart
+        content_id = f"SM-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
         item = QueueItem(
             content_id=content_id,
             topic=topic,
-            org=org or config.get_brand_voice().get("org_name", ""),
-            tone=tone or config.get_brand_voice().get("tone", ""),
+            org=brand.org_name,
+            tone=tone or brand.tone,
             bluesky_draft=drafts.get("bluesky", ""),
             mastodon_draft=drafts.get("mastodon", ""),
             linkedin_draft=drafts.get("linkedin", ""),
@@ -49,295 +165,926 @@ async def sm_create_content(topic: str, platforms: str = "bluesky,mastodon", ton
             instagram_draft=drafts.get("instagram", ""),
             status=PostStatus.DRAFT,
             created_at=datetime.now().isoformat(),
+            variants=json.dumps({p: [{"text": v["text"], "score": v["score"]} for v in options]
+                                 for p, options in ranked.items()}) if ranked else "",
         )
-        row = sheets.append_queue_item(item)
+        near = await _near_duplicates(tenant.org, content_id, drafts=drafts)
+        row = await asyncio.to_thread(sheets.append_queue_item, item, org=org)
+        await asyncio.to_thread(similarity.index_drafts, tenant.org, content_id, drafts)
         return json.dumps({
             "success": True,
+            "org": tenant.org,
             "content_id": content_id,
             "row": row,
             "platforms": platform_list,
             "drafts": drafts,
+            **({"variants": ranked} if ranked else {}),
+            "near_duplicates": near,
         })
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _error(e)
 
 
 @mcp.tool()
-async def sm_edit_draft(queue_row: int, platform: str, new_text: str) -> str:
+@telemetry.instrument_tool
+async def sm_edit_draft(queue_row: int = 0, platform: str = "", new_text: str = "", content_id: str = "",
+                        org: str = "") -> str:
     """Update a draft's text for a specific platform in the queue.
 
     Args:
         queue_row: The sheet row number of the queue item
         platform: Platform name (bluesky, mastodon, etc.)
         new_text: The new draft text
+        content_id: The item's content_id (stable if rows are sorted or deleted; use instead of queue_row)
+        org: Organization to act for (empty = default org)
     """
     try:
+        if not platform:
+            raise ValueError("platform is required")
+        entry = (await asyncio.to_thread(sheets.find_queue_entries, *_target(queue_row, content_id), org=org))[0]
+        if entry is None:
+            raise ValueError(f"{_describe(queue_row, content_id)}: Not found")
         col_name = f"{platform}_draft"
-        sheets.update_queue_row(queue_row, {col_name: new_text})
-        return json.dumps({"success": True, "row": queue_row, "platform": platform})
+        await asyncio.to_thread(sheets.update_queue_row, entry.row, {col_name: new_text}, org=org)
+        await asyncio.to_thread(similarity.index_drafts, org, entry.content_id, {platform: new_text})
+        return json.dumps({"success": True, "row": entry.row, "content_id": entry.content_id,
+                           "platform": platform})
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _error(e)
 
 
 @mcp.tool()
-async def sm_list_queue(status: str = "", limit: int = 20) -> str:
-    """List content queue items, optionally filtered by status.
+@telemetry.instrument_tool
+async def sm_pick_variant(queue_row: int = 0, platform: str = "", variant: int = 0, content_id: str = "",
+                          org: str = "") -> str:
+    """Make one of the candidates stored by sm_create_content(n_variants=...) the platform's draft.
 
     Args:
-        status: Filter by status (Draft, Pending Review, Approved, Scheduled, Posted, Failed)
-        limit: Maximum items to return
+        queue_row: The sheet row number of the queue item
+        platform: Platform name (bluesky, mastodon, etc.)
+        variant: Position in the item's ranked variants for the platform (0 = best-ranked)
+        content_id: The item's content_id (stable if rows are sorted or deleted; use instead of queue_row)
+        org: Organization to act for (empty = default org)
     """
     try:
-        items = sheets.get_queue_items(status_filter=status, limit=limit)
-        return json.dumps({"success": True, "count": len(items), "items": items})
+        if not platform:
+            raise ValueError("platform is required")
+        entry = (await asyncio.to_thread(sheets.find_queue_entries, *_target(queue_row, content_id), org=org))[0]
+        if entry is None:
+            raise ValueError(f"{_describe(queue_row, content_id)}: Not found")
+        values = (await asyncio.to_thread(sheets.get_queue_rows, [entry.row], org=org)).get(entry.row, {})
+        try:
+            stored = json.loads(values.get("variants") or "{}")
+        except json.JSONDecodeError:
+            stored = {}
+        options = stored.get(platform) or [] if isinstance(stored, dict) else []
+        if not 0 <= variant < len(options):
+            raise ValueError(f"{_describe(queue_row, content_id)}: No variant {variant} for {platform} "
+                             f"({len(options)} stored)")
+        text = options[variant]["text"]
+        await asyncio.to_thread(sheets.update_queue_row, entry.row, {f"{platform}_draft": text}, org=org)
+        await asyncio.to_thread(similarity.index_drafts, org, entry.content_id, {platform: text})
+        return json.dumps({"success": True, "row": entry.row, "content_id": entry.content_id,
+                           "platform": platform, "variant": variant, "text": text})
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _error(e)
+
+
+DEFAULT_QUEUE_FIELDS = ("row", "content_id", "status", "topic", "created_at", "scheduled_for", "platforms")
+
+
+def _split(value: str) -> list[str]:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def _encode_cursor(key: list, filters: str) -> str:
+    raw = json.dumps({"k": key, "f": filters}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, filters: str) -> list:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        key = data["k"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if data.get("f") != filters:
+        raise ValueError("Cursor was issued for different filters or sort order")
+    return key
+
+
+@mcp.tool()
+@telemetry.instrument_tool
+async def sm_list_queue(status: str = "", limit: int = 20, cursor: str = "", sort: str = "oldest",
+                        fields: str = "", platforms: str = "", since: str = "", until: str = "",
+                        date_field: str = "created_at", org: str = "") -> str:
+    """List content queue items a page at a time.
+
+    Pass the returned next_cursor (with the same filters and sort) to get
+    the next page; it is null on the last page.
+
+    Args:
+        status: Comma-separated statuses to include (Draft, Pending Review, Approved,
+            Scheduled, Posted, Failed); empty = all
+        limit: Maximum items per page
+        cursor: next_cursor from the previous page
+        sort: oldest, newest, or created_at / scheduled_for / posted_at (prefix "-" for descending)
+        fields: Comma-separated fields to return; default row, content_id, status, topic,
+            created_at, scheduled_for, platforms. "all" returns every column including drafts
+        platforms: Comma-separated platforms; only items with a draft for one of them
+        since: Only items whose date_field is on or after this ISO date/time
+        until: Only items whose date_field is on or before this ISO date/time
+        date_field: Date the since/until range applies to: created_at, scheduled_for or posted_at
+        org: Organization to act for (empty = default org)
+    """
+    try:
+        statuses = _split(status)
+        valid = {s.value.lower() for s in PostStatus}
+        unknown = [s for s in statuses if s.lower() not in valid]
+        if unknown:
+            raise ValueError(f"Unknown status: {', '.join(unknown)}. Available: {[s.value for s in PostStatus]}")
+        plats = [p.lower() for p in _split(platforms)]
+        unknown = [p for p in plats if p not in {pl.value for pl in Platform}]
+        if unknown:
+            raise ValueError(f"Unknown platform: {', '.join(unknown)}. Available: {[p.value for p in Platform]}")
+
+        descending = sort.startswith("-") or sort == "newest"
+        sort_field = "row" if sort in ("oldest", "newest") else sort.lstrip("-")
+
+        columns = await asyncio.to_thread(sheets.queue_header, org)
+        available = ["row", *columns, "platforms"]
+        wanted = available if fields.strip() == "all" else (_split(fields) or list(DEFAULT_QUEUE_FIELDS))
+        unknown = [f for f in wanted if f not in available]
+        if unknown:
+            raise ValueError(f"Unknown field: {', '.join(unknown)}. Available: {available}")
+
+        filters = hashlib.sha256(json.dumps(
+            [sorted(s.lower() for s in statuses), sorted(plats), since, until, date_field, sort_field, descending]
+        ).encode()).hexdigest()[:12]
+        after = _decode_cursor(cursor, filters) if cursor else None
+
+        page, next_key, total = await asyncio.to_thread(
+            sheets.list_queue, tuple(statuses), tuple(plats), since, until, date_field, sort_field, descending,
+            after, max(1, limit), org,
+        )
+        # Only read rows from the sheet when a field isn't in the index
+        full = {}
+        if any(f not in sheets.INDEX_FIELDS for f in wanted):
+            full = await asyncio.to_thread(sheets.get_queue_rows, [e.row for e in page], org=org)
+        items = []
+        for entry in page:
+            item = {}
+            for f in wanted:
+                if f == "platforms":
+                    item[f] = list(entry.platforms)
+                elif f in sheets.INDEX_FIELDS:
+                    item[f] = entry.get(f)
+                else:
+                    item[f] = full[entry.row].get(f, "")
+            items.append(item)
+        return json.dumps({
+            "success": True,
+            "count": len(items),
+            "total": total,
+            "items": items,
+            "next_cursor": _encode_cursor(next_key, filters) if next_key else None,
+        })
+    except Exception as e:
+        return _error(e)
+
+
+def _parse_status(value: str) -> PostStatus:
+    try:
+        return PostStatus(value)
+    except ValueError:
+        raise ValueError(f"Unknown status: {value}. Available: {[s.value for s in PostStatus]}")
+
+
+def _parse_time(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise ValueError(f"Not an ISO date/time: {value}")
+
+
+def _target(queue_row: int, content_id: str) -> tuple[list[int], list[str]]:
+    """rows and content_ids lists for a tool addressing a single item."""
+    if bool(queue_row) == bool(content_id):
+        raise ValueError("Pass either queue_row or content_id")
+    return ([queue_row], []) if queue_row else ([], [content_id])
+
+
+def _describe(row: Optional[int], content_id: str) -> str:
+    return f"Row {row}" if row else f"Content {content_id}"
+
+
+def _bulk_result(updated: list[dict], rejected: list[dict]) -> str:
+    if rejected:
+        return json.dumps({
+            "success": False,
+            "error": f"{len(rejected)} of {len(updated) + len(rejected)} items rejected; nothing was changed",
+            "rejected": rejected,
+        })
+    return json.dumps({"success": True, "count": len(updated), "updated": updated})
+
+
+def _single_result(updated: list[dict], rejected: list[dict]) -> str:
+    if rejected:
+        r = rejected[0]
+        return json.dumps({"success": False,
+                           "error": f"{_describe(r.get('row'), r.get('content_id'))}: {r['error']}"})
+    return json.dumps({"success": True, **updated[0]})
 
 
 @mcp.tool()
-async def sm_approve(queue_row: int) -> str:
+@telemetry.instrument_tool
+async def sm_approve(queue_row: int = 0, content_id: str = "", org: str = "") -> str:
     """Mark a queue item as Approved for posting.
 
+    The result's near_duplicates lists other queue items nearly the same
+    as this one, e.g. already posted; approval goes ahead regardless.
+
     Args:
         queue_row: The sheet row number to approve
+        content_id: The item's content_id (use instead of queue_row)
+        org: Organization to act for (empty = default org)
     """
     try:
-        sheets.update_queue_row(queue_row, {"status": PostStatus.APPROVED.value})
-        return json.dumps({"success": True, "row": queue_row, "status": "Approved"})
+        updated, rejected = await asyncio.to_thread(
+            sheets.change_queue_status, *_target(queue_row, content_id), PostStatus.APPROVED, org=org,
+        )
+        if updated and not rejected:
+            item = updated[0]
+            item["near_duplicates"] = await _near_duplicates(org, item["content_id"], item["row"])
+        return _single_result(updated, rejected)
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _error(e)
 
 
 @mcp.tool()
-async def sm_schedule(queue_row: int, scheduled_for: str) -> str:
+@telemetry.instrument_tool
+async def sm_schedule(queue_row: int = 0, scheduled_for: str = "", content_id: str = "", org: str = "") -> str:
     """Schedule an approved queue item for a specific publish time.
 
     Args:
         queue_row: The sheet row number to schedule
         scheduled_for: ISO datetime string for when to publish
+        content_id: The item's content_id (use instead of queue_row)
+        org: Organization to act for (empty = default org)
     """
     try:
-        sheets.update_queue_row(queue_row, {
-            "status": PostStatus.SCHEDULED.value,
-            "scheduled_for": scheduled_for,
-        })
-        return json.dumps({"success": True, "row": queue_row, "status": "Scheduled", "scheduled_for": scheduled_for})
+        _parse_time(scheduled_for)
+        return _single_result(*await asyncio.to_thread(
+            sheets.change_queue_status, *_target(queue_row, content_id), PostStatus.SCHEDULED,
+            [{"scheduled_for": scheduled_for}], org=org,
+        ))
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _error(e)
 
 
 @mcp.tool()
-async def sm_update_status(queue_row: int, status: str) -> str:
+@telemetry.instrument_tool
+async def sm_update_status(queue_row: int = 0, status: str = "", content_id: str = "", force: bool = False,
+                           org: str = "") -> str:
     """Manually update a queue item's status.
 
     Args:
         queue_row: The sheet row number
         status: New status (Draft, Pending Review, Approved, Scheduled, Posted, Failed)
+        content_id: The item's content_id (use instead of queue_row)
+        force: Skip the allowed-transition check (for correcting the sheet by hand)
+        org: Organization to act for (empty = default org)
     """
     try:
-        sheets.update_queue_row(queue_row, {"status": status})
-        return json.dumps({"success": True, "row": queue_row, "status": status})
+        return _single_result(*await asyncio.to_thread(
+            sheets.change_queue_status, *_target(queue_row, content_id), _parse_status(status), force=force, org=org,
+        ))
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _error(e)
 
 
 @mcp.tool()
-async def sm_post_now(queue_row: int, platforms: str = "") -> str:
-    """Post a queue item immediately to specified (or all drafted) platforms.
+@telemetry.instrument_tool
+async def sm_bulk_approve(rows: Optional[list[int]] = None, content_ids: Optional[list[str]] = None,
+                          org: str = "") -> str:
+    """Approve many queue items in one call.
+
+    All or nothing: if any item is missing or can't be approved from its
+    current status, nothing is changed and the rejected items are listed.
 
     Args:
-        queue_row: The sheet row number to post
-        platforms: Comma-separated platforms to post to (empty = all with drafts)
+        rows: Sheet row numbers to approve
+        content_ids: Content IDs to approve
+        org: Organization to act for (empty = default org)
     """
     try:
-        item = sheets.get_queue_item(queue_row)
-        if not item:
-            return json.dumps({"success": False, "error": f"No item at row {queue_row}"})
-
-        # Determine which platforms to post to
-        draft_fields = {
-            "bluesky": item.get("bluesky_draft", ""),
-            "mastodon": item.get("mastodon_draft", ""),
-            "linkedin": item.get("linkedin_draft", ""),
-            "facebook": item.get("facebook_draft", ""),
-            "instagram": item.get("instagram_draft", ""),
+        return _bulk_result(*await asyncio.to_thread(sheets.change_queue_status, rows, content_ids,
+                                                     PostStatus.APPROVED, org=org))
+    except Exception as e:
+        return _error(e)
+
+
+@mcp.tool()
+@telemetry.instrument_tool
+async def sm_bulk_schedule(rows: Optional[list[int]] = None, content_ids: Optional[list[str]] = None,
+                           times: Optional[list[str]] = None, start: str = "", interval_minutes: int = 0,
+                           org: str = "") -> str:
+    """Schedule many approved queue items in one call.
+
+    Give either one time per item, or a start time and spacing. Items are
+    taken in order: rows first, then content_ids. All or nothing, like
+    sm_bulk_approve.
+
+    Args:
+        rows: Sheet row numbers to schedule
+        content_ids: Content IDs to schedule
+        times: ISO datetimes, one per item in order
+        start: ISO datetime for the first item when times is not given
+        interval_minutes: Minutes between consecutive items after start
+        org: Organization to act for (empty = default org)
+    """
+    try:
+        count = len(rows or []) + len(content_ids or [])
+        if times:
+            if len(times) != count:
+                raise ValueError(f"Got {len(times)} times for {count} items")
+            for t in times:
+                _parse_time(t)
+        elif start:
+            first = _parse_time(start)
+            times = [(first + timedelta(minutes=interval_minutes * i)).isoformat() for i in range(count)]
+        else:
+            raise ValueError("Pass times (one per item) or start with interval_minutes")
+        return _bulk_result(*await asyncio.to_thread(
+            sheets.change_queue_status, rows, content_ids, PostStatus.SCHEDULED,
+            [{"scheduled_for": t} for t in times], org=org,
+        ))
+    except Exception as e:
+        return _error(e)
+
+
+@mcp.tool()
+@telemetry.instrument_tool
+async def sm_bulk_update_status(status: str, rows: Optional[list[int]] = None,
+                                content_ids: Optional[list[str]] = None, force: bool = False,
+                                org: str = "") -> str:
+    """Set the status of many queue items in one call.
+
+    All or nothing, like sm_bulk_approve.
+
+    Args:
+        status: New status (Draft, Pending Review, Approved, Scheduled, Posted, Failed)
+        rows: Sheet row numbers to update
+        content_ids: Content IDs to update
+        force: Skip the allowed-transition check (for correcting the sheet by hand)
+        org: Organization to act for (empty = default org)
+    """
+    try:
+        return _bulk_result(*await asyncio.to_thread(sheets.change_queue_status, rows, content_ids,
+                                                     _parse_status(status), force=force, org=org))
+    except Exception as e:
+        return _error(e)
+
+
+@mcp.tool()
+@telemetry.instrument_tool
+async def sm_suggest_post_times(platform: str = "", top: int = 5, schedule: bool = False,
+                                content_ids: Optional[list[str]] = None, min_gap_hours: float = 3,
+                                days_ahead: int = 7, org: str = "") -> str:
+    """Suggest the best hours of the week to post, learned from past engagement.
+
+    Slots are ranked by expected engagement (likes, plus boosts/reposts and
+    replies counted double) of posts published in that hour, with a
+    confidence from 0 to 1 reflecting how many posts it is based on. Times
+    are the server's local time.
+
+    With schedule=True, also schedules Approved items into the best open
+    hours of the next days_ahead days, keeping min_gap_hours between posts
+    (including ones already scheduled). All or nothing, like sm_bulk_schedule.
+
+    Args:
+        platform: Platform to learn from (empty = all, each relative to its own average)
+        top: Number of slots to return
+        schedule: Schedule Approved items into the best open slots
+        content_ids: Items to schedule (empty = every Approved item, oldest first)
+        min_gap_hours: Minimum hours between scheduled posts
+        days_ahead: How far ahead to schedule
+        org: Organization to act for (empty = default org)
+    """
+    try:
+        expected, confidence, posts = await asyncio.to_thread(timing.expected_engagement, org, platform)
+        if not posts:
+            return json.dumps({"success": True, "platform": platform or "all", "posts": 0, "slots": [],
+                               "note": "No posts with metrics yet; refresh analytics after posting"})
+        ranked = sorted(range(timing.SLOTS), key=lambda s: (-expected[s], s))[:top]
+        result = {
+            "success": True,
+            "platform": platform or "all",
+            "posts": posts,
+            "slots": [{
+                "slot": timing.slot_label(s),
+                "expected_engagement": round(float(expected[s]), 2),
+                "confidence": round(float(confidence[s]), 2),
+                "next": timing.next_time(s).isoformat(),
+            } for s in ranked],
         }
+        if not schedule:
+            return json.dumps(result)
 
-        if platforms:
-            target_platforms = [p.strip() for p in platforms.split(",") if p.strip()]
+        if content_ids:
+            rows, ids = [], content_ids
         else:
-            target_platforms = [p for p, text in draft_fields.items() if text.strip()]
-
-        results = {}
-        post_ids = {}
-        for plat in target_platforms:
-            draft_text = draft_fields.get(plat, "")
-            if not draft_text.strip():
-                results[plat] = {"posted": False, "error": "No draft text"}
-                continue
+            approved, _, _ = await asyncio.to_thread(sheets.list_queue, (PostStatus.APPROVED.value,),
+                                                     sort="created_at", limit=1000, org=org)
+            rows, ids = [e.row for e in approved], []
+        count = len(rows) + len(ids)
+        if not count:
+            return json.dumps({**result, "scheduled": []})
+        booked, _, _ = await asyncio.to_thread(sheets.list_queue, (PostStatus.SCHEDULED.value,), limit=1000,
+                                               org=org)
+        taken = []
+        for entry in booked:
             try:
-                client = get_platform(plat)
-                result = await client.post(draft_text)
-                pid = result.get("post_id", "")
-                post_ids[plat] = pid
-                results[plat] = {"posted": True, "post_id": pid, "url": result.get("url", "")}
-            except Exception as pe:
-                results[plat] = {"posted": False, "error": str(pe)}
-
-        any_posted = any(r.get("posted") for r in results.values())
-        new_status = PostStatus.POSTED.value if any_posted else PostStatus.FAILED.value
-        sheets.update_queue_row(queue_row, {
-            "status": new_status,
-            "posted_at": datetime.now().isoformat(),
-            "post_ids": json.dumps(post_ids),
-        })
+                when = datetime.fromisoformat(entry.scheduled_for)
+            except ValueError:
+                continue
+            taken.append(when.astimezone().replace(tzinfo=None) if when.tzinfo else when)
+        times = timing.pick_times(expected, count, taken, min_gap_hours, days_ahead)
+        if len(times) < count:
+            raise ValueError(f"Only {len(times)} open slots for {count} items in the next {days_ahead} days; "
+                             "lower min_gap_hours or raise days_ahead")
+        updated, rejected = await asyncio.to_thread(
+            sheets.change_queue_status, rows, ids, PostStatus.SCHEDULED,
+            [{"scheduled_for": t.isoformat()} for t in times], org=org,
+        )
+        if rejected:
+            return _bulk_result(updated, rejected)
+        return json.dumps({**result, "scheduled": updated})
+    except Exception as e:
+        return _error(e)
 
-        return json.dumps({
-            "success": True,
-            "row": queue_row,
-            "status": new_status,
-            "results": results,
-            "post_ids": post_ids,
-        })
+
+@mcp.tool()
+@telemetry.instrument_tool
+async def sm_post_now(queue_row: int = 0, platforms: str = "", wait: bool = False, thread: bool = False,
+                      content_id: str = "", org: str = "") -> str:
+    """Queue a queue item for immediate posting to specified (or all drafted) platforms.
+
+    Returns a job_id right away; transient platform errors are retried with
+    backoff. Safe to retry: while the item's publish job is queued or running
+    its job_id is returned again, and platforms that already received this
+    exact draft are skipped and their recorded post IDs reused. near_duplicates lists
+    other queue items nearly the same as this one; posting goes ahead.
+    Items whose status can't move to Posted (e.g. Draft, Failed) are refused.
+
+    Args:
+        queue_row: The sheet row number to post
+        platforms: Comma-separated platforms to post to (empty = all with drafts)
+        wait: Wait for the publish to finish and return its results
+        thread: Split drafts over the character limit into a reply thread
+            (BlueSky, Mastodon) instead of truncating them
+        content_id: The item's content_id (use instead of queue_row; the job
+            finds the item even if rows move before it runs)
+        org: Organization to act for (empty = default org)
+    """
+    try:
+        entry = (await asyncio.to_thread(sheets.find_queue_entries, *_target(queue_row, content_id),
+                                         check=False, org=org))[0]
+        if entry is None:
+            raise ValueError(f"{_describe(queue_row, content_id)}: Not found")
+        error = transition_error(entry.status, PostStatus.POSTED)
+        if error:
+            raise ValueError(f"{_describe(queue_row, content_id)}: {error}")
+        tenant = config.get_tenant(org)
+        near = await _near_duplicates(tenant.org, entry.content_id, entry.row)
+        target_platforms = [p.strip() for p in platforms.split(",") if p.strip()]
+        # The job finds the item by content_id, so it still posts the right
+        # row if rows move first; a retried call joins the item's queued or
+        # running publish instead of racing it
+        job_id = await asyncio.to_thread(jobs.enqueue, "publish", {
+            "queue_row": entry.row, "content_id": entry.content_id, "platforms": target_platforms,
+            "thread": thread, "org": tenant.org,
+        }, dedupe_key=f"{tenant.org}:{entry.content_id or entry.row}")
+        jobs.start_workers()
+        ref = {"row": entry.row, "content_id": entry.content_id}
+        if not wait:
+            return json.dumps({"success": True, **ref, "job_id": job_id, "status": jobs.QUEUED,
+                               "near_duplicates": near})
+
+        job = await jobs.wait_for(job_id, timeout=config.JOB_WAIT_SECONDS)
+        if job["status"] == jobs.SUCCEEDED:
+            return json.dumps({"success": True, "job_id": job_id, **job["result"], "near_duplicates": near})
+        if job["status"] == jobs.DEAD:
+            return json.dumps({"success": False, "job_id": job_id, "error": job["last_error"]})
+        return json.dumps({"success": True, **ref, "job_id": job_id, "status": job["status"],
+                           "last_error": job["last_error"], "near_duplicates": near})
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _error(e)
 
 
 @mcp.tool()
-async def sm_post_text(text: str, platform: str) -> str:
+@telemetry.instrument_tool
+async def sm_post_text(text: str, platform: str, org: str = "") -> str:
     """Quick one-off post directly to a platform, bypassing the queue.
 
     Args:
         text: The text to post
         platform: Target platform (bluesky, mastodon, etc.)
+        org: Organization to act for (empty = default org)
     """
     try:
-        client = get_platform(platform)
-        result = await client.post(text)
+        client = get_platform(platform, config.get_tenant(org))
+        with telemetry.timed(f"{client.name}.post"):
+            result = await client.post(text)
         return json.dumps({"success": True, "platform": platform, "result": result})
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _error(e)
 
 
 @mcp.tool()
-async def sm_get_analytics(platform: str = "", days: int = 7) -> str:
-    """View posting analytics from the analytics sheet.
+@telemetry.instrument_tool
+async def sm_get_analytics(platform: str = "", days: int = 7, org: str = "") -> str:
+    """View posting analytics from the analytics sheet, newest first.
 
     Args:
         platform: Filter by platform (empty = all)
-        days: Number of days to look back
+        days: Number of days to look back, by posting date (0 = all)
+        org: Organization to act for (empty = default org)
     """
     try:
-        data = sheets.get_analytics(platform=platform, days=days)
+        data = await asyncio.to_thread(sheets.get_analytics, platform=platform, days=days, org=org)
         return json.dumps({"success": True, "days": days, "platform": platform or "all", "count": len(data), "analytics": data})
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _error(e)
+
+
+@mcp.tool()
+@telemetry.instrument_tool
+async def sm_get_archived_analytics(platform: str = "", since: str = "", until: str = "", limit: int = 100,
+                                    org: str = "") -> str:
+    """View analytics for posts moved to the archive by sm_archive_queue.
+
+    Args:
+        platform: Filter by platform (empty = all)
+        since: Only posts from this ISO date/time on (empty = no bound)
+        until: Only posts up to this ISO date/time, inclusive (empty = no bound)
+        limit: Maximum records to return
+        org: Organization to act for (empty = default org)
+    """
+    try:
+        data = await asyncio.to_thread(sheets.get_archived_analytics, platform=platform, since=since,
+                                       until=until, limit=limit, org=org)
+        return json.dumps({"success": True, "platform": platform or "all", "count": len(data), "analytics": data})
+    except Exception as e:
+        return _error(e)
+
+
+@mcp.tool()
+@telemetry.instrument_tool
+async def sm_hashtag_performance(platform: str = "", kind: str = "hashtags", tags: str = "", min_posts: int = 2,
+                                 top: int = 20, org: str = "") -> str:
+    """Reach and engagement per hashtag or term across our published posts, best first.
+
+    Answered from an index of posted drafts and their latest metrics, kept
+    current as posts are published and refreshed. Each entry has the post
+    count, mean likes/reposts/replies/impressions and engagement, and lift:
+    engagement relative to an average post on the same platform (1.0 = average).
+
+    Args:
+        platform: Only posts on this platform (empty = all)
+        kind: "hashtags", "terms" (other words in the posts) or "all"
+        tags: Comma-separated hashtags or terms to report instead of the top ones (e.g. "#civictech,voting")
+        min_posts: Leave out tags used on fewer measured posts than this
+        top: Maximum entries to return
+        org: Organization to act for (empty = default org)
+    """
+    try:
+        result = await asyncio.to_thread(hashtags.performance, org=org, platform=platform, kind=kind,
+                                         tags=tuple(_split(tags)), min_posts=min_posts, top=top)
+        return json.dumps({"success": True, "platform": platform or "all", "kind": kind, **result})
+    except Exception as e:
+        return _error(e)
+
+
+@mcp.tool()
+@telemetry.instrument_tool
+async def sm_get_audience_growth(platform: str = "", days: int = 30, series: bool = False, org: str = "") -> str:
+    """Follower, following and post count changes per platform, from the daily audience snapshots.
+
+    Snapshots are sampled every SM_AUDIENCE_SAMPLE_HOURS while the server
+    runs (by default only the HTTP daemon samples); this reads only what was
+    recorded and calls no platform APIs.
+
+    Args:
+        platform: Only this platform (empty = all with snapshots)
+        days: Number of days to look back
+        series: Also return the daily snapshots in the window
+        org: Organization to act for (empty = default org)
+    """
+    try:
+        data = await asyncio.to_thread(audience.growth, org=org, platform=platform, days=days, series=series)
+        return json.dumps({"success": True, "days": days, "platform": platform or "all", "growth": data})
+    except Exception as e:
+        return _error(e)
+
+
+@mcp.tool()
+@telemetry.instrument_tool
+async def sm_archive_queue(older_than_days: int = 0, dry_run: bool = False, org: str = "") -> str:
+    """Move old Posted and Failed queue items, with their analytics, to the archive tabs.
+
+    Keeps the live Queue and Analytics tabs small so everyday tools stay
+    fast. Archived analytics remain available via sm_get_archived_analytics.
+
+    Args:
+        older_than_days: Archive items posted more than this many days ago (0 = ARCHIVE_AFTER_DAYS)
+        dry_run: Only report what would be moved
+        org: Organization to act for (empty = default org)
+    """
+    try:
+        days = older_than_days or config.ARCHIVE_AFTER_DAYS
+        before = (datetime.now() - timedelta(days=days)).isoformat()
+        moved = await asyncio.to_thread(sheets.archive_queue, before, dry_run=dry_run, org=org)
+        return json.dumps({"success": True, "dry_run": dry_run, "before": before, **moved})
+    except Exception as e:
+        return _error(e)
 
 
 @mcp.tool()
-async def sm_refresh_analytics(post_id: str = "") -> str:
-    """Fetch fresh engagement metrics from platform APIs.
+@telemetry.instrument_tool
+async def sm_refresh_analytics(post_id: str = "", wait: bool = False, org: str = "") -> str:
+    """Queue jobs that fetch fresh engagement metrics from platform APIs.
 
     Args:
         post_id: Specific post ID to refresh (empty = refresh all recent)
+        wait: Wait for the refresh to finish and return the metrics
+        org: Organization to act for (empty = default org)
     """
     try:
+        tenant = config.get_tenant(org)
         if post_id:
-            record = sheets.get_analytics_for_post(post_id)
-            if not record:
-                return json.dumps({"success": False, "error": f"No record for post {post_id}"})
-            plat = record.get("platform", "")
-            client = get_platform(plat)
-            metrics = await client.get_metrics(post_id)
-            sheets.update_analytics(post_id, metrics)
-            return json.dumps({"success": True, "post_id": post_id, "metrics": metrics})
+            targets = [(post_id, "", [])]
         else:
-            recent = sheets.get_recent_post_ids()
-            refreshed = []
-            for pid, plat in recent:
-                try:
-                    client = get_platform(plat)
-                    metrics = await client.get_metrics(pid)
-                    sheets.update_analytics(pid, metrics)
-                    refreshed.append({"post_id": pid, "platform": plat, "metrics": metrics})
-                except Exception as pe:
-                    refreshed.append({"post_id": pid, "platform": plat, "error": str(pe)})
-            return json.dumps({"success": True, "refreshed": refreshed})
+            targets = await asyncio.to_thread(sheets.get_recent_post_ids, org=org)
+        job_ids = [
+            await asyncio.to_thread(jobs.enqueue, "metrics",
+                                    {"post_id": pid, "platform": plat, "thread": thread, "org": tenant.org})
+            for pid, plat, thread in targets
+        ]
+        jobs.start_workers()
+        if not wait:
+            return json.dumps({"success": True, "job_ids": job_ids, "status": jobs.QUEUED})
+
+        refreshed = []
+        for job_id in job_ids:
+            job = await jobs.wait_for(job_id, timeout=config.JOB_WAIT_SECONDS)
+            if job["status"] == jobs.SUCCEEDED:
+                refreshed.append(job["result"])
+            else:
+                refreshed.append({**job["payload"], "job_id": job_id, "status": job["status"],
+                                  "error": job["last_error"]})
+        if post_id:
+            entry = refreshed[0]
+            if "metrics" not in entry:
+                return json.dumps({"success": False, "error": entry["error"] or entry["status"]})
+            return json.dumps({"success": True, **entry})
+        return json.dumps({"success": True, "refreshed": refreshed})
+    except Exception as e:
+        return _error(e)
+
+
+@mcp.tool()
+@telemetry.instrument_tool
+async def sm_sync_timeline(platforms: str = "", full: bool = False, wait: bool = False, org: str = "") -> str:
+    """Queue jobs that harvest metrics for every post on our accounts' timelines.
+
+    Pages through each account's own posts (40 per request on Mastodon,
+    100 on BlueSky) and upserts them into analytics in bulk, including
+    posts that never went through the queue, such as sm_post_text posts.
+    The first sync backfills the whole timeline; later ones read only new
+    posts and those younger than SM_TIMELINE_LOOKBACK_DAYS.
+
+    Args:
+        platforms: Comma-separated platforms (empty = bluesky and mastodon where configured)
+        full: Walk each whole timeline again instead of resuming from the last sync
+        wait: Wait for the syncs to finish and return their results
+        org: Organization to act for (empty = default org)
+    """
+    try:
+        tenant = config.get_tenant(org)
+        targets = _split(platforms) or sorted(p.value for p in LIVE_PLATFORMS
+                                              if config.is_platform_configured(p.value, tenant))
+        for plat in targets:
+            if not get_platform(plat, tenant).supports_timeline:
+                raise ValueError(f"{plat} has no account timeline to sync")
+        job_ids = [
+            await asyncio.to_thread(jobs.enqueue, "timeline", {"platform": plat, "full": full, "org": tenant.org})
+            for plat in targets
+        ]
+        jobs.start_workers()
+        if not wait:
+            return json.dumps({"success": True, "job_ids": job_ids, "status": jobs.QUEUED})
+
+        synced = []
+        for job_id in job_ids:
+            job = await jobs.wait_for(job_id, timeout=config.JOB_WAIT_SECONDS)
+            if job["status"] == jobs.SUCCEEDED:
+                synced.append(job["result"])
+            else:
+                synced.append({**job["payload"], "job_id": job_id, "status": job["status"],
+                               "error": job["last_error"]})
+        return json.dumps({"success": True, "synced": synced})
+    except Exception as e:
+        return _error(e)
+
+
+@mcp.tool()
+@telemetry.instrument_tool
+async def sm_job_status(job_id: str = "", status: str = "", limit: int = 20, org: str = "") -> str:
+    """Report progress of background publish and metrics jobs.
+
+    Args:
+        job_id: A specific job to report on (empty = list recent jobs)
+        status: Filter the list by state (queued, running, succeeded, dead)
+        limit: Maximum jobs to list
+        org: Only list jobs for this organization (empty = all orgs)
+    """
+    try:
+        if job_id:
+            job = await asyncio.to_thread(jobs.get_job, job_id)
+            if not job:
+                return json.dumps({"success": False, "error": f"No job {job_id}"})
+            return json.dumps({"success": True, "job": job})
+        tenant_org = config.get_tenant(org).org if org else ""
+        return json.dumps({
+            "success": True,
+            "counts": await asyncio.to_thread(jobs.counts, org=tenant_org),
+            "circuits": jobs.circuit_states(),
+            "jobs": await asyncio.to_thread(jobs.list_jobs, status=status, limit=limit, org=tenant_org),
+        })
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _error(e)
 
 
 @mcp.tool()
-async def sm_list_accounts() -> str:
-    """Show configured platform accounts and whether they are live or stub."""
+@telemetry.instrument_tool
+async def sm_list_accounts(org: str = "") -> str:
+    """Show configured platform accounts and whether they are live or stub.
+
+    Args:
+        org: Organization to act for (empty = default org)
+    """
     try:
+        tenant = config.get_tenant(org)
         accounts = []
         all_platforms = sorted(set(p.value for p in LIVE_PLATFORMS) | set(p.value for p in STUB_PLATFORMS))
         for plat in all_platforms:
             accounts.append({
                 "platform": plat,
-                "configured": config.is_platform_configured(plat),
+                "configured": config.is_platform_configured(plat, tenant),
                 "mode": "live" if Platform(plat) in LIVE_PLATFORMS else "stub",
             })
-        return json.dumps({"success": True, "accounts": accounts})
+        return json.dumps({"success": True, "org": tenant.org, "accounts": accounts})
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _error(e)
 
 
 @mcp.tool()
-async def sm_test_account(platform: str) -> str:
+@telemetry.instrument_tool
+async def sm_test_account(platform: str, org: str = "") -> str:
     """Verify that credentials work for a platform.
 
     Args:
         platform: Platform name to test (bluesky, mastodon, etc.)
+        org: Organization to act for (empty = default org)
     """
     try:
-        client = get_platform(platform)
-        result = await client.verify_credentials()
+        client = get_platform(platform, config.get_tenant(org))
+        with telemetry.timed(f"{client.name}.verify"):
+            result = await client.verify_credentials()
         return json.dumps({"success": True, "platform": platform, "verified": result})
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _error(e)
 
 
 @mcp.tool()
-async def sm_get_brand_voice() -> str:
-    """Return the current brand voice configuration."""
+@telemetry.instrument_tool
+async def sm_get_brand_voice(org: str = "") -> str:
+    """Return the current brand voice configuration.
+
+    Args:
+        org: Organization to act for (empty = default org)
+    """
     try:
-        voice = config.get_brand_voice()
-        return json.dumps({"success": True, "brand_voice": voice})
+        path = config.get_tenant(org).brand_voice_path
+        voice = config.get_brand_voice(path)
+        return json.dumps({"success": True, "brand_voice": voice, "version": config.brand_voice_version(path)})
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _error(e)
 
 
 @mcp.tool()
-async def sm_set_brand_voice(voice_json: str) -> str:
+@telemetry.instrument_tool
+async def sm_set_brand_voice(voice_json: str, org: str = "") -> str:
     """Update the brand voice configuration.
 
     Args:
         voice_json: JSON string with brand voice settings (org_name, tone, values, avoid, audience, hashtags)
+        org: Organization to act for (empty = default org)
     """
     try:
+        path = config.get_tenant(org).brand_voice_path
         voice = json.loads(voice_json)
-        config.save_brand_voice(voice)
-        return json.dumps({"success": True, "brand_voice": voice})
+        try:
+            config.save_brand_voice(voice, path)
+        except ValueError as e:
+            telemetry.note_tool_error(e)
+            return json.dumps({"success": False, "error": f"Invalid brand voice: {e}"})
+        return json.dumps({
+            "success": True,
+            "brand_voice": config.get_brand_voice(path),
+            "version": config.brand_voice_version(path),
+        })
     except json.JSONDecodeError as e:
+        telemetry.note_tool_error(e)
         return json.dumps({"success": False, "error": f"Invalid JSON: {e}"})
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _error(e)
 
 
 @mcp.tool()
-async def sm_get_platform_status() -> str:
-    """Show which platforms are live (fully implemented) vs stub (placeholder)."""
+@telemetry.instrument_tool
+async def sm_get_platform_status(org: str = "") -> str:
+    """Show which platforms are live (fully implemented) vs stub (placeholder).
+
+    Args:
+        org: Organization whose credentials to check (empty = default org)
+    """
     try:
+        tenant = config.get_tenant(org)
         return json.dumps({
             "success": True,
+            "org": tenant.org,
             "live": [p.value for p in LIVE_PLATFORMS],
             "stub": [p.value for p in STUB_PLATFORMS],
+            "configured": [p.value for p in Platform if config.is_platform_configured(p.value, tenant)],
+        })
+    except Exception as e:
+        return _error(e)
+
+
+@mcp.tool()
+@telemetry.instrument_tool
+async def sm_list_orgs() -> str:
+    """List the organizations this server posts for."""
+    try:
+        default = config.get_tenant().org
+        orgs = []
+        for tenant in config.get_tenants().values():
+            orgs.append({
+                "org": tenant.org,
+                "name": config.load_brand_voice(tenant.brand_voice_path).org_name,
+                "default": tenant.org == default,
+                "platforms": [p.value for p in Platform if config.is_platform_configured(p.value, tenant)],
+            })
+        return json.dumps({"success": True, "orgs": orgs})
+    except Exception as e:
+        return _error(e)
+
+
+@mcp.tool()
+@telemetry.instrument_tool
+async def sm_server_stats() -> str:
+    """Latency percentiles and error counts per tool and per external call (Sheets, LLM, platforms)."""
+    try:
+        return json.dumps({
+            "success": True,
+            **telemetry.snapshot(),
+            "jobs": await asyncio.to_thread(jobs.counts),
+            "circuits": jobs.circuit_states(),
+            "streaming": streaming.status(),
+            "audience": audience.status(),
         })
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        return _error(e)
 
 
 if __name__ == "__main__":
-    mcp.run()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Social media MCP server")
+    parser.add_argument("--http", action="store_true", default=config.TRANSPORT == "http",
+                        help="Serve many clients over streamable HTTP instead of one over stdio")
+    parser.add_argument("--port", type=int, default=config.HTTP_PORT)
+    args = parser.parse_args()
+
+    if args.http:
+        import daemon
+
+        _daemon = True
+        if not os.getenv("SM_AUDIENCE_SAMPLE_HOURS"):
+            config.AUDIENCE_SAMPLE_HOURS = config.DAEMON_AUDIENCE_SAMPLE_HOURS
+        mcp.settings.port = args.port
+        daemon.serve(mcp, _process_resources)
+    else:
+        mcp.run()
@@ -1,168 +1,967 @@
 """Google Sheets integration for content queue and analytics.
 
-Uses gspread with service account for direct API access.
+Uses gspread with service account for direct API access. gspread and
+google-auth are imported on first use to keep server startup fast.
 """
 
+import bisect
 import json
-import os
+import threading
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional
-
-import gspread
-from google.oauth2.service_account import Credentials
+from typing import TYPE_CHECKING, Iterator, Optional
 
 import config
-from models import QueueItem, AnalyticsRecord, PostStatus
+import telemetry
+from models import QueueItem, AnalyticsRecord, AudienceSnapshot, PostStatus, Tenant, transition_error
+
+if TYPE_CHECKING:
+    import gspread
+
+
+# Clients per service-account file and worksheet handles per (sheet, tab),
+# so each org opens its spreadsheet once per process
+_clients: dict[str, "gspread.Client"] = {}
+_worksheets: dict[tuple[str, str], "gspread.Worksheet"] = {}
+# Tabs found missing by a read (which doesn't create them), and when;
+# rechecked after _MISSING_TAB_RECHECK seconds
+_missing_tabs: dict[tuple[str, str], float] = {}
+_MISSING_TAB_RECHECK = 60.0
+# Held while opening a client or tab, so threads opening the same one at
+# once don't both create it
+_open_lock = threading.RLock()
+
+
+def _get_client(creds_path: str = "") -> "gspread.Client":
+    with _open_lock:
+        if creds_path not in _clients:
+            import gspread
+            if creds_path:
+                from google.oauth2.service_account import Credentials
+                creds = Credentials.from_service_account_file(
+                    creds_path,
+                    scopes=[
+                        "https://spreadsheets.google.com/feeds",
+                        "https://www.googleapis.com/auth/drive",
+                    ],
+                )
+                _clients[creds_path] = gspread.authorize(creds)
+            else:
+                _clients[creds_path] = gspread.service_account()
+    return _clients[creds_path]
+
+
+def _get_worksheet(tenant: Tenant, tab: str, header: list[str], cols: int,
+                   create: bool = True) -> Optional["gspread.Worksheet"]:
+    """The tab, created with header if missing; None if missing and not create."""
+    key = (tenant.sheet_id, tab)
+    if key in _worksheets:
+        return _worksheets[key]
+    with _open_lock:
+        if key in _worksheets:
+            return _worksheets[key]
+        import gspread
+        if not create and time.monotonic() - _missing_tabs.get(key, -_MISSING_TAB_RECHECK) < _MISSING_TAB_RECHECK:
+            return None
+        gc = _get_client(tenant.google_credentials_path)
+        spreadsheet = gc.open_by_key(tenant.sheet_id)
+        try:
+            ws = spreadsheet.worksheet(tab)
+        except gspread.WorksheetNotFound:
+            if not create:
+                _missing_tabs[key] = time.monotonic()
+                return None
+            ws = spreadsheet.add_worksheet(title=tab, rows=1000, cols=cols)
+            ws.append_row(header)
+            # We just wrote the header, so there is no need to read it back
+            _note_header(ws, header)
+        _missing_tabs.pop(key, None)
+        _worksheets[key] = ws
+    return ws
+
+
+def _get_queue_sheet(org: str = "") -> "gspread.Worksheet":
+    tenant = config.get_tenant(org)
+    return _get_worksheet(tenant, tenant.queue_tab, QueueItem.header_row(), 20)
+
+
+def _get_analytics_sheet(org: str = "") -> "gspread.Worksheet":
+    tenant = config.get_tenant(org)
+    return _get_worksheet(tenant, tenant.analytics_tab, AnalyticsRecord.header_row(), 15)
+
+
+def _get_audience_sheet(org: str = "") -> "gspread.Worksheet":
+    tenant = config.get_tenant(org)
+    return _get_worksheet(tenant, tenant.audience_tab, AudienceSnapshot.header_row(), 8)
+
+
+# --- Queue columns ---
+# Cells are addressed by column name, through the queue sheet's cached
+# header (see _header below), so most writes need no header read of their
+# own.
+
+def _columns(org: str) -> dict[str, int]:
+    """Column name -> 0-based index for the org's queue sheet."""
+    header = _header(_get_queue_sheet(org)) or QueueItem.header_row()
+    return {name: i for i, name in enumerate(header)}
+
+
+def _trim(values: list[str]) -> list[str]:
+    """values without trailing empty cells, as the API returns a row."""
+    end = len(values)
+    while end and not values[end - 1]:
+        end -= 1
+    return values[:end]
+
+
+def _column_letter(n: int) -> str:
+    letters = ""
+    while n:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+# --- Streaming reads ---
+# Reads that need only some columns, or only the first or last rows of a
+# tab, fetch just those columns a SHEETS_READ_CHUNK_ROWS range at a time
+# (bottom-up for the newest rows) and stop once they have what they need,
+# instead of downloading the whole tab. Each tab's header is cached for
+# QUEUE_INDEX_TTL seconds, or from its creation if we made the tab. Every
+# read that sees the header row (the first request of a streamed read,
+# full reads, row checks) refreshes it, and a streamed read starts over
+# with the new layout if the columns differ.
 
+# (spreadsheet id, tab) -> (time.monotonic() when seen, header)
+_headers: dict[tuple[str, str], tuple[float, list[str]]] = {}
 
-_gc: Optional[gspread.Client] = None
 
+@dataclass(slots=True)
+class SheetRow:
+    """A streamed row: its row number and the values of the columns read."""
+    row: int
+    values: list[str]
+    # Column name -> position in values, shared by every row of a read
+    cols: dict[str, int]
 
-def _get_client() -> gspread.Client:
-    global _gc
-    if _gc is None:
-        creds_path = os.getenv("GOOGLE_CREDENTIALS_PATH", "")
-        if creds_path:
-            creds = Credentials.from_service_account_file(
-                creds_path,
-                scopes=[
-                    "https://spreadsheets.google.com/feeds",
-                    "https://www.googleapis.com/auth/drive",
-                ],
-            )
-            _gc = gspread.authorize(creds)
+    def get(self, name: str, default: str = "") -> str:
+        i = self.cols.get(name)
+        return self.values[i] if i is not None else default
+
+    def as_dict(self) -> dict[str, str]:
+        return {name: self.values[i] for name, i in self.cols.items()}
+
+
+def _header(ws: "gspread.Worksheet") -> list[str]:
+    """ws's cached header, read if none is cached or it is older than QUEUE_INDEX_TTL."""
+    cached = _headers.get((ws.spreadsheet.id, ws.title))
+    if cached is None or time.monotonic() - cached[0] > config.QUEUE_INDEX_TTL:
+        header = _trim(ws.row_values(1))
+        _note_header(ws, header)
+        return header
+    return cached[1]
+
+
+def _note_header(ws: "gspread.Worksheet", header: list[str]) -> bool:
+    """Cache a header just read from ws; False if it differs from the one cached before."""
+    key = (ws.spreadsheet.id, ws.title)
+    cached = _headers.get(key)
+    _headers[key] = (time.monotonic(), _trim(header))
+    return cached is None or cached[1] == _headers[key][1]
+
+
+def _runs(indexes: list[int]) -> list[list[int]]:
+    """Sorted column indexes as [first, last] runs of adjacent columns."""
+    runs = []
+    for i in indexes:
+        if runs and runs[-1][1] == i - 1:
+            runs[-1][1] = i
         else:
-            _gc = gspread.service_account()
-    return _gc
+            runs.append([i, i])
+    return runs
 
 
-def _get_queue_sheet() -> gspread.Worksheet:
-    gc = _get_client()
-    spreadsheet = gc.open_by_key(config.CONTENT_QUEUE_SHEET_ID)
-    try:
-        return spreadsheet.worksheet(config.QUEUE_TAB)
-    except gspread.WorksheetNotFound:
-        ws = spreadsheet.add_worksheet(title=config.QUEUE_TAB, rows=1000, cols=20)
-        ws.append_row(QueueItem.header_row())
-        return ws
+def stream_rows(ws: "gspread.Worksheet", columns: tuple[str, ...] = (), reverse: bool = False,
+                chunk_rows: Optional[int] = None) -> Iterator[SheetRow]:
+    """Yield ws's data rows with only the named columns (every column if none), top down or bottom up.
 
+    Rows are fetched chunk_rows (default SHEETS_READ_CHUNK_ROWS) at a time,
+    each chunk in one request; chunk_rows=0 fetches them all in one, for
+    full scans that only need some columns. Columns the sheet lacks read
+    as "", and rows with none of the columns filled are skipped.
 
-def _get_analytics_sheet() -> gspread.Worksheet:
-    gc = _get_client()
-    spreadsheet = gc.open_by_key(config.CONTENT_QUEUE_SHEET_ID)
-    try:
-        return spreadsheet.worksheet(config.ANALYTICS_TAB)
-    except gspread.WorksheetNotFound:
-        ws = spreadsheet.add_worksheet(title=config.ANALYTICS_TAB, rows=1000, cols=15)
-        ws.append_row(AnalyticsRecord.header_row())
-        return ws
+    Top-down reads run to the grid's last row as last seen, not to the
+    first short chunk (the API leaves out a chunk's trailing empty rows, so
+    a blank row would look like the end); their last chunk is left
+    open-ended to take in rows appended by others since. Bottom-up reads
+    start from that row, with the first chunk open-ended for the same
+    reason; chunks that come back empty (rows deleted since) double the
+    next one's size.
+    """
+    size = config.SHEETS_READ_CHUNK_ROWS if chunk_rows is None else chunk_rows
+    # The first request re-reads a cached header, even an expired one; a
+    # header read just now needs no second look
+    cached = _headers.get((ws.spreadsheet.id, ws.title))
+    header = cached[1] if cached else _header(ws)
+    check = cached is not None
+    end = top = max(ws.row_count, 2)
+    start, span = 2, size
+    while True:
+        if not size:
+            stop = None
+        elif reverse:
+            if top < 2:
+                return
+            start = max(top - span + 1, 2)
+            stop = top if top < end else None
+        else:
+            stop = start + size - 1 if start + size - 1 < end else None
+        while True:
+            names = list(columns) or header
+            cols = {name: i for i, name in enumerate(names)}
+            where = {name: i for i, name in enumerate(header) if name in cols}
+            runs = _runs(sorted(where.values()))
+            ranges = [f"{_column_letter(a + 1)}{start}:{_column_letter(b + 1)}{stop or ''}" for a, b in runs]
+            blocks = ws.batch_get((["1:1"] if check else []) + ranges) if check or ranges else []
+            if check:
+                check = False
+                seen = _trim(blocks[0][0]) if blocks[0] else []
+                blocks = blocks[1:]
+                if not _note_header(ws, seen):
+                    header = seen
+                    continue
+            break
+        if not ranges:
+            return
 
+        height = max((len(b) for b in blocks), default=0)
+        if len(blocks) == 1 and header[runs[0][0]:runs[0][1] + 1] == names:
+            # One range holding the columns in order: pad its rows in place
+            rows = blocks[0]
+            for values in rows:
+                values.extend([""] * (len(cols) - len(values)))
+        else:
+            rows = [[""] * len(cols) for _ in range(height)]
+            for (a, b), block in zip(runs, blocks):
+                targets = [cols[header[c]] for c in range(a, b + 1)]
+                for values, cells in zip(rows, block):
+                    for i, value in zip(targets, cells):
+                        values[i] = value
+        for i in range(len(rows) - 1, -1, -1) if reverse else range(len(rows)):
+            if any(rows[i]):
+                yield SheetRow(start + i, rows[i], cols)
 
-def get_queue_items(status_filter: str = "", limit: int = 50) -> list[dict]:
-    """Read queue items from the sheet."""
-    ws = _get_queue_sheet()
-    rows = ws.get_all_values()
+        if not size or (not reverse and stop is None):
+            return
+        if reverse:
+            top, span = start - 1, size if height else span * 2
+        else:
+            start += size
+
+
+# --- Queue index ---
+# Listing and filtering are served from a per-sheet in-memory summary of the
+# queue rather than a full-sheet read per call. Our own writes update it in
+# place; edits made elsewhere (n8n, people in the sheet) are picked up when
+# it is rebuilt after QUEUE_INDEX_TTL seconds. Tools call in from worker
+# threads, so lookups and updates of an index hold _index_lock; reads of
+# the sheet happen outside it.
+
+@dataclass(slots=True)
+class QueueEntry:
+    """The parts of a queue row needed to filter, sort and summarize it."""
+    row: int
+    content_id: str
+    status: str
+    topic: str
+    created_at: str
+    scheduled_for: str
+    posted_at: str
+    # Platforms with a draft
+    platforms: tuple[str, ...]
+
+    def get(self, field: str):
+        return getattr(self, field)
+
+
+INDEX_FIELDS = tuple(QueueEntry.__dataclass_fields__)
+DATE_FIELDS = ("created_at", "scheduled_for", "posted_at")
+_DRAFT_SUFFIX = "_draft"
+_DRAFT_COLUMNS = tuple(name for name in QueueItem.header_row() if name.endswith(_DRAFT_SUFFIX))
+
+
+class _QueueIndex:
+    def __init__(self, rows: list[list[str]]):
+        self.header = rows[0] if rows else QueueItem.header_row()
+        self.cols = {name: i for i, name in enumerate(self.header)}
+        self.draft_cols = [(name[:-len(_DRAFT_SUFFIX)], i) for name, i in self.cols.items()
+                           if name.endswith(_DRAFT_SUFFIX)]
+        self.entries = [self._entry(i, row) for i, row in enumerate(rows[1:], start=2)]
+        # content_id -> rows holding it (more than one if an ID is repeated)
+        self.rows_by_id: dict[str, list[int]] = {}
+        for e in self.entries:
+            self._add_id(e.content_id, e.row)
+        self.built_at = time.monotonic()
+
+    def at(self, row: int) -> Optional[QueueEntry]:
+        return self.entries[row - 2] if 2 <= row < len(self.entries) + 2 else None
+
+    def find(self, content_id: str) -> Optional[QueueEntry]:
+        """The entry with content_id; ValueError if several rows hold it."""
+        rows = self.rows_by_id.get(content_id)
+        if not rows:
+            return None
+        if len(rows) > 1:
+            raise ValueError(f"content_id {content_id} is on rows {rows}; use queue_row to pick one")
+        return self.at(rows[0])
+
+    def _add_id(self, content_id: str, row: int):
+        if content_id:
+            bisect.insort(self.rows_by_id.setdefault(content_id, []), row)
+
+    def _set_id(self, entry: QueueEntry, content_id: str):
+        rows = self.rows_by_id.get(entry.content_id)
+        if rows and entry.row in rows:
+            rows.remove(entry.row)
+            if not rows:
+                del self.rows_by_id[entry.content_id]
+        entry.content_id = content_id
+        self._add_id(content_id, entry.row)
+
+    def _entry(self, row: int, values: list[str]) -> QueueEntry:
+        def cell(name: str) -> str:
+            i = self.cols.get(name)
+            return values[i] if i is not None and i < len(values) else ""
+        platforms = tuple(p for p, i in self.draft_cols if i < len(values) and values[i].strip())
+        return QueueEntry(row, cell("content_id"), cell("status"), cell("topic"), cell("created_at"),
+                          cell("scheduled_for"), cell("posted_at"), platforms)
+
+    def put(self, row: int, values: list[str]) -> bool:
+        """Record a row's full values; False if the index has fallen behind."""
+        entry = self._entry(row, values)
+        if row == len(self.entries) + 2:
+            self.entries.append(entry)
+        elif 2 <= row < len(self.entries) + 2:
+            self._set_id(self.entries[row - 2], "")
+            self.entries[row - 2] = entry
+        else:
+            return False
+        self._add_id(entry.content_id, row)
+        return True
+
+    def update(self, row: int, updates: dict):
+        entry = self.at(row)
+        if entry is None:
+            return
+        for name, value in updates.items():
+            if name.endswith(_DRAFT_SUFFIX):
+                plat = name[:-len(_DRAFT_SUFFIX)]
+                drafted = set(entry.platforms) - {plat}
+                if str(value).strip():
+                    drafted.add(plat)
+                entry.platforms = tuple(p for p, _ in self.draft_cols if p in drafted)
+            elif name == "content_id":
+                self._set_id(entry, str(value))
+            elif name in INDEX_FIELDS and name != "row":
+                setattr(entry, name, str(value))
+
+
+_queue_indexes: dict[tuple[str, str], _QueueIndex] = {}
+_index_lock = threading.RLock()
+
+
+def _index_key(org: str) -> tuple[str, str]:
+    tenant = config.get_tenant(org)
+    return (tenant.sheet_id, tenant.queue_tab)
+
+
+def _get_queue_index(org: str = "") -> _QueueIndex:
+    key = _index_key(org)
+    index = _queue_indexes.get(key)
+    if index is None or time.monotonic() - index.built_at > config.QUEUE_INDEX_TTL:
+        ws = _get_queue_sheet(org)
+        rows = ws.get_all_values()
+        index = _QueueIndex(rows)
+        _queue_indexes[key] = index
+        _note_header(ws, rows[0] if rows else [])
+    return index
+
+
+def _cells_hold(ws: "gspread.Worksheet", col: int, expected: dict[int, str]) -> tuple[list[str], bool]:
+    """Read the header and column col (0-based) of the expected rows in one request.
+
+    Returns (header, whether every row still holds its expected value).
+    """
+    letter = _column_letter(col + 1)
+    blocks = ws.batch_get(["1:1"] + [f"{letter}{r}" for r in expected])
+    held = all((block[0][0] if block and block[0] else "") == value
+               for block, value in zip(blocks[1:], expected.values()))
+    return (blocks[0][0] if blocks[0] else []), held
+
+
+def _rows_hold(org: str, expected: dict[int, str]) -> bool:
+    """Check in one read that each row still holds the expected content_id.
+
+    Also refreshes the cached header; a changed header counts as a miss.
+    """
+    if not expected:
+        return True
+    ws = _get_queue_sheet(org)
+    header, held = _cells_hold(ws, _columns(org).get("content_id", 0), expected)
+    return _note_header(ws, header) and held
+
+
+def find_queue_entries(rows: list[int] = (), content_ids: list[str] = (),
+                       check: bool = True, org: str = "") -> list[Optional[QueueEntry]]:
+    """Index entries for rows then content_ids, in order; None where not found.
+
+    The entries are checked against the sheet first, so a row that moved
+    since the index was built (people sorting or deleting rows) is found
+    at its new position rather than acted on at its old one. With
+    check=False they come straight from the index, for display only.
+    """
+    index = _get_queue_index(org)
+    with _index_lock:
+        found = [index.at(r) for r in rows] + [index.find(c) for c in content_ids]
+    if not check:
+        return found
+    if None not in found and _rows_hold(org, {e.row: e.content_id for e in found}):
+        return found
+    invalidate_queue_index(org)
+    index = _get_queue_index(org)
+    with _index_lock:
+        return [index.at(r) for r in rows] + [index.find(c) for c in content_ids]
+
+
+def queue_header(org: str = "") -> list[str]:
+    """Column names of the queue sheet."""
+    return list(_get_queue_index(org).header)
+
+
+def invalidate_queue_index(org: str = ""):
+    """Drop the queue index so the next read rebuilds it from the sheet."""
+    _queue_indexes.pop(_index_key(org), None)
+
+
+def _sort_key(field: str):
+    if field == "row":
+        return lambda e: (True, "", e.row)
+    # Rows without a value sort after those with one
+    return lambda e: (e.get(field) != "", e.get(field), e.row)
+
+
+@telemetry.instrument("sheets.read")
+def list_queue(
+    statuses: tuple[str, ...] = (),
+    platforms: tuple[str, ...] = (),
+    since: str = "",
+    until: str = "",
+    date_field: str = "created_at",
+    sort: str = "row",
+    descending: bool = False,
+    after: Optional[list] = None,
+    limit: int = 20,
+    org: str = "",
+) -> tuple[list[QueueEntry], Optional[list], int]:
+    """Filter and page through the queue index.
+
+    statuses match case-insensitively; platforms match items with a draft
+    for any of them. since/until bound date_field and accept dates or
+    timestamps (until includes the whole of a date). after is the sort key
+    returned for the previous page.
+
+    Returns (entries, sort key to pass as after for the next page or None,
+    total matching entries).
+    """
+    if date_field not in DATE_FIELDS:
+        raise ValueError(f"Unknown date field: {date_field}. Available: {list(DATE_FIELDS)}")
+    if sort != "row" and sort not in DATE_FIELDS:
+        raise ValueError(f"Cannot sort by {sort}. Available: {['row', *DATE_FIELDS]}")
+    wanted = {s.lower() for s in statuses}
+
+    def matches(e: QueueEntry) -> bool:
+        if wanted and e.status.lower() not in wanted:
+            return False
+        if platforms and not any(p in e.platforms for p in platforms):
+            return False
+        if since or until:
+            value = e.get(date_field)
+            if not value or (since and value < since) or (until and value[:len(until)] > until):
+                return False
+        return True
+
+    key = _sort_key(sort)
+    index = _get_queue_index(org)
+    with _index_lock:
+        selected = sorted(filter(matches, index.entries), key=key, reverse=descending)
+    total = len(selected)
+    if after is not None:
+        after = tuple(after)
+        selected = [e for e in selected if (key(e) < after if descending else key(e) > after)]
+    page = selected[:limit]
+    next_key = list(key(page[-1])) if len(selected) > limit else None
+    return page, next_key, total
+
+
+@telemetry.instrument("sheets.read")
+def get_queue_rows(rows: list[int], org: str = "") -> dict[int, dict]:
+    """Read several full queue rows in one request, keyed by row number."""
     if not rows:
+        return {}
+    header = _get_queue_index(org).header
+    last_col = _column_letter(len(header))
+    ws = _get_queue_sheet(org)
+    values = ws.batch_get([f"A{r}:{last_col}{r}" for r in rows])
+    result = {}
+    for r, block in zip(rows, values):
+        row = list(block[0]) if block else []
+        row += [""] * (len(header) - len(row))
+        result[r] = dict(zip(header, row))
+    return result
+
+
+@telemetry.instrument("sheets.read")
+def get_queue_item(row: int = 0, org: str = "", content_id: str = "") -> Optional[dict]:
+    """Read a single queue item by row number or content_id.
+
+    The item includes its current "row". A content_id is looked up in the
+    queue index and confirmed by the read; if the row has moved the index
+    is rebuilt and the read retried.
+    """
+    ws = _get_queue_sheet(org)
+    for attempt in range(2 if content_id else 1):
+        if content_id:
+            index = _get_queue_index(org)
+            with _index_lock:
+                entry = index.find(content_id)
+            if entry is None:
+                if attempt:
+                    return None
+                invalidate_queue_index(org)
+                continue
+            row = entry.row
+        header, values = ws.batch_get(["1:1", f"{row}:{row}"])
+        header = header[0] if header else []
+        _note_header(ws, header)
+        item = dict(zip(header, values[0])) if values else {}
+        if not content_id or item.get("content_id") == content_id:
+            return {**item, "row": row} if item else None
+        invalidate_queue_index(org)
+    return None
+
+
+@telemetry.instrument("sheets.write")
+def append_queue_item(item: QueueItem, org: str = "") -> int:
+    """Add a new item to the queue. Returns the row number.
+
+    The row is laid out by the cached column map and its number taken from
+    the append's response, so nothing is read.
+    """
+    from gspread.utils import a1_range_to_grid_range
+
+    ws = _get_queue_sheet(org)
+    cols = _columns(org)
+    header = [""] * (max(cols.values(), default=-1) + 1)
+    for name, i in cols.items():
+        header[i] = name
+    # Sheets made before a column was added (e.g. variants) gain it here
+    missing = [name for name in QueueItem.header_row() if name not in cols]
+    if missing:
+        header = header + missing
+        ws.update(values=[header], range_name="A1")
+        invalidate_queue_index(org)
+        _note_header(ws, header)
+    values = dict(zip(QueueItem.header_row(), item.to_row()))
+    result = ws.append_row([values.get(name, "") for name in header])
+    updated = result["updates"]["updatedRange"].rsplit("!", 1)[-1]
+    row = a1_range_to_grid_range(updated)["startRowIndex"] + 1
+    if row == 1:
+        # The tab had no header row: put one above the item
+        ws.insert_row(header, 1)
+        row = 2
+    index = _queue_indexes.get(_index_key(org))
+    with _index_lock:
+        if index is not None and not index.put(row, [values.get(name, "") for name in index.header]):
+            invalidate_queue_index(org)
+    return row
+
+
+def update_queue_row(row: int, updates: dict, org: str = ""):
+    """Update specific cells in a queue row."""
+    update_queue_rows({row: updates}, org=org)
+
+
+@telemetry.instrument("sheets.write")
+def update_queue_rows(updates: dict[int, dict], org: str = ""):
+    """Update cells in several queue rows with a single batched write.
+
+    updates maps row number -> {column name: value}; unknown columns are
+    ignored.
+    """
+    ws = _get_queue_sheet(org)
+    cols = _columns(org)
+    data = [
+        {"range": f"{_column_letter(cols[name] + 1)}{row}", "values": [[value]]}
+        for row, changes in updates.items()
+        for name, value in changes.items() if name in cols
+    ]
+    if data:
+        ws.batch_update(data, raw=False)
+    index = _queue_indexes.get(_index_key(org))
+    if index is not None:
+        with _index_lock:
+            for row, changes in updates.items():
+                index.update(row, changes)
+
+
+def change_queue_status(rows: Optional[list[int]], content_ids: Optional[list[str]], status: PostStatus,
+                        extra: Optional[list[dict]] = None, force: bool = False,
+                        org: str = "") -> tuple[list[dict], list[dict]]:
+    """Move queue items to status, all or nothing, with one batched write.
+
+    Items are rows followed by content_ids; extra holds further column
+    updates per item in that order. Every item is checked against
+    ALLOWED_TRANSITIONS (unless force) before anything is written.
+
+    Returns (updated items, rejected items); nothing is written if any
+    item is rejected.
+    """
+    targets = [{"row": r} for r in rows or []] + [{"content_id": c} for c in content_ids or []]
+    if not targets:
+        raise ValueError("Pass at least one row or content_id")
+    entries = find_queue_entries(rows or [], content_ids or [], org=org)
+    updates, updated, rejected = {}, [], []
+    for i, (target, entry) in enumerate(zip(targets, entries)):
+        if entry is None:
+            rejected.append({**target, "error": "Not found"})
+            continue
+        ref = {"row": entry.row, "content_id": entry.content_id}
+        error = "" if force else transition_error(entry.status, status)
+        if entry.row in updates:
+            rejected.append({**ref, "error": "Listed more than once"})
+        elif error:
+            rejected.append({**ref, "status": entry.status or PostStatus.DRAFT.value, "error": error})
+        else:
+            updates[entry.row] = {"status": status.value, **(extra[i] if extra else {})}
+            updated.append({**ref, **updates[entry.row]})
+    if not rejected:
+        update_queue_rows(updates, org=org)
+    return updated, rejected
+
+
+# --- Archive ---
+# Posted and Failed items past the retention window are moved, with their
+# analytics rows, to archive tabs in the same spreadsheet, so the live tabs
+# that tools read on every call only hold recent history. Archived
+# analytics are read back through get_archived_analytics.
+
+ARCHIVED_STATUSES = (PostStatus.POSTED.value, PostStatus.FAILED.value)
+
+
+def _get_archive_sheet(org: str, tab: str, header: list[str]) -> "gspread.Worksheet":
+    """The archive tab, created on first use; only archiving should call this."""
+    return _get_worksheet(config.get_tenant(org), tab, header, len(header) + 1)
+
+
+def _with_archive(org: str, tab: str, header: list[str], live: "gspread.Worksheet") -> list["gspread.Worksheet"]:
+    """The archive tab, if it exists yet, then live: the tabs a read spans."""
+    archive = _get_worksheet(config.get_tenant(org), tab, header, len(header) + 1, create=False)
+    return [archive, live] if archive is not None else [live]
+
+
+def _post_ids(value: str) -> list[str]:
+    """Every post ID recorded in a queue row's post_ids cell."""
+    try:
+        post_ids = json.loads(value) if value else {}
+    except json.JSONDecodeError:
         return []
+    ids = []
+    for pid in post_ids.values() if isinstance(post_ids, dict) else []:
+        ids.extend(pid if isinstance(pid, list) else [pid])
+    return [str(pid) for pid in ids if pid]
+
 
-    header = rows[0]
+def _move_rows(ws: "gspread.Worksheet", archive: "gspread.Worksheet", header: list[str],
+               moving: dict[int, list[str]], key: str):
+    """Copy rows to the archive tab, then delete them from ws.
+
+    Rows are matched to the archive's columns by name, and rows whose key
+    is already archived (from an interrupted earlier run) aren't copied
+    again. Nothing is copied or deleted if ws changed since it was read.
+    """
+    key_col = header.index(key)
+    current, held = _cells_hold(ws, key_col, {r: v[key_col] for r, v in moving.items()})
+    if current != header or not held:
+        raise RuntimeError(f"{ws.title} changed while archiving; nothing was moved. Run again.")
+
+    archive_header = archive.row_values(1)
+    missing = [name for name in header if name not in archive_header]
+    if missing:
+        archive_header += missing
+        archive.update(values=[archive_header], range_name="A1")
+    archived = set(archive.col_values(archive_header.index(key) + 1)[1:])
+    cols = {name: i for i, name in enumerate(header)}
+    copies = [
+        [values[cols[name]] if name in cols and cols[name] < len(values) else "" for name in archive_header]
+        for values in moving.values() if values[key_col] not in archived
+    ]
+    if copies:
+        archive.append_rows(copies, value_input_option="RAW")
+
+    # One batchUpdate deleting each run of adjacent rows, bottom-up so
+    # earlier deletions don't shift later ones
+    runs = []
+    for r in sorted(moving, reverse=True):
+        if runs and runs[-1][0] == r + 1:
+            runs[-1][0] = r
+        else:
+            runs.append([r, r])
+    ws.spreadsheet.batch_update({"requests": [
+        {"deleteDimension": {"range": {"sheetId": ws.id, "dimension": "ROWS",
+                                       "startIndex": start - 1, "endIndex": end}}}
+        for start, end in runs
+    ]})
+
+
+@telemetry.instrument("sheets.write")
+def archive_queue(before: str, dry_run: bool = False, org: str = "") -> dict:
+    """Move Posted/Failed queue items, and their analytics, to the archive tabs.
+
+    Queue items qualify when posted (or, failing that, created) before
+    `before`, an ISO date or timestamp. Analytics rows go with their queue
+    item, or on their own when posted (or last collected) before `before`.
+    With dry_run, only counts what would move.
+    """
+    tenant = config.get_tenant(org)
+    ws = _get_queue_sheet(org)
+    rows = ws.get_all_values()
+    header = _trim(rows[0]) if rows else QueueItem.header_row()
+    _note_header(ws, header)
+    cols = {name: i for i, name in enumerate(header)}
+
+    def cell(values: list[str], name: str) -> str:
+        i = cols.get(name)
+        return values[i] if i is not None and i < len(values) else ""
+
+    moving, post_ids = {}, set()
+    for r, values in enumerate(rows[1:], start=2):
+        if cell(values, "status") not in ARCHIVED_STATUSES or not cell(values, "content_id"):
+            continue
+        when = cell(values, "posted_at") or cell(values, "created_at")
+        if when and when < before:
+            moving[r] = values
+            post_ids.update(_post_ids(cell(values, "post_ids")))
+
+    analytics_ws = _get_analytics_sheet(org)
+    analytics_rows = analytics_ws.get_all_values()
+    analytics_header = _trim(analytics_rows[0]) if analytics_rows else AnalyticsRecord.header_row()
+    acols = {name: i for i, name in enumerate(analytics_header)}
+    analytics_moving = {}
+    if "post_id" in acols:
+        for r, values in enumerate(analytics_rows[1:], start=2):
+            record = dict(zip(analytics_header, values))
+            when = record.get("posted_at") or record.get("collected_at") or ""
+            if record["post_id"] and (record["post_id"] in post_ids or (when and when < before)):
+                analytics_moving[r] = values
+
+    if not dry_run:
+        if moving:
+            archive = _get_archive_sheet(org, tenant.queue_archive_tab, header)
+            try:
+                _move_rows(ws, archive, header, moving, "content_id")
+            finally:
+                invalidate_queue_index(org)
+        if analytics_moving:
+            archive = _get_archive_sheet(org, tenant.analytics_archive_tab, analytics_header)
+            _move_rows(analytics_ws, archive, analytics_header, analytics_moving, "post_id")
+    return {
+        "queue_items": len(moving),
+        "analytics_rows": len(analytics_moving),
+        "queue_remaining": max(len(rows) - 1, 0) - len(moving),
+        "analytics_remaining": max(len(analytics_rows) - 1, 0) - len(analytics_moving),
+    }
+
+
+@telemetry.instrument("sheets.read")
+def get_archived_analytics(platform: str = "", since: str = "", until: str = "", limit: int = 100,
+                           org: str = "") -> list[dict]:
+    """Read analytics records from the archive tab.
+
+    since/until bound posted_at (or collected_at where posted_at is empty)
+    and accept dates or timestamps; until includes the whole of a date.
+    """
+    tenant = config.get_tenant(org)
+    header = AnalyticsRecord.header_row()
+    ws = _get_worksheet(tenant, tenant.analytics_archive_tab, header, len(header) + 1, create=False)
     items = []
-    for i, row in enumerate(rows[1:], start=2):
-        if status_filter and len(row) > 9 and row[9] != status_filter:
+    for row in stream_rows(ws) if ws is not None else ():
+        if platform and row.get("platform") != platform:
+            continue
+        when = row.get("posted_at") or row.get("collected_at")
+        if (since and when < since) or (until and when[:len(until)] > until):
             continue
-        item = dict(zip(header, row))
-        item["_row"] = i
-        items.append(item)
+        items.append(row.as_dict())
         if len(items) >= limit:
             break
     return items
 
 
-def get_queue_item(row: int) -> Optional[dict]:
-    """Read a single queue item by row number."""
-    ws = _get_queue_sheet()
-    header = ws.row_values(1)
-    values = ws.row_values(row)
-    if not values:
-        return None
-    return dict(zip(header, values))
+@telemetry.instrument("sheets.read")
+def get_all_drafts(org: str = "") -> list[dict]:
+    """content_id and drafts (platform -> text) of every queue item, archived first."""
+    tenant = config.get_tenant(org)
+    items = []
+    for ws in _with_archive(org, tenant.queue_archive_tab, QueueItem.header_row(), _get_queue_sheet(org)):
+        for row in stream_rows(ws, ("content_id", *_DRAFT_COLUMNS), chunk_rows=0):
+            if not row.get("content_id"):
+                continue
+            drafts = {name[:-len(_DRAFT_SUFFIX)]: row.get(name) for name in _DRAFT_COLUMNS if row.get(name).strip()}
+            if drafts:
+                items.append({"content_id": row.get("content_id"), "drafts": drafts})
+    return items
 
 
-def append_queue_item(item: QueueItem) -> int:
-    """Add a new item to the queue. Returns the row number."""
-    ws = _get_queue_sheet()
-    rows = ws.get_all_values()
-    if not rows:
-        ws.append_row(QueueItem.header_row())
-    ws.append_row(item.to_row())
-    return len(ws.get_all_values())
+@telemetry.instrument("sheets.read")
+def get_post_links(org: str = "") -> dict[str, tuple[str, list[str]]]:
+    """Every post ID recorded in the queue, live and archived: post_id -> (content_id, thread).
 
+    thread lists every post ID of a reply chain (root first) and is empty
+    for single posts.
+    """
+    tenant = config.get_tenant(org)
+    links = {}
+    for ws in _with_archive(org, tenant.queue_archive_tab, QueueItem.header_row(), _get_queue_sheet(org)):
+        for row in stream_rows(ws, ("content_id", "post_ids"), chunk_rows=0):
+            try:
+                post_ids = json.loads(row.get("post_ids") or "{}")
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(post_ids, dict):
+                continue
+            for pid in post_ids.values():
+                thread = [str(p) for p in pid] if isinstance(pid, list) else []
+                for part in thread or ([str(pid)] if pid else []):
+                    links[part] = (row.get("content_id"), thread)
+    return links
 
-def update_queue_row(row: int, updates: dict):
-    """Update specific cells in a queue row."""
-    ws = _get_queue_sheet()
-    header = ws.row_values(1)
-    for col_name, value in updates.items():
-        if col_name in header:
-            col_idx = header.index(col_name) + 1
-            ws.update_cell(row, col_idx, value)
 
+@telemetry.instrument("sheets.read")
+def get_post_history(org: str = "") -> list[dict]:
+    """Every post with a known posting time and its latest metrics, live and archived.
 
-def get_analytics(platform: str = "", days: int = 30, limit: int = 100) -> list[dict]:
-    """Read analytics records."""
-    ws = _get_analytics_sheet()
-    rows = ws.get_all_values()
-    if not rows:
-        return []
+    Analytics rows without posted_at take it from the queue item whose
+    post_ids recorded the post.
+    """
+    tenant = config.get_tenant(org)
+    posted = {}
+    for ws in _with_archive(org, tenant.queue_archive_tab, QueueItem.header_row(), _get_queue_sheet(org)):
+        for row in stream_rows(ws, ("posted_at", "post_ids"), chunk_rows=0):
+            if row.get("posted_at"):
+                for post_id in _post_ids(row.get("post_ids")):
+                    posted[post_id] = row.get("posted_at")
+
+    history = {}
+    for ws in _with_archive(org, tenant.analytics_archive_tab, AnalyticsRecord.header_row(),
+                            _get_analytics_sheet(org)):
+        for row in stream_rows(ws, chunk_rows=0):
+            record = row.as_dict()
+            post_id = record.get("post_id", "")
+            when = record.get("posted_at") or posted.get(post_id, "")
+            if post_id and when:
+                history[post_id] = {**record, "posted_at": when}
+    return list(history.values())
+
+
+@telemetry.instrument("sheets.read")
+def get_posted_texts(org: str = "") -> list[dict]:
+    """Every post published from the queue, live and archived, with its text and latest metrics.
 
-    header = rows[0]
+    One record per platform post: {"post_id", "platform", "content_id",
+    "text", plus likes/reposts/replies/impressions once it has analytics}.
+    A thread is one record under its root post ID, with the whole draft as
+    its text, as its metrics are recorded.
+    """
+    tenant = config.get_tenant(org)
+    posts = {}
+    for ws in _with_archive(org, tenant.queue_archive_tab, QueueItem.header_row(), _get_queue_sheet(org)):
+        for row in stream_rows(ws, ("content_id", "post_ids", *_DRAFT_COLUMNS), chunk_rows=0):
+            try:
+                post_ids = json.loads(row.get("post_ids") or "{}")
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(post_ids, dict):
+                continue
+            for plat, pid in post_ids.items():
+                root = str(pid[0]) if isinstance(pid, list) and pid else str(pid or "")
+                text = row.get(f"{plat}{_DRAFT_SUFFIX}")
+                if root and text.strip():
+                    posts[root] = {"post_id": root, "platform": plat, "content_id": row.get("content_id"),
+                                   "text": text}
+
+    metrics = ("likes", "reposts", "replies", "impressions")
+    for ws in _with_archive(org, tenant.analytics_archive_tab, AnalyticsRecord.header_row(),
+                            _get_analytics_sheet(org)):
+        for row in stream_rows(ws, ("post_id", *metrics), chunk_rows=0):
+            post = posts.get(row.get("post_id"))
+            if post is not None:
+                post.update((name, row.get(name)) for name in metrics)
+    return list(posts.values())
+
+
+@telemetry.instrument("sheets.read")
+def get_analytics(platform: str = "", days: int = 30, limit: int = 100, org: str = "") -> list[dict]:
+    """Read the newest analytics records for posts from the last `days` days; days <= 0 reads all.
+
+    A record's date is its posted_at, or collected_at where that is empty.
+    Records are appended as posts go out, so the tab is read from the
+    bottom and the read stops at the first record older than the window.
+    Returns records newest first.
+    """
+    since = (datetime.now() - timedelta(days=days)).isoformat() if days > 0 else ""
     items = []
-    for row in rows[1:]:
-        record = dict(zip(header, row))
-        if platform and record.get("platform") != platform:
+    for row in stream_rows(_get_analytics_sheet(org), reverse=True):
+        if since and (row.get("posted_at") or row.get("collected_at")) < since:
+            break
+        if platform and row.get("platform") != platform:
             continue
-        items.append(record)
+        items.append(row.as_dict())
         if len(items) >= limit:
             break
     return items
 
 
-def get_analytics_for_post(post_id: str) -> Optional[dict]:
-    """Find analytics record for a specific post ID."""
-    ws = _get_analytics_sheet()
-    rows = ws.get_all_values()
-    if not rows:
-        return None
-
-    header = rows[0]
-    for row in rows[1:]:
-        record = dict(zip(header, row))
-        if record.get("post_id") == post_id:
-            return record
+@telemetry.instrument("sheets.read")
+def get_analytics_for_post(post_id: str, org: str = "") -> Optional[dict]:
+    """Find analytics record for a specific post ID, searching from the newest rows."""
+    for row in stream_rows(_get_analytics_sheet(org), reverse=True):
+        if row.get("post_id") == post_id:
+            return row.as_dict()
     return None
 
 
-def get_recent_post_ids(limit: int = 20) -> list[tuple[str, str]]:
-    """Get recent (post_id, platform) pairs from the queue sheet for analytics refresh."""
-    ws = _get_queue_sheet()
-    rows = ws.get_all_values()
-    if not rows:
-        return []
+@telemetry.instrument("sheets.read")
+def get_recent_post_ids(limit: int = 20, org: str = "") -> list[tuple[str, str, list[str]]]:
+    """Get recent (post_id, platform, thread) tuples from the queue sheet for analytics refresh.
 
-    header = rows[0]
+    thread lists every post ID of a reply chain (root first) and is empty for
+    single posts; post_id is the root of the chain.
+    """
     results = []
-    for row in reversed(rows[1:]):
-        item = dict(zip(header, row))
-        if item.get("status") != PostStatus.POSTED.value:
+    for row in stream_rows(_get_queue_sheet(org), ("status", "post_ids"), reverse=True):
+        if row.get("status") != PostStatus.POSTED.value:
             continue
-        post_ids_str = item.get("post_ids", "")
+        post_ids_str = row.get("post_ids")
         if not post_ids_str:
             continue
         try:
             post_ids = json.loads(post_ids_str)
             for plat, pid in post_ids.items():
-                if pid:
-                    results.append((pid, plat))
+                if isinstance(pid, list):
+                    if pid:
+                        results.append((pid[0], plat, pid))
+                elif pid:
+                    results.append((pid, plat, []))
         except json.JSONDecodeError:
             continue
         if len(results) >= limit:
@@ -170,29 +969,25 @@ def get_recent_post_ids(limit: int = 20) -> list[tuple[str, str]]:
     return results
 
 
-def update_analytics(post_id: str, metrics: dict):
+@telemetry.instrument("sheets.write")
+def update_analytics(post_id: str, metrics: dict, org: str = ""):
     """Update or append analytics for a post."""
-    ws = _get_analytics_sheet()
-    rows = ws.get_all_values()
-    if not rows:
+    ws = _get_analytics_sheet(org)
+    # Find existing row, newest first
+    i = next((row.row for row in stream_rows(ws, ("post_id",), reverse=True) if row.get("post_id") == post_id), None)
+    header = _header(ws)
+    if not header:
         ws.append_row(AnalyticsRecord.header_row())
-        rows = ws.get_all_values()
-
-    header = rows[0]
-    # Find existing row
-    for i, row in enumerate(rows[1:], start=2):
-        record = dict(zip(header, row))
-        if record.get("post_id") == post_id:
-            # Update in place
-            for key, val in metrics.items():
-                if key in header:
-                    col_idx = header.index(key) + 1
-                    ws.update_cell(i, col_idx, str(val))
-            # Update collected_at
-            if "collected_at" in header:
-                col_idx = header.index("collected_at") + 1
-                ws.update_cell(i, col_idx, datetime.now().isoformat())
-            return
+    elif i is not None:
+        # Update in place, every changed cell in one write
+        cols = {name: c + 1 for c, name in enumerate(header)}
+        data = [
+            {"range": f"{_column_letter(cols[key])}{i}", "values": [[str(val)]]}
+            for key, val in {**metrics, "collected_at": datetime.now().isoformat()}.items() if key in cols
+        ]
+        if data:
+            ws.batch_update(data, raw=False)
+        return
 
     # Not found - append new row
     record = AnalyticsRecord(
@@ -209,11 +1004,108 @@ def update_analytics(post_id: str, metrics: dict):
     ws.append_row(record.to_row())
 
 
-def append_analytics(records: list[AnalyticsRecord]):
+@telemetry.instrument("sheets.write")
+def update_analytics_many(metrics: dict[str, dict], org: str = ""):
+    """Update or append analytics for several posts with one read and at most two writes.
+
+    metrics maps post_id -> metrics, as for update_analytics; they may also
+    carry content_id and posted_at.
+    """
+    if not metrics:
+        return
+    ws = _get_analytics_sheet(org)
+    existing = {}
+    for row in stream_rows(ws, ("post_id",), chunk_rows=0):
+        existing.setdefault(row.get("post_id"), row.row)
+    header = _header(ws)
+    if not header:
+        header = AnalyticsRecord.header_row()
+        ws.append_row(header)
+    cols = {name: i + 1 for i, name in enumerate(header)}
+
+    now = datetime.now().isoformat()
+    data, new = [], []
+    for post_id, values in metrics.items():
+        row = existing.get(post_id)
+        if row is None:
+            new.append(AnalyticsRecord(
+                post_id=post_id,
+                platform=values.get("platform", ""),
+                content_id=values.get("content_id", ""),
+                posted_at=values.get("posted_at", ""),
+                likes=values.get("likes", 0),
+                reposts=values.get("reposts", 0),
+                replies=values.get("replies", 0),
+                impressions=values.get("impressions", 0),
+                collected_at=now,
+            ).to_row())
+            continue
+        for key, val in {**values, "collected_at": now}.items():
+            if key in cols:
+                data.append({"range": f"{_column_letter(cols[key])}{row}", "values": [[str(val)]]})
+    if data:
+        ws.batch_update(data, raw=False)
+    if new:
+        ws.append_rows(new)
+
+
+@telemetry.instrument("sheets.write")
+def append_analytics(records: list[AnalyticsRecord], org: str = ""):
     """Write analytics records to the sheet."""
-    ws = _get_analytics_sheet()
+    ws = _get_analytics_sheet(org)
     rows = ws.get_all_values()
     if not rows:
         ws.append_row(AnalyticsRecord.header_row())
     for record in records:
         ws.append_row(record.to_row())
+
+
+# --- Audience ---
+
+@telemetry.instrument("sheets.read")
+def get_audience(org: str = "") -> list[AudienceSnapshot]:
+    """Every daily audience snapshot in the audience tab, in sheet order."""
+    snapshots = []
+    for row in stream_rows(_get_audience_sheet(org), tuple(AudienceSnapshot.header_row()), chunk_rows=0):
+        if not row.get("date") or not row.get("platform"):
+            continue
+        try:
+            counts = {key: int(row.get(key) or 0) for key in ("followers", "following", "posts")}
+        except ValueError:
+            continue
+        snapshots.append(AudienceSnapshot(date=row.get("date"), platform=row.get("platform"),
+                                          sampled_at=row.get("sampled_at"), **counts))
+    return snapshots
+
+
+@telemetry.instrument("sheets.write")
+def upsert_audience(snapshots: list[AudienceSnapshot], org: str = ""):
+    """Write snapshots with one read and at most two writes, replacing any for the same date and platform."""
+    if not snapshots:
+        return
+    ws = _get_audience_sheet(org)
+    rows = ws.get_all_values()
+    if not rows:
+        rows = [AudienceSnapshot.header_row()]
+        ws.append_row(rows[0])
+
+    header = _trim(rows[0])
+    cols = {name: i for i, name in enumerate(header)}
+    existing = {}
+    for i, row in enumerate(rows[1:], start=2):
+        record = dict(zip(header, row))
+        existing[(record.get("date", ""), record.get("platform", ""))] = i
+
+    data, new = [], []
+    for snapshot in snapshots:
+        row = existing.get((snapshot.date, snapshot.platform))
+        if row is None:
+            new.append(snapshot.to_row())
+            continue
+        for key, val in zip(AudienceSnapshot.header_row(), snapshot.to_row()):
+            if key in cols:
+                data.append({"range": f"{_column_letter(cols[key] + 1)}{row}", "values": [[val]]})
+    if data:
+        ws.batch_update(data, raw=False)
+    if new:
+        ws.append_rows(new)
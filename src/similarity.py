@@ -0,0 +1,333 @@
+"""Near-duplicate detection across every draft in the queue and its archive.
+
+Each draft (one per content_id and platform) is reduced to a MinHash
+signature over character shingles of its normalized text, and filed in
+LSH buckets by bands of that signature. Finding drafts similar to one
+looks up its buckets and compares signatures of the few candidates there,
+so it stays well under a millisecond however many drafts are indexed.
+
+The index for an org is built from the sheets on first use, then kept
+current by the tools that create and edit drafts; it is rebuilt after
+SIMILARITY_REBUILD_HOURS to take in drafts added elsewhere. Tools call in
+from worker threads, so an index is only searched or changed under _lock;
+building one from the sheets happens outside it. NumPy is imported on
+first use.
+"""
+
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import TYPE_CHECKING, Optional
+
+import config
+import sheets
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+SHINGLE = 5
+# Drafts sharing a band are candidates; at 16 bands of 4 rows, pairs with
+# Jaccard similarity 0.5 are found about half the time and 0.7 nearly always
+BANDS = 16
+ROWS = 4
+PERMUTATIONS = BANDS * ROWS
+
+# Links and punctuation other than hashtags and mentions
+_NOISE = re.compile(r"https?://\S+|[^\w#@\s]+")
+# Bands with more drafts than this are skipped when looking for candidates
+_MAX_BUCKET = 256
+# Drafts added since the sorted band table was built are kept in a dict
+# until there are this many, then everything is sorted again
+_UNSORTED_ROWS = 1000
+# Shingles hashed per batch; bounds the (PERMUTATIONS x shingles) work array
+_BATCH_SHINGLES = 50_000
+
+_params: Optional[tuple["np.ndarray", "np.ndarray"]] = None
+
+
+def _permutations() -> tuple["np.ndarray", "np.ndarray"]:
+    global _params
+    if _params is None:
+        import numpy as np
+        # Fixed seed: signatures must be comparable across rebuilds
+        rng = np.random.default_rng(0x5EED)
+        multipliers = rng.integers(0, 2**31, PERMUTATIONS, dtype=np.uint32) * np.uint32(2) + np.uint32(1)
+        _params = (multipliers[:, None], rng.integers(0, 2**32, PERMUTATIONS, dtype=np.uint32)[:, None])
+    return _params
+
+
+def normalize(text: str) -> str:
+    """Lowercased text with links, punctuation and extra whitespace removed."""
+    return " ".join(_NOISE.sub(" ", text.lower()).split())
+
+
+def _shingles(texts: list[str]) -> tuple["np.ndarray", "np.ndarray"]:
+    """32-bit hashes of every text's shingles, concatenated, and where each text's start."""
+    import numpy as np
+
+    # Texts shorter than a shingle become one padded shingle
+    padded = [t.ljust(SHINGLE, "\0") for t in texts]
+    lengths = np.array([len(t) for t in padded])
+    points = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    windows = len(points) - SHINGLE + 1
+    hashes = np.zeros(windows, dtype=np.uint64)
+    for k in range(SHINGLE):
+        hashes = hashes * np.uint64(1000003) + points[k:k + windows]
+    hashes ^= hashes >> np.uint64(29)
+    # Keep only windows lying within one text
+    counts = lengths - SHINGLE + 1
+    firsts = np.cumsum(counts) - counts
+    offsets = np.cumsum(lengths) - lengths
+    keep = np.arange(counts.sum()) + np.repeat(offsets - firsts, counts)
+    return (hashes[keep] & np.uint64(0xFFFFFFFF)).astype(np.uint32), firsts
+
+
+def signatures(texts: list[str]) -> "np.ndarray":
+    """MinHash signatures (one row of PERMUTATIONS per text) of normalized, non-empty texts.
+
+    Each permutation is a multiply-add hash of the shingle hashes, modulo 2**32.
+    """
+    import numpy as np
+
+    result = np.empty((len(texts), PERMUTATIONS), dtype=np.uint32)
+    a, b = _permutations()
+    start = 0
+    while start < len(texts):
+        # As many texts as fit the batch, at least one
+        end, size = start + 1, len(texts[start])
+        while end < len(texts) and size + len(texts[end]) <= _BATCH_SHINGLES:
+            size += len(texts[end])
+            end += 1
+        hashes, firsts = _shingles(texts[start:end])
+        permuted = np.multiply(a, hashes[None, :])
+        permuted += b
+        result[start:end] = np.minimum.reduceat(permuted, firsts, axis=1).T
+        start = end
+    return result
+
+
+def _band_keys(sigs: "np.ndarray") -> "np.ndarray":
+    """Per signature, one 64-bit key for each band of ROWS values.
+
+    The band number is folded into the low bits, so keys of different
+    bands never collide and all of them can share one lookup table.
+    """
+    import numpy as np
+
+    words = sigs.reshape(len(sigs), BANDS, ROWS).view(np.uint64)
+    keys = words[:, :, 0]
+    for j in range(1, words.shape[2]):
+        keys = keys * np.uint64(0x9E3779B97F4A7C15) ^ words[:, :, j]
+    return keys * np.uint64(BANDS) + np.arange(BANDS, dtype=np.uint64)
+
+
+class _Index:
+    """Signatures and LSH band keys for one org's drafts.
+
+    Signatures are rows of one matrix, so a query's candidates are compared
+    in a single step. Band keys are looked up in a sorted array, plus a
+    dict for drafts added since it was last sorted; replaced drafts stay in
+    both until then and are skipped.
+    """
+
+    def __init__(self):
+        import numpy as np
+        self.matrix = np.zeros((256, PERMUTATIONS), dtype=np.uint32)
+        self.bands = np.zeros((256, BANDS), dtype=np.uint64)
+        # Row -> (content_id, platform); None once replaced
+        self.rows: list[Optional[tuple[str, str]]] = []
+        # content_id -> platform -> row
+        self.drafts: dict[str, dict[str, int]] = {}
+        self.sorted_keys = np.zeros(0, dtype=np.uint64)
+        self.sorted_rows = np.zeros(0, dtype=np.int64)
+        self.recent: defaultdict[int, list[int]] = defaultdict(list)
+        self.recent_rows = 0
+        self.built_at = time.monotonic()
+
+    def remove(self, content_id: str, plat: str):
+        row = self.drafts.get(content_id, {}).pop(plat, None)
+        if row is None:
+            return
+        if not self.drafts[content_id]:
+            del self.drafts[content_id]
+        self.rows[row] = None
+
+    def add_many(self, drafts: list[tuple[str, str, str]]):
+        """Index (content_id, platform, text) drafts, replacing any held for the same keys."""
+        import numpy as np
+
+        for content_id, plat, _ in drafts:
+            self.remove(content_id, plat)
+        kept = [(c, p, t) for c, p, t in ((c, p, normalize(t)) for c, p, t in drafts) if t]
+        if not kept:
+            return
+        sigs = signatures([t for _, _, t in kept])
+        start = len(self.rows)
+        while start + len(kept) > len(self.matrix):
+            self.matrix = np.concatenate([self.matrix, np.zeros_like(self.matrix)])
+            self.bands = np.concatenate([self.bands, np.zeros_like(self.bands)])
+        self.matrix[start:start + len(kept)] = sigs
+        self.bands[start:start + len(kept)] = _band_keys(sigs)
+        for row, (content_id, plat, _) in enumerate(kept, start):
+            self.rows.append((content_id, plat))
+            self.drafts.setdefault(content_id, {})[plat] = row
+        self.recent_rows += len(kept)
+        if self.recent_rows > _UNSORTED_ROWS:
+            self._sort()
+        else:
+            for row, keys in enumerate(self.bands[start:start + len(kept)].tolist(), start):
+                for key in keys:
+                    self.recent[key].append(row)
+
+    def _sort(self):
+        """Move every live draft's band keys into the sorted array."""
+        import numpy as np
+
+        live = np.array([row is not None for row in self.rows], dtype=bool)
+        rows = np.flatnonzero(live)
+        keys = self.bands[rows].ravel()
+        order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[order]
+        self.sorted_rows = np.repeat(rows, BANDS)[order]
+        self.recent.clear()
+        self.recent_rows = 0
+
+    def signature(self, content_id: str, plat: str) -> tuple["np.ndarray", "np.ndarray"]:
+        row = self.drafts[content_id][plat]
+        return self.matrix[row], self.bands[row]
+
+    def similar(self, sig: "np.ndarray", keys: "np.ndarray", exclude: str,
+                threshold: float) -> dict[tuple[str, str], float]:
+        """Indexed drafts of other items whose estimated similarity reaches threshold."""
+        import numpy as np
+
+        firsts = np.searchsorted(self.sorted_keys, keys, "left")
+        lasts = np.searchsorted(self.sorted_keys, keys, "right")
+        parts = []
+        for key, first, last in zip(keys.tolist(), firsts.tolist(), lasts.tolist()):
+            extra = self.recent.get(key, ())
+            # Bands shared by that many drafts come from boilerplate; true
+            # near-duplicates also share several other bands
+            if last - first + len(extra) <= _MAX_BUCKET:
+                parts.append(self.sorted_rows[first:last])
+                parts.append(np.array(extra, dtype=np.int64))
+        if not parts:
+            return {}
+        rows = np.unique(np.concatenate(parts))
+        scores = np.count_nonzero(self.matrix[rows] == sig, axis=1) / PERMUTATIONS
+        found = {}
+        for i in np.flatnonzero(scores >= threshold).tolist():
+            draft = self.rows[rows[i]]
+            if draft is not None and draft[0] != exclude:
+                found[draft] = float(scores[i])
+        return found
+
+
+_indexes: dict[str, _Index] = {}
+_lock = threading.Lock()
+
+
+def _build(org: str) -> _Index:
+    index = _Index()
+    index.add_many([(item["content_id"], plat, text)
+                    for item in sheets.get_all_drafts(org=org) for plat, text in item["drafts"].items()])
+    return index
+
+
+def _index(org: str) -> _Index:
+    tenant = config.get_tenant(org)
+    index = _indexes.get(tenant.org)
+    if index is None or time.monotonic() - index.built_at > config.SIMILARITY_REBUILD_HOURS * 3600:
+        index = _indexes[tenant.org] = _build(tenant.org)
+    return index
+
+
+def index_drafts(org: str, content_id: str, drafts: dict[str, str]):
+    """Add or replace an item's drafts (platform -> text) in the index."""
+    index = _indexes.get(config.get_tenant(org).org)
+    if index is None:
+        return
+    with _lock:
+        index.add_many([(content_id, plat, text) for plat, text in drafts.items()])
+
+
+def _report(found: dict[tuple[str, str], float], org: str) -> list[dict]:
+    best: dict[str, tuple[float, str]] = {}
+    for (content_id, plat), score in found.items():
+        if score > best.get(content_id, (0.0, ""))[0]:
+            best[content_id] = (score, plat)
+    entries = dict(zip(best, sheets.find_queue_entries(content_ids=list(best), check=False, org=org)))
+    return sorted((
+        {
+            "content_id": content_id,
+            "platform": plat,
+            "similarity": round(score, 2),
+            # Not in the live queue: archived after posting
+            "status": entries[content_id].status if entries[content_id] else "Archived",
+        }
+        for content_id, (score, plat) in best.items()
+    ), key=lambda m: -m["similarity"])
+
+
+def _matches(index: _Index, held: list[tuple["np.ndarray", "np.ndarray"]], exclude: str, org: str) -> list[dict]:
+    found: dict[tuple[str, str], float] = {}
+    with _lock:
+        for sig, keys in held:
+            for key, score in index.similar(sig, keys, exclude, config.DUPLICATE_THRESHOLD).items():
+                found[key] = max(score, found.get(key, 0.0))
+    return _report(found, org)
+
+
+def find_similar(org: str, drafts: dict[str, str], exclude: str = "") -> list[dict]:
+    """Other queue items with a draft nearly the same as any of these texts.
+
+    A draft matches when its estimated similarity reaches
+    DUPLICATE_THRESHOLD. Returns one entry per matching item (its most
+    similar draft), most similar first: {"content_id", "platform",
+    "similarity", "status"}.
+    """
+    texts = [t for t in map(normalize, drafts.values()) if t]
+    sigs = signatures(texts)
+    return _matches(_index(org), list(zip(sigs, _band_keys(sigs))), exclude, org)
+
+
+def duplicates_of(org: str, content_id: str, row: int = 0) -> list[dict]:
+    """Other queue items nearly the same as content_id's drafts, as for find_similar.
+
+    An item not yet indexed (added to the sheet by hand since the last
+    rebuild) is read from its row and indexed first.
+    """
+    index = _index(org)
+    if content_id not in index.drafts and row:
+        values = sheets.get_queue_rows([row], org=org).get(row, {})
+        if values.get("content_id") == content_id:
+            with _lock:
+                index.add_many([(content_id, name[:-len("_draft")], text)
+                                for name, text in values.items() if name.endswith("_draft")])
+    with _lock:
+        held = [index.signature(content_id, plat) for plat in index.drafts.get(content_id, {})]
+    return _matches(index, held, content_id, org)
+
+
+def closest(org: str, texts: list[str]) -> list[tuple[float, str]]:
+    """For each text, the estimated similarity of the most similar indexed draft and its content_id.
+
+    Only drafts sharing an LSH band with the text are compared, so texts
+    with nothing roughly alike get (0.0, "").
+    """
+    index = _index(org)
+    normalized = [normalize(t) for t in texts]
+    kept = [i for i, t in enumerate(normalized) if t]
+    results = [(0.0, "")] * len(texts)
+    if not kept:
+        return results
+    sigs = signatures([normalized[i] for i in kept])
+    for i, sig, keys in zip(kept, sigs, _band_keys(sigs)):
+        with _lock:
+            found = index.similar(sig, keys, "", 0.0)
+        if found:
+            (content_id, _), score = max(found.items(), key=lambda f: f[1])
+            results[i] = (score, content_id)
+    return results
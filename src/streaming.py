@@ -0,0 +1,249 @@
+"""Near-real-time Mastodon engagement from the streaming API.
+
+With SM_MASTODON_STREAMING on, each org with Mastodon configured keeps a
+connection to its account's notification stream. Favourites, boosts and
+replies to our recent posts update per-post counters in memory, which are
+written to the analytics tab in one batch every STREAM_FLUSH_SECONDS, so
+engagement numbers stay current without polling every post. The stream
+reconnects with backoff when it drops, and a periodic poll of the recent
+posts corrects anything missed while disconnected.
+
+Best run in daemon mode: every stdio server process would open its own
+stream for the same accounts.
+"""
+
+import asyncio
+import time
+from typing import Optional
+
+import config
+import hashtags
+import jobs
+import sheets
+import telemetry
+import timing
+from models import Tenant
+from platforms import get_platform
+
+
+# A stream that stayed up this long counts as healthy; backoff starts over
+_HEALTHY_SECONDS = 60
+_METRICS = ("likes", "reposts", "replies")
+
+
+class _Consumer:
+    """Stream, counters and flush/reconcile loop for one org."""
+
+    def __init__(self, tenant: Tenant):
+        self.tenant = tenant
+        # post_id -> the chain it belongs to (root first; [post_id] for single posts)
+        self.chains: dict[str, list[str]] = {}
+        # post_id -> {"likes", "reposts", "replies"} as last seen
+        self.counts: dict[str, dict] = {}
+        # Roots with counts not yet written; posts needing a poll for a baseline
+        self.dirty: set[str] = set()
+        self.stale: set[str] = set()
+        self.state = "starting"
+        self.events = 0
+        self.reconnects = 0
+        self.flushes = 0
+        self.last_event_at: Optional[float] = None
+        self.last_error = ""
+        self.tasks: list[asyncio.Task] = []
+
+    def apply(self, note: dict):
+        """Update counters from one notification."""
+        kind = note.get("type")
+        status = note.get("status") or {}
+        if kind in ("favourite", "reblog"):
+            post_id = str(status.get("id", ""))
+            if post_id not in self.chains:
+                return
+            # The notification carries our post with its current counts
+            if "favourites_count" in status:
+                self.counts[post_id] = {
+                    "likes": status.get("favourites_count", 0),
+                    "reposts": status.get("reblogs_count", 0),
+                    "replies": status.get("replies_count", 0),
+                }
+            elif post_id in self.counts:
+                self.counts[post_id]["likes" if kind == "favourite" else "reposts"] += 1
+            else:
+                self.stale.add(post_id)
+        elif kind == "mention":
+            post_id = str(status.get("in_reply_to_id") or "")
+            if post_id not in self.chains:
+                return
+            if post_id in self.counts:
+                self.counts[post_id]["replies"] += 1
+            else:
+                self.stale.add(post_id)
+        else:
+            return
+        self.dirty.add(self.chains[post_id][0])
+        self.events += 1
+        self.last_event_at = time.time()
+
+    def metrics(self, root: str) -> Optional[dict]:
+        """Counts for a post, summed over its thread as refresh_post_metrics does."""
+        chain = self.chains.get(root, [root])
+        if any(pid not in self.counts for pid in chain):
+            self.stale.update(pid for pid in chain if pid not in self.counts)
+            return None
+        totals = {k: sum(self.counts[pid][k] for pid in chain) for k in _METRICS}
+        # Replies within our own thread aren't engagement
+        totals["replies"] = max(0, totals["replies"] - (len(chain) - 1))
+        return {**totals, "impressions": 0, "platform": "mastodon"}
+
+    async def poll(self, post_ids: list[str]):
+        """Fetch current counts for posts directly from the API."""
+        client = get_platform("mastodon", self.tenant)
+        circuit = jobs.breaker(f"{self.tenant.org}:mastodon")
+        limit = asyncio.Semaphore(self.tenant.max_concurrency)
+
+        async def fetch(post_id: str):
+            if not circuit.allow():
+                return
+            async with limit:
+                try:
+                    with telemetry.timed("mastodon.metrics"):
+                        metrics = await client.get_metrics(post_id)
+                except Exception as exc:
+                    if jobs.is_transient(exc):
+                        circuit.record_failure()
+                    self.last_error = str(exc)
+                    return
+            circuit.record_success()
+            self.counts[post_id] = {k: metrics.get(k, 0) for k in _METRICS}
+            self.stale.discard(post_id)
+            self.dirty.add(self.chains.get(post_id, [post_id])[0])
+
+        await asyncio.gather(*(fetch(pid) for pid in post_ids))
+
+    async def reconcile(self):
+        """Re-read which posts to follow and poll all of them."""
+        chains = {}
+        recent = await asyncio.to_thread(sheets.get_recent_post_ids, limit=config.STREAM_TRACK_POSTS,
+                                         org=self.tenant.org)
+        for post_id, plat, thread in recent:
+            if plat == "mastodon":
+                chain = [str(pid) for pid in thread] or [post_id]
+                for pid in chain:
+                    chains[pid] = chain
+        self.chains = chains
+        self.counts = {pid: c for pid, c in self.counts.items() if pid in chains}
+        await self.poll(list(chains))
+
+    async def flush(self):
+        """Write the counts of every changed post in one batch.
+
+        The write runs on a worker thread; posts changed while it is under
+        way stay dirty for the next flush.
+        """
+        batch = {}
+        for root in list(self.dirty):
+            metrics = self.metrics(root)
+            if metrics is not None:
+                batch[root] = metrics
+        if not batch:
+            return
+        self.dirty -= set(batch)
+        try:
+            await asyncio.to_thread(sheets.update_analytics_many, batch, org=self.tenant.org)
+        except BaseException:
+            self.dirty |= set(batch)
+            raise
+        for root, metrics in batch.items():
+            timing.record_metrics(self.tenant.org, "mastodon", root, metrics)
+            hashtags.record_metrics(self.tenant.org, root, metrics)
+        self.flushes += 1
+
+    def _opened(self):
+        self.state = "streaming"
+
+    async def run_stream(self):
+        client = get_platform("mastodon", self.tenant)
+        attempt = 0
+        while True:
+            self.state = "connecting"
+            started = time.monotonic()
+            error = None
+            try:
+                async for note in client.stream_notifications(on_open=self._opened):
+                    self.apply(note)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                error = exc
+                self.last_error = str(exc)
+                telemetry.record(telemetry.CALL, "mastodon.stream", time.monotonic() - started,
+                                 error=telemetry.classify(exc))
+            # Anything could have happened while we weren't listening
+            self.stale.update(self.chains)
+            attempt = 1 if time.monotonic() - started > _HEALTHY_SECONDS else attempt + 1
+            self.reconnects += 1
+            self.state = "backoff"
+            await asyncio.sleep(jobs.backoff_delay(attempt, jobs.retry_after(error) if error else None))
+
+    async def run_maintenance(self):
+        next_reconcile = 0.0
+        while True:
+            try:
+                if time.monotonic() >= next_reconcile:
+                    next_reconcile = time.monotonic() + config.STREAM_RECONCILE_SECONDS
+                    await self.reconcile()
+                elif self.stale:
+                    await self.poll(sorted(self.stale))
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self.last_error = str(exc)
+            await asyncio.sleep(config.STREAM_FLUSH_SECONDS)
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "tracked_posts": len(self.chains),
+            "events": self.events,
+            "pending": len(self.dirty),
+            "flushes": self.flushes,
+            "reconnects": self.reconnects,
+            "last_event_at": self.last_event_at,
+            "last_error": self.last_error,
+        }
+
+
+_consumers: dict[str, _Consumer] = {}
+
+
+def start():
+    """Start a consumer for every org with Mastodon configured (idempotent)."""
+    if not config.MASTODON_STREAMING:
+        return
+    loop = asyncio.get_running_loop()
+    for tenant in config.get_tenants().values():
+        if tenant.org in _consumers or not config.is_platform_configured("mastodon", tenant):
+            continue
+        consumer = _Consumer(tenant)
+        consumer.tasks = [loop.create_task(consumer.run_maintenance()),
+                          loop.create_task(consumer.run_stream())]
+        _consumers[tenant.org] = consumer
+
+
+async def stop():
+    """Stop the consumers, writing any counts not yet flushed."""
+    for consumer in _consumers.values():
+        for task in consumer.tasks:
+            task.cancel()
+        await asyncio.gather(*consumer.tasks, return_exceptions=True)
+        try:
+            await consumer.flush()
+        except Exception as exc:
+            consumer.last_error = str(exc)
+    _consumers.clear()
+
+
+def status() -> dict[str, dict]:
+    """State of each org's consumer."""
+    return {org: consumer.status() for org, consumer in _consumers.items()}
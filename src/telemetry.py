@@ -0,0 +1,272 @@
+"""Latency and error instrumentation for MCP tools and external calls.
+
+Every tool call and every call out to Sheets, the LLM or a platform API is
+recorded in a fixed-bucket latency histogram, with failures counted by
+error type. Snapshots back the sm_server_stats tool; the same data can be
+scraped as Prometheus text. When opentelemetry is installed and
+SM_OTEL_ENABLED is set, each recording also becomes a span, so a tool
+call's span parents the external calls it makes.
+"""
+
+import bisect
+import contextvars
+import functools
+import inspect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import config
+
+
+# Upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+TOOL = "tool"
+CALL = "call"
+JOB = "job"
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram."""
+
+    __slots__ = ("counts", "total", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating within its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if BUCKETS[i] != math.inf else lower * 2 or 1.0
+                return min(self.max, lower + (upper - lower) * (rank - seen) / n)
+            seen += n
+        return self.max
+
+
+_lock = threading.Lock()
+_histograms: dict[tuple[str, str], Histogram] = {}
+_errors: dict[tuple[str, str, str], int] = {}
+_started = time.time()
+
+# Error type of the last exception handled inside the current tool call
+_tool_error: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("tool_error", default=None)
+
+
+def classify(exc: BaseException) -> str:
+    """Error type label: HTTP status class where known, else the exception name."""
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status == 429:
+        return "rate_limited"
+    if status is not None:
+        return f"http_{status // 100}xx"
+    return type(exc).__name__
+
+
+def record(kind: str, name: str, seconds: float, error: Optional[str] = None):
+    """Record one observation, and its error type if it failed."""
+    with _lock:
+        hist = _histograms.get((kind, name))
+        if hist is None:
+            hist = _histograms[(kind, name)] = Histogram()
+        hist.observe(seconds)
+        if error:
+            _errors[(kind, name, error)] = _errors.get((kind, name, error), 0) + 1
+
+
+def note_tool_error(exc: BaseException):
+    """Called from a tool's error handler so the tool's failure gets a type."""
+    _tool_error.set(classify(exc))
+
+
+# --- OpenTelemetry (optional) ---
+
+_tracer = None
+
+
+def _get_tracer():
+    global _tracer
+    if _tracer is None and config.OTEL_ENABLED:
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            _tracer = False
+        else:
+            _tracer = trace.get_tracer("social-media-mcp")
+    return _tracer or None
+
+
+def trace_context() -> Optional[dict]:
+    """IDs of the current span, to link work that runs later (e.g. a job)."""
+    tracer = _get_tracer()
+    if tracer is None:
+        return None
+    from opentelemetry import trace
+    ctx = trace.get_current_span().get_span_context()
+    if not ctx.is_valid:
+        return None
+    return {"trace_id": ctx.trace_id, "span_id": ctx.span_id}
+
+
+@contextmanager
+def _span(name: str, link: Optional[dict] = None):
+    tracer = _get_tracer()
+    if tracer is None:
+        yield
+        return
+    from opentelemetry import trace
+    links = []
+    if link:
+        links.append(trace.Link(trace.SpanContext(
+            trace_id=link["trace_id"], span_id=link["span_id"], is_remote=True,
+            trace_flags=trace.TraceFlags(trace.TraceFlags.SAMPLED),
+        )))
+    with tracer.start_as_current_span(name, links=links):
+        yield
+
+
+@contextmanager
+def timed(name: str, kind: str = CALL, link: Optional[dict] = None):
+    """Time a block; exceptions are counted by type and re-raised."""
+    start = time.perf_counter()
+    with _span(name, link):
+        try:
+            yield
+        except BaseException as exc:
+            record(kind, name, time.perf_counter() - start, classify(exc))
+            raise
+    record(kind, name, time.perf_counter() - start)
+
+
+def instrument(name: str):
+    """Decorator timing every call of a sync or async function."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with timed(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_tool(fn):
+    """Decorator for MCP tools, which report failure as {"success": false} JSON."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        token = _tool_error.set(None)
+        start = time.perf_counter()
+        try:
+            with _span(f"tool {fn.__name__}"):
+                result = await fn(*args, **kwargs)
+        except BaseException as exc:
+            record(TOOL, fn.__name__, time.perf_counter() - start, classify(exc))
+            raise
+        else:
+            error = _tool_error.get()
+            if error is None and result.startswith('{"success": false'):
+                error = "rejected"
+            record(TOOL, fn.__name__, time.perf_counter() - start, error)
+            return result
+        finally:
+            _tool_error.reset(token)
+    return wrapper
+
+
+# --- Export ---
+
+def snapshot() -> dict:
+    """Latency percentiles and error counts for every tool and external call."""
+    with _lock:
+        out = {"uptime_seconds": round(time.time() - _started, 1), TOOL: {}, CALL: {}, JOB: {}}
+        for (kind, name), hist in sorted(_histograms.items()):
+            errors = {e: n for (k, nm, e), n in _errors.items() if k == kind and nm == name}
+            out[kind][name] = {
+                "count": hist.count,
+                "errors": sum(errors.values()),
+                "error_types": errors,
+                "mean_ms": round(1000 * hist.total / hist.count, 2),
+                "p50_ms": round(1000 * hist.quantile(0.5), 2),
+                "p90_ms": round(1000 * hist.quantile(0.9), 2),
+                "p99_ms": round(1000 * hist.quantile(0.99), 2),
+                "max_ms": round(1000 * hist.max, 2),
+            }
+    return out
+
+
+def prometheus_text() -> str:
+    """Histograms and error counters in Prometheus text exposition format."""
+    lines = [
+        "# HELP sm_duration_seconds Latency of MCP tools and external calls",
+        "# TYPE sm_duration_seconds histogram",
+    ]
+    with _lock:
+        for (kind, name), hist in sorted(_histograms.items()):
+            labels = f'kind="{kind}",name="{name}"'
+            cumulative = 0
+            for bound, n in zip(BUCKETS, hist.counts):
+                cumulative += n
+                le = "+Inf" if bound == math.inf else repr(bound)
+                lines.append(f'sm_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"sm_duration_seconds_sum{{{labels}}} {hist.total}")
+            lines.append(f"sm_duration_seconds_count{{{labels}}} {hist.count}")
+        lines.append("# HELP sm_errors_total Failed MCP tools and external calls by error type")
+        lines.append("# TYPE sm_errors_total counter")
+        for (kind, name, error), n in sorted(_errors.items()):
+            lines.append(f'sm_errors_total{{kind="{kind}",name="{name}",type="{error}"}} {n}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # stdout carries the MCP stdio protocol
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_prometheus_endpoint(port: int = 0) -> Optional[int]:
+    """Serve /metrics on a background thread if a port is configured."""
+    global _server
+    port = port or config.PROMETHEUS_PORT
+    if not port or _server is not None:
+        return None
+    _server = ThreadingHTTPServer((config.PROMETHEUS_HOST, port), _MetricsHandler)
+    threading.Thread(target=_server.serve_forever, name="prometheus", daemon=True).start()
+    return _server.server_address[1]
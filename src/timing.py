@@ -0,0 +1,258 @@
+"""Best times to post, learned from engagement history.
+
+For each org and platform, engagement is kept per hour of the week (slot 0
+is Monday 00:00, slot 167 Sunday 23:00) as a post count and a sum of
+engagement scores. The matrices are built once from the analytics and
+queue history, live and archived, and then updated in place as posts are
+published and their metrics refreshed, so suggestions never rescan the
+sheets. They are rebuilt after TIMING_REBUILD_HOURS to pick up metrics
+collected outside this server. Times are the server's local time, as
+posted_at is. Tools call in from worker threads, so the matrices are only
+read or changed under _lock; building them from the sheets happens
+outside it.
+
+NumPy is imported on first use.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Optional
+
+import config
+import sheets
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+SLOTS = 7 * 24
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+# A post's engagement score; boosts and replies reach further than likes
+WEIGHTS = {"likes": 1.0, "reposts": 2.0, "replies": 2.0}
+
+# Each slot is blended with this many imaginary posts at the platform
+# average, so one lucky post doesn't put a slot at the top
+PRIOR_POSTS = 3.0
+
+
+def _score(metrics: dict) -> float:
+    total = 0.0
+    for name, weight in WEIGHTS.items():
+        try:
+            total += weight * float(metrics.get(name) or 0)
+        except (TypeError, ValueError):
+            pass
+    return total
+
+
+def _slot(timestamp: str) -> int:
+    """Hour-of-week slot of an ISO timestamp in local time, or -1."""
+    try:
+        when = datetime.fromisoformat(timestamp.strip())
+    except ValueError:
+        return -1
+    if when.tzinfo is not None:
+        when = when.astimezone().replace(tzinfo=None)
+    return when.weekday() * 24 + when.hour
+
+
+def _has_offset(timestamp: str) -> bool:
+    tail = timestamp[19:]
+    return tail.endswith("Z") or "+" in tail or "-" in tail
+
+
+def _slots(timestamps: list[str]) -> "np.ndarray":
+    """Hour-of-week slot of each ISO timestamp, -1 where unparseable."""
+    import numpy as np
+
+    slots = np.full(len(timestamps), -1, dtype=np.int64)
+    naive = np.array([not _has_offset(t) for t in timestamps], dtype=bool)
+    if naive.any():
+        try:
+            stamps = np.array([t for t, n in zip(timestamps, naive) if n], dtype="datetime64[m]")
+        except ValueError:
+            stamps = None
+        if stamps is not None:
+            minutes = stamps.astype(np.int64)
+            # 1970-01-01 was a Thursday
+            parsed = ((minutes // 1440 + 3) % 7) * 24 + (minutes // 60) % 24
+            slots[naive] = np.where(np.isnat(stamps), -1, parsed)
+        else:
+            naive[:] = False
+    for i in np.flatnonzero(~naive):
+        slots[i] = _slot(timestamps[i])
+    return slots
+
+
+class _Matrix:
+    """Post counts and engagement sums per hour-of-week slot for one platform."""
+
+    def __init__(self):
+        import numpy as np
+        self.count = np.zeros(SLOTS)
+        self.total = np.zeros(SLOTS)
+        # post_id -> (slot, score) currently counted, so updates replace it
+        self.posts: dict[str, tuple[int, float]] = {}
+        # Slots of posts published but not yet measured
+        self.pending: dict[str, int] = {}
+
+    def load(self, post_ids: list[str], slots: "np.ndarray", scores: "np.ndarray"):
+        import numpy as np
+        keep = slots >= 0
+        self.count += np.bincount(slots[keep], minlength=SLOTS)
+        self.total += np.bincount(slots[keep], weights=scores[keep], minlength=SLOTS)
+        self.posts.update(
+            (pid, (int(slot), float(score)))
+            for pid, slot, score, ok in zip(post_ids, slots, scores, keep) if ok
+        )
+
+    def posted(self, post_id: str, slot: int):
+        if slot >= 0 and post_id not in self.posts:
+            self.pending[post_id] = slot
+
+    def measured(self, post_id: str, score: float):
+        if post_id in self.posts:
+            slot, old = self.posts[post_id]
+            self.total[slot] += score - old
+        elif post_id in self.pending:
+            slot = self.pending.pop(post_id)
+            self.count[slot] += 1
+            self.total[slot] += score
+        else:
+            return
+        self.posts[post_id] = (slot, score)
+
+    def smoothed(self) -> tuple["np.ndarray", "np.ndarray"]:
+        """Counts and totals with each hour sharing a little with its neighbours."""
+        import numpy as np
+
+        def smooth(values):
+            return 0.5 * values + 0.25 * (np.roll(values, 1) + np.roll(values, -1))
+        return smooth(self.count), smooth(self.total)
+
+
+class _History:
+    def __init__(self, matrices: dict[str, _Matrix]):
+        self.matrices = matrices
+        self.built_at = time.monotonic()
+
+
+_histories: dict[str, _History] = {}
+_lock = threading.Lock()
+
+
+def _build(org: str) -> _History:
+    import numpy as np
+
+    by_platform: dict[str, list[dict]] = {}
+    for record in sheets.get_post_history(org=org):
+        by_platform.setdefault(record.get("platform", ""), []).append(record)
+    matrices = {}
+    for plat, records in by_platform.items():
+        if not plat:
+            continue
+        matrix = _Matrix()
+        matrix.load(
+            [r["post_id"] for r in records],
+            _slots([r["posted_at"] for r in records]),
+            np.array([_score(r) for r in records]),
+        )
+        matrices[plat] = matrix
+    return _History(matrices)
+
+
+def _history(org: str) -> _History:
+    tenant = config.get_tenant(org)
+    history = _histories.get(tenant.org)
+    if history is None or time.monotonic() - history.built_at > config.TIMING_REBUILD_HOURS * 3600:
+        history = _histories[tenant.org] = _build(tenant.org)
+    return history
+
+
+def record_posted(org: str, plat: str, post_id: str, posted_at: str):
+    """Note a newly published post, counted once its metrics arrive."""
+    history = _histories.get(config.get_tenant(org).org)
+    if history is not None:
+        with _lock:
+            history.matrices.setdefault(plat, _Matrix()).posted(post_id, _slot(posted_at))
+
+
+def record_metrics(org: str, plat: str, post_id: str, metrics: dict):
+    """Update a post's contribution after its metrics were refreshed."""
+    history = _histories.get(config.get_tenant(org).org)
+    if history is not None and plat in history.matrices:
+        with _lock:
+            history.matrices[plat].measured(post_id, _score(metrics))
+
+
+def expected_engagement(org: str, platform: str = "") -> tuple["np.ndarray", "np.ndarray", int]:
+    """Expected engagement and confidence (0-1) per slot, and the posts behind them.
+
+    For one platform, expected engagement is its score scale. Across all
+    platforms each is first divided by its own average, so 1.0 means an
+    average post.
+    """
+    import numpy as np
+
+    matrices = _history(org).matrices
+    with _lock:
+        if platform:
+            chosen = {platform: matrices[platform]} if platform in matrices else {}
+        else:
+            chosen = matrices
+        count, total = np.zeros(SLOTS), np.zeros(SLOTS)
+        for matrix in chosen.values():
+            posts = matrix.count.sum()
+            if not posts:
+                continue
+            c, t = matrix.smoothed()
+            scale = 1.0 if platform else (matrix.total.sum() / posts or 1.0)
+            count += c
+            total += t / scale
+    posts = int(round(count.sum()))
+    if not posts:
+        return np.zeros(SLOTS), np.zeros(SLOTS), 0
+    mean = total.sum() / count.sum()
+    expected = (total + PRIOR_POSTS * mean) / (count + PRIOR_POSTS)
+    confidence = count / (count + PRIOR_POSTS)
+    return expected, confidence, posts
+
+
+def slot_label(slot: int) -> str:
+    return f"{WEEKDAYS[slot // 24]} {slot % 24:02d}:00"
+
+
+def next_time(slot: int, now: Optional[datetime] = None) -> datetime:
+    """The next start of a slot's hour strictly after now."""
+    now = now or datetime.now()
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    ahead = (slot - (hour.weekday() * 24 + hour.hour)) % SLOTS or SLOTS
+    return hour + timedelta(hours=ahead)
+
+
+def pick_times(expected: "np.ndarray", count: int, taken: list[datetime], min_gap_hours: float,
+               days_ahead: int, now: Optional[datetime] = None) -> list[datetime]:
+    """Best upcoming hours for count posts, at least min_gap_hours from each other and from taken.
+
+    Returns the chosen times in chronological order; fewer than count if
+    the window is too full.
+    """
+    import numpy as np
+
+    now = now or datetime.now()
+    first = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    hours = days_ahead * 24
+    slots = (np.arange(hours) + first.weekday() * 24 + first.hour) % SLOTS
+    # Best expected engagement first; earlier hours win ties
+    order = np.lexsort((np.arange(hours), -expected[slots]))
+    gap = timedelta(hours=min_gap_hours)
+    chosen = []
+    for offset in order:
+        when = first + timedelta(hours=int(offset))
+        if all(abs(when - other) >= gap for other in taken + chosen):
+            chosen.append(when)
+            if len(chosen) == count:
+                break
+    return sorted(chosen)
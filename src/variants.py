@@ -0,0 +1,63 @@
+"""Local ranking of alternative drafts generated for the same post.
+
+Candidates are scored without another LLM call. A candidate starts from
+the expected lift of its hashtags and terms, learned from the engagement
+of our published posts (1.0 = an average post), and loses points for
+running over the platform's length limit, for each brand voice "avoid"
+phrase it contains, and for resembling an existing queue item.
+"""
+
+import re
+
+import config
+import hashtags
+import similarity
+from platforms import get_platform
+
+
+# Most candidates sm_create_content asks for per platform
+MAX_VARIANTS = 8
+
+# Subtracted from a candidate's lift
+OVER_LIMIT_PENALTY = 1.0
+AVOID_PENALTY = 0.5
+# Times the estimated similarity to the closest existing queue item
+SIMILARITY_PENALTY = 1.0
+
+
+def _avoided(text: str, phrases: list[str]) -> list[str]:
+    lowered = text.lower()
+    return [p for p in phrases if p.strip() and re.search(rf"\b{re.escape(p.strip().lower())}\b", lowered)]
+
+
+def rank(org: str, plat: str, texts: list[str]) -> list[dict]:
+    """Score candidate drafts for one platform, best first.
+
+    Each entry: {"text", "score", "length", "fits", "avoid", "similarity",
+    "similar_to", "lift"}; similar_to is the content_id of the closest
+    existing queue item, if any is roughly alike.
+    """
+    tenant = config.get_tenant(org)
+    brand = config.load_brand_voice(tenant.brand_voice_path)
+    client = get_platform(plat, tenant)
+    lifts = hashtags.expected_lift(tenant.org, plat, texts)
+    closest = similarity.closest(tenant.org, texts)
+    ranked = []
+    for text, lift, (alike, similar_to) in zip(texts, lifts, closest):
+        length = client.weighted_length(text)
+        fits = length <= client.max_length
+        avoid = _avoided(text, brand.avoid)
+        score = (lift - (0.0 if fits else OVER_LIMIT_PENALTY) - AVOID_PENALTY * len(avoid)
+                 - SIMILARITY_PENALTY * alike)
+        ranked.append({
+            "text": text,
+            "score": round(score, 3),
+            "length": length,
+            "fits": fits,
+            "avoid": avoid,
+            "similarity": round(alike, 2),
+            "similar_to": similar_to,
+            "lift": round(lift, 3),
+        })
+    ranked.sort(key=lambda v: -v["score"])
+    return ranked